@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import threading
+import time
+from config import AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_SIZE
+
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL.
+
+    Entries are per-process; TTLs bound how stale another worker's view can be
+    after an invalidation.
+    """
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING (None is a valid cached value)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+token_cache = TTLCache()  # JWT -> subject email, never past the token's own expiry
+user_cache = TTLCache()  # email -> column snapshot of the User row; no route edits users, so only the TTL expires it
+role_cache = TTLCache()  # (repo_id, user_id) -> RoleEnum or None
+
+
+def invalidate_role(repo_id: int, user_id: int):
+    """Forget a cached collaborator role after it was added, changed or removed."""
+    role_cache.pop((repo_id, user_id))
@@ -0,0 +1,75 @@
+"""Password hashing on a dedicated, size-limited thread pool.
+
+bcrypt releases the GIL, so a few threads give real parallelism without
+blocking the event loop. Requests beyond the queue limit are rejected with
+503 instead of piling up behind a burst of logins.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+import asyncio
+import threading
+import time
+from fastapi import HTTPException, status
+from prometheus_client import Counter, Gauge, Histogram
+from auth.utils import get_password_hash, verify_and_update_password
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE
+
+HASH_SECONDS = Histogram(
+    "password_hash_seconds", "Time spent in bcrypt", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "password_hash_queue_wait_seconds", "Time a hashing job waited for a worker",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+QUEUE_DEPTH = Gauge("password_hash_pending", "Hashing jobs queued or running")
+REJECTED = Counter("password_hash_rejected_total", "Hashing jobs rejected because the queue was full")
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _release():
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+        QUEUE_DEPTH.set(_pending)
+
+async def _submit(operation: str, func: Callable[..., Any], *args: Any) -> Any:
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE:
+            REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent logins, please retry",
+                headers={"Retry-After": "1"},
+            )
+        _pending += 1
+        QUEUE_DEPTH.set(_pending)
+    submitted = time.perf_counter()
+
+    def run():
+        # Released from the worker so abandoned requests still count until their job ends
+        started = time.perf_counter()
+        QUEUE_WAIT_SECONDS.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+            _release()
+
+    try:
+        future = _executor.submit(run)
+    except BaseException:
+        _release()
+        raise
+    return await asyncio.wrap_future(future)
+
+async def hash_password(password: str) -> str:
+    return await _submit("hash", get_password_hash, password)
+
+async def check_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; the second item is a replacement hash when the cost changed."""
+    return await _submit("verify", verify_and_update_password, password, hashed_password)
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, BigInteger
 from sqlalchemy.orm import relationship
 
 
@@ -10,6 +10,7 @@ class User(Base):
     hashed_password = Column(String)
     full_name = Column(String)
     is_active = Column(Boolean, default=True)
+    used_bytes = Column(BigInteger, nullable=True, default=0)  # Across owned repositories; NULL until backfilled
     repositories = relationship("Repository", back_populates="owner")
     collaborations = relationship("Collaborator", back_populates="user")
 
@@ -1,46 +1,60 @@
 # backend/routes.py
 
 from fastapi import APIRouter, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
 from auth.models import User
 from auth.schemas import RegisterSchema, LoginSchema
-from auth.utils import get_password_hash, verify_password, create_access_token, get_db
+from auth.hashing import hash_password, check_password
+from auth.utils import create_access_token, get_async_db
+from config import LOGIN_RATE_LIMIT, LOGIN_FAILURE_RATE_LIMIT
+from ratelimit import client_ip, limiter, parse_limit
 
 router = APIRouter()
 
-limiter = Limiter(key_func=get_remote_address)
 logger = logging.getLogger("tics")
 
+_login_limit = parse_limit(LOGIN_RATE_LIMIT)
+_login_failure_limit = parse_limit(LOGIN_FAILURE_RATE_LIMIT)
+
 
 @router.post("/auth/register")
-async def register(user: RegisterSchema, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user.email).first()
+async def register(user: RegisterSchema, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await db.scalar(select(User.id).where(User.email == user.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     new_user = User(
         email=user.email,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=await hash_password(user.password),
         full_name=user.full_name
     )
     db.add(new_user)
-    db.commit()
-    logger.info(f"Registered new user: {user.email}")
+    await db.commit()
+    logger.info("Registered new user: %s", user.email)
     return {"msg": "User created successfully"}
 
 
 @router.post("/auth/login")
-@limiter.limit("5/minute")
-async def login(request: Request, credentials: LoginSchema, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == credentials.email).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
-        logger.warning(f"Failed login attempt: {credentials.email}")
+async def login(request: Request, credentials: LoginSchema, db: AsyncSession = Depends(get_async_db)):
+    ip = client_ip(request.scope)
+    await limiter.hit_async("login", ip, _login_limit)
+    # Taken up front so parallel guesses cannot all pass; only failures keep it. Keyed by the
+    # address too, so someone else's failures never lock the owner out of their account.
+    account = f"{credentials.email.lower()}:{ip}"
+    await limiter.hit_async("login_failures", account, _login_failure_limit)
+    user = await db.scalar(select(User).where(User.email == credentials.email))
+    valid, new_hash = await check_password(credentials.password, user.hashed_password) if user else (False, None)
+    if not valid:
+        logger.warning("Failed login attempt: %s", credentials.email)
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    await limiter.refund_async("login_failures", account, _login_failure_limit)
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
 
     access_token = create_access_token(data={"sub": user.email})
-    logger.info(f"User logged in: {credentials.email}")
+    logger.info("User logged in: %s", credentials.email)
     return {"access_token": access_token, "token_type": "bearer"}
@@ -3,35 +3,29 @@ from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import datetime
-from sqlalchemy.orm import Session
+import time
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session, make_transient_to_detached
+from auth.cache import MISSING, token_cache, user_cache
 from auth.models import User
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, SQLALCHEMY_DATABASE_URL
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS
+# Engines and sessions live in database.py; re-exported for existing imports
+from database import engine, SessionLocal, get_db, async_engine, AsyncSessionLocal, get_async_db  # noqa: F401
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context; hashes with a different cost are upgraded on the next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # OAuth2 scheme - token URL should match your token generation route
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-# DB engine and session factory - SQLite note on check_same_thread is fine
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Password hashes are never cached, nor is used_bytes, which changes with every upload: read it with a query
+_USER_FIELDS = ("id", "email", "full_name", "is_active")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid authentication credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def _token_subject(token: str, credentials_exception: HTTPException) -> str:
+    """Decode a JWT to its subject, caching the result until the token expires."""
+    email = token_cache.get(token)
+    if email is not MISSING:
+        return email
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -39,11 +33,40 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    exp = payload.get("exp")
+    ttl = exp - time.time() if exp else None
+    if ttl is None or ttl > 0:
+        token_cache.set(token, email, ttl)
+    return email
+
+def token_email(token: str) -> Optional[str]:
+    """Subject of a valid, unexpired token, or None."""
+    try:
+        return _token_subject(token, HTTPException(status_code=status.HTTP_401_UNAUTHORIZED))
+    except HTTPException:
+        return None
+
+def _load_user(db: Session, email: str):
+    """Return the user for an email, attaching a cached snapshot to `db` without a SELECT."""
+    snapshot = user_cache.get(email)
+    if snapshot is MISSING:
+        user = db.query(User).filter(User.email == email).first()
+        if user is not None:
+            user_cache.set(email, {field: getattr(user, field) for field in _USER_FIELDS})
+        return user
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
 
-    user = db.query(User).filter(User.email == email).first()
-    print(f"Authenticated user: {user}")
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    email = _token_subject(token, credentials_exception)
+    user = _load_user(db, email)
     if not user:
-        print(f"Authenticated user: {user}")
         raise credentials_exception
     if not user.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is inactive")
@@ -55,6 +78,10 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash if the stored one uses outdated settings."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -0,0 +1,13 @@
+"""Offline benchmarks for the upload, download, listing, search and login hot paths.
+
+Run from `backend/`:
+
+    python -m benchmarks run --output results.json
+    python -m benchmarks run --quick --only upload,login
+    python -m benchmarks compare baseline.json results.json
+
+Every run uses a fresh temp SQLite database and storage directory and talks
+to the app in `main.py` in-process over ASGI, so no server or network is
+involved. `compare` exits with status 1 when a metric regressed by more than
+`--threshold`.
+"""
@@ -0,0 +1,114 @@
+"""Command line entry point; see the package docstring."""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from . import __doc__ as usage
+from .compare import compare_reports, format_comparison
+from .harness import app_client, prepare_environment
+from .scenarios import SCENARIOS
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _metadata(quick: bool) -> dict:
+    import config
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+        "settings": {
+            name: getattr(config, name)
+            for name in ("BCRYPT_ROUNDS", "PASSWORD_HASH_WORKERS", "CPU_WORKERS", "IO_WORKERS", "STORAGE_MODE")
+        },
+    }
+
+async def _run_scenarios(names, quick: bool) -> dict:
+    results = {}
+    async with app_client() as client:
+        for name in names:
+            results.update(await SCENARIOS[name](client, quick))
+    return results
+
+def _load(path: str) -> dict:
+    with open(path) as fp:
+        return json.load(fp)
+
+def _report_comparison(baseline: dict, current: dict, threshold: float) -> int:
+    rows, regressions = compare_reports(baseline, current, threshold)
+    print(format_comparison(rows, regressions), file=sys.stderr)
+    return 1 if regressions else 0
+
+def run(args) -> int:
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="ticslab-bench-"))
+    prepare_environment(workdir)
+    try:
+        results = asyncio.run(_run_scenarios(names, args.quick))
+        report = {"meta": _metadata(args.quick), "benchmarks": results}
+    finally:
+        if args.keep:
+            print(f"Kept database and storage in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        return _report_comparison(_load(args.baseline), report, args.threshold)
+    return 0
+
+def compare(args) -> int:
+    return _report_comparison(_load(args.baseline), _load(args.current), args.threshold)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=usage,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and write a JSON report")
+    run_parser.add_argument("--only", help=f"Comma-separated scenarios ({', '.join(SCENARIOS)})")
+    run_parser.add_argument("--quick", action="store_true", help="Smaller datasets and fewer iterations")
+    run_parser.add_argument("--output", "-o", help="Write the report here instead of stdout")
+    run_parser.add_argument("--baseline", help="Compare against this earlier report")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the temp database and storage")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.set_defaults(func=compare)
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--threshold", type=float, default=0.10,
+                         help="Relative change counted as a regression (default 0.10)")
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
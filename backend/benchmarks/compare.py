@@ -0,0 +1,54 @@
+"""Compare two benchmark reports and flag regressions."""
+from typing import List, Optional, Tuple
+
+# (metric path, higher is better). p99 and max are reported but too noisy to gate on.
+GATED_METRICS = [
+    ("ops_per_sec", True),
+    ("mb_per_sec", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+]
+
+
+def _metric(result: dict, path: str) -> Optional[float]:
+    value = result
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def compare_reports(baseline: dict, current: dict, threshold: float) -> Tuple[List[dict], List[dict]]:
+    """Relative change of every gated metric present in both reports.
+
+    Returns `(rows, regressions)`; a regression is a change in the bad
+    direction larger than `threshold` (0.1 = 10%).
+    """
+    rows, regressions = [], []
+    for name, result in current.get("benchmarks", {}).items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None:
+            continue
+        for path, higher_is_better in GATED_METRICS:
+            old, new = _metric(before, path), _metric(result, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            row = dict(benchmark=name, metric=path, baseline=old, current=new, change=round(change, 4))
+            rows.append(row)
+            if worse > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+def format_comparison(rows: List[dict], regressions: List[dict]) -> str:
+    flagged = {(row["benchmark"], row["metric"]) for row in regressions}
+    lines = [f"{'benchmark':32} {'metric':16} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for row in rows:
+        marker = "  REGRESSION" if (row["benchmark"], row["metric"]) in flagged else ""
+        lines.append(
+            f"{row['benchmark']:32} {row['metric']:16} {row['baseline']:>12} {row['current']:>12} "
+            f"{row['change']:>+8.1%}{marker}"
+        )
+    lines.append(f"{len(regressions)} regression(s) in {len(rows)} compared metrics")
+    return "\n".join(lines)
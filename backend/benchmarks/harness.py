@@ -0,0 +1,109 @@
+"""Environment, client and timing helpers shared by the benchmark scenarios."""
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List
+import asyncio
+import math
+import os
+import time
+import httpx
+
+
+def prepare_environment(workdir: Path):
+    """Point the app at a throwaway database and storage dir. Must run before `main` is imported."""
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{workdir / 'bench.db'}",
+        STORAGE_ROOT=str(workdir / "storage"),
+        STORAGE_BACKEND="local",
+        SCRUB_ENABLED="false",
+        DB_AUTO_MIGRATE="true",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+@asynccontextmanager
+async def app_client() -> AsyncIterator[httpx.AsyncClient]:
+    """Run the app's lifespan and yield a client that calls it in-process."""
+    import main
+    import ratelimit
+
+    # Measure the login path itself, not the per-IP request limit in front of it
+    ratelimit.limiter.enabled = False
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            yield client
+
+def check(response: httpx.Response, status: int = 200) -> httpx.Response:
+    """Fail loudly instead of timing error responses."""
+    if response.status_code != status:
+        raise RuntimeError(
+            f"{response.request.method} {response.request.url.path} returned "
+            f"{response.status_code}: {response.text[:200]}"
+        )
+    return response
+
+async def auth_headers(client: httpx.AsyncClient, email: str, password: str = "benchmark-password") -> Dict[str, str]:
+    """Register a user (if needed) and return its bearer token header."""
+    await client.post("/auth/register", json={"email": email, "password": password, "full_name": "Benchmark"})
+    response = check(await client.post("/auth/login", json={"email": email, "password": password}))
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def create_repo(client: httpx.AsyncClient, headers: Dict[str, str], name: str) -> int:
+    response = check(await client.post("/api/repos/create-repo", json={"name": name}, headers=headers), 201)
+    return response.json()["id"]
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize(latencies: List[float], elapsed: float, bytes_moved: int = 0, **params) -> dict:
+    ordered = sorted(latencies)
+    result = {
+        "iterations": len(ordered),
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(len(ordered) / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+            "p50": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(_percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(_percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3),
+        },
+    }
+    if bytes_moved:
+        result["mb_per_sec"] = round(bytes_moved / elapsed / 1024 ** 2, 3)
+    if params:
+        result["params"] = params
+    return result
+
+async def measure(
+    op: Callable[[int], Awaitable[int]],
+    iterations: int,
+    concurrency: int = 1,
+    warmup: int = 1,
+    **params,
+) -> dict:
+    """Time `op(i)` for `iterations` calls with up to `concurrency` in flight.
+
+    `op` returns the number of payload bytes it moved (0 if not meaningful).
+    The first `warmup` calls are run beforehand and not recorded.
+    """
+    for i in range(warmup):
+        await op(-1 - i)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    moved = 0
+
+    async def timed(i: int):
+        nonlocal moved
+        async with semaphore:
+            started = time.perf_counter()
+            size = await op(i)
+            latencies.append(time.perf_counter() - started)
+            moved += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, moved, concurrency=concurrency, **params)
@@ -0,0 +1,294 @@
+"""Benchmark scenarios. Each returns `{benchmark_name: summary}`.
+
+Listing scenarios seed their rows straight into the database (metadata only,
+no blob content) so that 100k versions take seconds rather than hours of
+uploads; everything else goes through the HTTP API.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+import hashlib
+import random
+import sys
+import httpx
+from sqlalchemy import func, insert, select
+from .harness import auth_headers, check, create_repo, measure
+
+KiB = 1024
+MiB = 1024 ** 2
+
+
+def _log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+def _payload(size: int) -> bytes:
+    # Deterministic content, so runs are comparable
+    return random.Random(size).randbytes(size)
+
+def _unique(base: bytes, i: int) -> bytes:
+    # Distinct content per iteration, so uploads never hit deduplication
+    return i.to_bytes(8, "big", signed=True) + base[8:]
+
+def _size_label(size: int) -> str:
+    return f"{size // MiB}MiB" if size >= MiB else f"{size // KiB}KiB"
+
+def _next_id(conn, model) -> int:
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def upload(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """Sequential single-file uploads through `POST /files/upload`, by file size."""
+    headers = await auth_headers(client, "upload@bench.example.com")
+    repo_id = await create_repo(client, headers, "bench-upload")
+    plan = {4 * KiB: 50, MiB: 10, 16 * MiB: 3} if quick else {4 * KiB: 200, MiB: 50, 16 * MiB: 10, 64 * MiB: 4}
+    results = {}
+    for size, iterations in plan.items():
+        label = _size_label(size)
+        base = _payload(size)
+
+        async def op(i: int) -> int:
+            name = f"{label}_{'w' if i < 0 else ''}{abs(i)}.bin"
+            files = {"upload": (name, _unique(base, i), "application/octet-stream")}
+            check(await client.post(f"/api/repos/{repo_id}/files/upload", files=files, headers=headers), 201)
+            return size
+
+        _log(f"upload {label} x{iterations}")
+        results[f"upload_{label}"] = await measure(op, iterations, size=size)
+    return results
+
+async def precheck(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """`POST /files/precheck` of already stored 16 MiB content, linked without sending the body."""
+    headers = await auth_headers(client, "precheck@bench.example.com")
+    repo_id = await create_repo(client, headers, "bench-precheck")
+    size = 16 * MiB
+    data = _payload(size)
+    files = {"upload": ("artifact.bin", data, "application/octet-stream")}
+    check(await client.post(f"/api/repos/{repo_id}/files/upload", files=files, headers=headers), 201)
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    async def op(i: int) -> int:
+        body = {"filename": f"artifact_{'w' if i < 0 else ''}{abs(i)}.bin", "sha256": sha256, "size": size}
+        check(await client.post(f"/api/repos/{repo_id}/files/precheck", json=body, headers=headers), 201)
+        return size
+
+    iterations = 20 if quick else 100
+    _log(f"precheck 16MiB x{iterations}")
+    return {"precheck_link_16MiB": await measure(op, iterations, size=size)}
+
+async def download(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """Full downloads of one 8 MiB version, alone and with many clients at once."""
+    headers = await auth_headers(client, "download@bench.example.com")
+    repo_id = await create_repo(client, headers, "bench-download")
+    size = 8 * MiB
+    files = {"upload": ("blob.bin", _payload(size), "application/octet-stream")}
+    check(await client.post(f"/api/repos/{repo_id}/files/upload", files=files, headers=headers), 201)
+    url = f"/api/repos/{repo_id}/files/blob.bin/version/1"
+
+    async def op(i: int) -> int:
+        return len(check(await client.get(url, headers=headers)).content)
+
+    results = {}
+    for concurrency, iterations in ((1, 8 if quick else 32), (8 if quick else 16, 32 if quick else 128)):
+        _log(f"download 8MiB x{iterations}, {concurrency} concurrent")
+        results[f"download_8MiB_c{concurrency}"] = await measure(op, iterations, concurrency, size=size)
+    return results
+
+async def list_files(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """`GET /files/` on a repository with many files and versions."""
+    from database import engine
+    from repos.models import RepoFile, RepoFileVersion
+
+    headers = await auth_headers(client, "files@bench.example.com")
+    repo_id = await create_repo(client, headers, "bench-files")
+    file_count, versions_per_file = (2000, 5) if quick else (10000, 10)
+    _log(f"seeding {file_count} files with {versions_per_file} versions each")
+    now = _now()
+    with engine.begin() as conn:
+        first_id = _next_id(conn, RepoFile)
+        first_version_id = _next_id(conn, RepoFileVersion)
+        file_rows, version_rows = [], []
+        for n in range(file_count):
+            file_id = first_id + n
+            version_ids = range(first_version_id + n * versions_per_file, first_version_id + (n + 1) * versions_per_file)
+            versions = [
+                dict(id=version_id, file_id=file_id, version_number=v,
+                     sha256=hashlib.sha256(f"{file_id}:{v}".encode()).hexdigest(), size=v * 1000 + n,
+                     uploaded_at=now - timedelta(seconds=file_count - n, minutes=versions_per_file - v))
+                for v, version_id in enumerate(version_ids, start=1)
+            ]
+            version_rows.extend(versions)
+            latest = versions[-1]
+            file_rows.append(dict(
+                id=file_id, repo_id=repo_id, filename=f"dir{n % 100:02d}/file{n:06d}.dat",
+                sha256=latest["sha256"], uploaded_at=latest["uploaded_at"],
+                latest_version_id=latest["id"], latest_version_number=versions_per_file,
+                version_count=versions_per_file, total_size=sum(v["size"] for v in versions),
+            ))
+        conn.execute(insert(RepoFile), file_rows)
+        conn.execute(insert(RepoFileVersion), version_rows)
+
+    base = f"/api/repos/{repo_id}/files/"
+    params = dict(files=file_count, versions=file_count * versions_per_file)
+
+    async def list_all(i: int) -> int:
+        check(await client.get(base, headers=headers))
+        return 0
+
+    async def first_page(i: int) -> int:
+        check(await client.get(base, params={"limit": 100}, headers=headers))
+        return 0
+
+    async def prefix_page(i: int) -> int:
+        check(await client.get(base, params={"limit": 100, "prefix": f"dir{i % 100:02d}/"}, headers=headers))
+        return 0
+
+    _log("list_files")
+    return {
+        "list_files_all": await measure(list_all, 3 if quick else 5, **params),
+        "list_files_page": await measure(first_page, 20 if quick else 100, **params),
+        "list_files_prefix_page": await measure(prefix_page, 20 if quick else 100, **params),
+    }
+
+_WORDS = (
+    "alpha beta gamma delta report draft final budget design review invoice schema backup config "
+    "release notes roadmap sprint meeting summary contract audit metrics export import cache index"
+).split()
+
+async def search(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """`GET /api/repos/search` over many indexed versions, with common, rare and prefix terms."""
+    from database import engine
+    from repos.models import RepoFile, RepoFileVersion
+    from repos.search import SEARCH_TABLE, create_search_index
+    from sqlalchemy import column, table
+
+    headers = await auth_headers(client, "search@bench.example.com")
+    repo_id = await create_repo(client, headers, "bench-search")
+    file_count, versions_per_file = (5000, 5) if quick else (30000, 10)
+    _log(f"seeding and indexing {file_count} files with {versions_per_file} versions each")
+    rng = random.Random(0)
+    now = _now()
+    create_search_index(engine)
+    search_table = table(
+        SEARCH_TABLE, column("rowid"), column("filename"), column("description"), column("content"), column("repo")
+    )
+    with engine.begin() as conn:
+        first_id = _next_id(conn, RepoFile)
+        first_version_id = _next_id(conn, RepoFileVersion)
+        file_rows, version_rows, index_rows = [], [], []
+        for n in range(file_count):
+            file_id = first_id + n
+            filename = f"{rng.choice(_WORDS)}_{rng.choice(_WORDS)}_{n:06d}.txt"
+            for v in range(1, versions_per_file + 1):
+                version_id = first_version_id + n * versions_per_file + v - 1
+                description = " ".join(rng.choices(_WORDS, k=4))
+                version_rows.append(dict(
+                    id=version_id, file_id=file_id, version_number=v, size=1000,
+                    sha256=hashlib.sha256(f"{file_id}:{v}".encode()).hexdigest(),
+                    uploaded_at=now, version_description=description,
+                ))
+                index_rows.append(dict(
+                    rowid=version_id, filename=filename, description=description,
+                    content=" ".join(rng.choices(_WORDS, k=50)) + f" token{n}x{v}", repo=f"r{repo_id}",
+                ))
+            latest = version_rows[-1]
+            file_rows.append(dict(
+                id=file_id, repo_id=repo_id, filename=filename, sha256=latest["sha256"], uploaded_at=now,
+                latest_version_id=latest["id"], latest_version_number=versions_per_file,
+                version_count=versions_per_file, total_size=1000 * versions_per_file,
+            ))
+        conn.execute(insert(RepoFile), file_rows)
+        conn.execute(insert(RepoFileVersion), version_rows)
+        conn.execute(insert(search_table), index_rows)
+
+    params = dict(files=file_count, versions=file_count * versions_per_file)
+    # A user with a repository of their own must not pay for scanning everyone else's matches
+    outsider = await auth_headers(client, "search-outsider@bench.example.com")
+    await create_repo(client, outsider, "bench-search-outsider")
+    queries = {
+        "common": ({"q": "report"}, headers),
+        "rare": ({"q": f"token{file_count // 2}x1", "all_versions": "true"}, headers),
+        "prefix": ({"q": "rev*"}, headers),
+        "two_terms_all_versions": ({"q": "budget draft", "all_versions": "true"}, headers),
+        "other_user": ({"q": "report"}, outsider),
+    }
+    results = {}
+    for label, (query, query_headers) in queries.items():
+        async def op(i: int) -> int:
+            check(await client.get("/api/repos/search", params=query, headers=query_headers))
+            return 0
+
+        _log(f"search {label}")
+        results[f"search_{label}"] = await measure(op, 10 if quick else 50, **params)
+    return results
+
+async def list_repositories(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """`GET /api/repos/` for a user in many repositories that each have many collaborators."""
+    from database import engine
+    from auth.models import User
+    from repos.models import Collaborator, Repository, RoleEnum
+
+    headers = await auth_headers(client, "repos@bench.example.com")
+    repo_count, collaborator_count = (100, 20) if quick else (500, 50)
+    _log(f"seeding {repo_count} repositories with {collaborator_count} collaborators each")
+    with engine.begin() as conn:
+        user_id = conn.execute(select(User.id).where(User.email == "repos@bench.example.com")).scalar_one()
+        first_user = _next_id(conn, User)
+        others = list(range(first_user, first_user + collaborator_count - 1))
+        conn.execute(insert(User), [
+            dict(id=uid, email=f"collab{uid}@bench.example.com", hashed_password="!", full_name="Collaborator")
+            for uid in others
+        ])
+        first_repo = _next_id(conn, Repository)
+        repo_ids = list(range(first_repo, first_repo + repo_count))
+        conn.execute(insert(Repository), [
+            dict(id=rid, name=f"bench-repo-{rid}", owner_id=user_id) for rid in repo_ids
+        ])
+        conn.execute(insert(Collaborator), [
+            dict(repo_id=rid, user_id=uid, role=RoleEnum.admin if uid == user_id else RoleEnum.read)
+            for rid in repo_ids
+            for uid in [user_id, *others]
+        ])
+
+    params = dict(repositories=repo_count, collaborators=collaborator_count)
+
+    async def list_all(i: int) -> int:
+        check(await client.get("/api/repos/", headers=headers))
+        return 0
+
+    async def first_page(i: int) -> int:
+        check(await client.get("/api/repos/", params={"limit": 50}, headers=headers))
+        return 0
+
+    _log("list_repositories")
+    return {
+        "list_repositories_all": await measure(list_all, 3 if quick else 10, **params),
+        "list_repositories_page": await measure(first_page, 10 if quick else 50, **params),
+    }
+
+async def login(client: httpx.AsyncClient, quick: bool) -> Dict[str, dict]:
+    """Concurrent `POST /auth/login`, dominated by bcrypt at BCRYPT_ROUNDS."""
+    from config import BCRYPT_ROUNDS
+
+    await auth_headers(client, "login@bench.example.com")
+    credentials = {"email": "login@bench.example.com", "password": "benchmark-password"}
+
+    async def op(i: int) -> int:
+        check(await client.post("/auth/login", json=credentials))
+        return 0
+
+    iterations, concurrency = (16, 4) if quick else (64, 8)
+    _log(f"login x{iterations}, {concurrency} concurrent")
+    return {"login": await measure(op, iterations, concurrency, bcrypt_rounds=BCRYPT_ROUNDS)}
+
+
+SCENARIOS = {
+    "upload": upload,
+    "precheck": precheck,
+    "download": download,
+    "list_files": list_files,
+    "search": search,
+    "list_repositories": list_repositories,
+    "login": login,
+}
@@ -6,7 +6,75 @@ load_dotenv()  # loads variables from .env into environment
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))  # Extra connections allowed above the pool size under load
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Seconds before a pooled connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 30000))  # How long SQLite writers wait for the lock
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")  # Run init_db on startup
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))  # Changing it rehashes passwords on next login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 64))  # Further logins get 503 until it drains
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", 60))  # Decoded tokens, users and repo roles
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))  # Entries per cache; 0 disables caching
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", "storage")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # "local" (under STORAGE_ROOT) or "s3" (needs boto3)
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "")  # Key prefix inside the bucket
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # For MinIO and other S3-compatible stores
+S3_REGION = os.getenv("S3_REGION")
+S3_PRESIGN_DOWNLOADS = os.getenv("S3_PRESIGN_DOWNLOADS", "true").lower() in ("1", "true", "yes")  # Redirect downloads
+S3_PRESIGN_EXPIRY_SECONDS = int(os.getenv("S3_PRESIGN_EXPIRY_SECONDS", 300))
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", 16 * 1024 ** 2))  # Multipart upload/download part size
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 8))  # Parallel parts per transfer
+STORAGE_MODE = os.getenv("STORAGE_MODE", "full")  # "full" or "delta" (needs zstandard)
+DELTA_KEYFRAME_INTERVAL = int(os.getenv("DELTA_KEYFRAME_INTERVAL", 8))  # Max deltas applied to rebuild a version
+DELTA_MAX_SIZE = int(os.getenv("DELTA_MAX_SIZE", 64 * 1024 ** 2))  # Larger versions are only zstd-compressed
+DELTA_CACHE_SIZE = int(os.getenv("DELTA_CACHE_SIZE", 1024 ** 3))  # Bytes of reconstructed versions kept on disk
+DELTA_RAW_GRACE_SECONDS = int(os.getenv("DELTA_RAW_GRACE_SECONDS", 3600))  # Plain copy kept after encoding, for open readers
+DIFF_CACHE_SIZE = int(os.getenv("DIFF_CACHE_SIZE", 256 * 1024 ** 2))  # Bytes of computed diffs and patches kept on disk
+DIFF_MAX_TEXT_BYTES = int(os.getenv("DIFF_MAX_TEXT_BYTES", 2 * 1024 ** 2))  # Larger files only get zstd patches
+SCRUB_ENABLED = os.getenv("SCRUB_ENABLED", "true").lower() in ("1", "true", "yes")  # Background integrity scrubber
+SCRUB_RATE_BYTES = int(os.getenv("SCRUB_RATE_BYTES", 32 * 1024 ** 2))  # Bytes per second the scrubber may read
+SCRUB_INTERVAL_SECONDS = int(os.getenv("SCRUB_INTERVAL_SECONDS", 3600))  # Pause between full passes
+SCRUB_ORPHAN_GRACE_SECONDS = int(os.getenv("SCRUB_ORPHAN_GRACE_SECONDS", 24 * 3600))  # Min age before orphans are removed
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 ** 3))  # Default per-repo limit in bytes
+REPO_QUOTA_BYTES = int(os.getenv("REPO_QUOTA_BYTES", 0))  # Bytes of all versions per repository; 0 = unlimited
+USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_BYTES", 0))  # Bytes across the repositories a user owns; 0 = unlimited
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 ** 2))  # Suggested chunk size for resumable uploads
+MAX_UPLOAD_CHUNK_SIZE = int(os.getenv("MAX_UPLOAD_CHUNK_SIZE", 64 * 1024 ** 2))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 1000))  # Files per batch upload or archive import
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", 4 * 1024 ** 3))  # Request body of a batch upload or archive import
+SEARCH_INDEX_CONTENT = os.getenv("SEARCH_INDEX_CONTENT", "true").lower() in ("1", "true", "yes")  # Index text file contents
+SEARCH_MAX_CONTENT_BYTES = int(os.getenv("SEARCH_MAX_CONTENT_BYTES", 1024 ** 2))  # Larger files are indexed by name only
+CHANGES_MAX_WAIT_SECONDS = int(os.getenv("CHANGES_MAX_WAIT_SECONDS", 60))  # Upper bound for long-polling the change feed
+CHANGES_POLL_SECONDS = float(os.getenv("CHANGES_POLL_SECONDS", 5))  # Waiting feeds re-check the database this often
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # Background job threads per process; 0 = only enqueue
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))  # Runs before a failing job is marked failed
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 5))  # Backoff before the first retry, doubled per failure
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", 3600))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))  # Idle workers check for due jobs this often
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 900))  # Running jobs not finished by then are run again
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))  # Finished jobs are deleted after this
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", 24 * 3600))  # Idle sessions are removed after this
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")  # "memory" (one process), "sqlite" (one host) or "redis"
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", os.path.join(STORAGE_ROOT, "ratelimit.db"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")  # Any Redis-compatible server
+LOGIN_RATE_LIMIT = os.getenv("LOGIN_RATE_LIMIT", "5/minute")  # Login attempts per client IP
+LOGIN_FAILURE_RATE_LIMIT = os.getenv("LOGIN_FAILURE_RATE_LIMIT", "20/hour")  # Failed logins per account and client IP
+DOWNLOAD_RATE_LIMIT = os.getenv("DOWNLOAD_RATE_LIMIT", "600/minute")  # Download requests per user
+UPLOAD_BYTES_PER_SECOND = int(os.getenv("UPLOAD_BYTES_PER_SECOND", 0))  # Upload bandwidth per user; 0 = unlimited
+DOWNLOAD_BYTES_PER_SECOND = int(os.getenv("DOWNLOAD_BYTES_PER_SECOND", 0))  # Download bandwidth per user; 0 = unlimited
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.cpu_count() or 4))  # Concurrent hashing/bcrypt calls from async handlers
+IO_WORKERS = int(os.getenv("IO_WORKERS", 32))  # Concurrent blocking file operations from async handlers
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json" (one object per line, including `extra` fields)
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))  # Upper bound for the `limit` of paginated listings
+
+# Versions are immutable; "private" keeps shared caches from serving authenticated content
+DOWNLOAD_CACHE_CONTROL = os.getenv("DOWNLOAD_CACHE_CONTROL", "private, max-age=31536000, immutable")
 
 CORS_ORIGINS = [
     "https://ticslab.dev",
@@ -1,12 +1,75 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from config import (
+    SQLALCHEMY_DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    SQLITE_BUSY_TIMEOUT_MS,
+)
+import logging
+
+logger = logging.getLogger(__name__)
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(url).database in (None, "", ":memory:"):
+            return options  # In-memory databases use a single shared connection
+    options["pool_size"] = DB_POOL_SIZE
+    options["max_overflow"] = DB_MAX_OVERFLOW
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed during a write; the busy timeout makes writers queue instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL) -> Engine:
+    """Create the pooled engine for `url`, tuned for SQLite when applicable."""
+    engine = create_engine(url, **_engine_options(url))
+    if _is_sqlite(url):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+def create_async_db_engine(url: str = SQLALCHEMY_DATABASE_URL) -> AsyncEngine:
+    """Async counterpart of `create_db_engine` (aiosqlite / asyncpg)."""
+    engine = create_async_engine(async_database_url(url), **_engine_options(url))
+    if _is_sqlite(url):
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(url: str) -> str:
+    """Rewrite a sync database URL to use the matching asyncio driver."""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+engine = create_db_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -14,3 +77,79 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def begin_transaction(db: Session):
+    """Make sure the session's database transaction has begun, so savepoints nest inside it.
+
+    pysqlite only begins a transaction before the first write: a SAVEPOINT
+    issued earlier starts one of its own, and releasing it commits.
+    """
+    connection = db.connection()
+    if connection.dialect.name == "sqlite" and not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN")
+
+def init_db(bind: Engine = engine):
+    """Create missing tables, columns, indexes and the search index. Run once at startup or via `manage.py init-db`."""
+    import auth.models  # noqa: F401 - register all tables on Base.metadata
+    import repos.models  # noqa: F401
+    from repos.search import create_search_index
+    from repos.utils import backfill_file_stats, backfill_usage
+
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    with Session(bind) as db:
+        backfilled = backfill_file_stats(db)
+        if backfilled:
+            logger.info("Backfilled version counters of %s files", backfilled)
+        # After the files, whose counters the usage totals are summed from
+        backfilled = backfill_usage(db)
+        if backfilled:
+            logger.info("Backfilled usage counters of %s repositories and users", backfilled)
+    add_missing_indexes(bind)
+    create_search_index(bind)
+
+def add_missing_columns(engine, metadata=Base.metadata):
+    """Add model columns that are missing from existing tables.
+
+    `create_all` only creates whole tables, so additive column changes on
+    existing deployments are applied here. New columns must be nullable or
+    carry a server default.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.exec_driver_sql(ddl)
+
+def add_missing_indexes(engine, metadata=Base.metadata):
+    """Create model indexes that are missing from existing tables.
+
+    A unique index that existing rows already violate is logged and skipped;
+    those rows need manual cleanup before the next run can create it.
+    """
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with engine.begin() as conn:
+                    index.create(bind=conn)
+            except IntegrityError as e:
+                logger.error("Cannot create unique index %s on %s: %s", index.name, table.name, e.orig)
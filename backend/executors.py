@@ -0,0 +1,35 @@
+"""Bounded executors for blocking work called from `async def` handlers.
+
+CPU-heavy calls (bcrypt, hashing) and blocking file I/O run in worker threads
+under separate capacity limits, so they neither stall the event loop nor
+starve the threadpool that serves sync routes.
+"""
+from typing import Any, Callable, Dict
+import anyio
+from config import CPU_WORKERS, IO_WORKERS
+
+_limiters: Dict[str, anyio.CapacityLimiter] = {}
+
+
+def _limiter(name: str, size: int) -> anyio.CapacityLimiter:
+    # Created lazily: a CapacityLimiter needs a running event loop
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = anyio.CapacityLimiter(size)
+    return limiter
+
+async def run_cpu(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a CPU-bound call in a worker thread, at most CPU_WORKERS at a time."""
+    return await anyio.to_thread.run_sync(func, *args, limiter=_limiter("cpu", CPU_WORKERS))
+
+async def run_io(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking I/O call in a worker thread, at most IO_WORKERS at a time."""
+    return await anyio.to_thread.run_sync(func, *args, limiter=_limiter("io", IO_WORKERS))
+
+def track_threadpool():
+    """Include anyio's default limiter (sync routes, `run_in_threadpool`); call from the event loop."""
+    _limiters.setdefault("threadpool", anyio.to_thread.current_default_thread_limiter())
+
+def limiter_statistics() -> Dict[str, anyio.CapacityLimiterStatistics]:
+    """Usage of every limiter created so far, keyed by executor name."""
+    return {name: limiter.statistics() for name, limiter in list(_limiters.items())}
@@ -1,20 +1,47 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from auth.models import Base
-from auth.utils import engine
-from config import CORS_ORIGINS
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from contextlib import asynccontextmanager
+from logging_setup import configure_logging
+from metrics import MetricsMiddleware
+from ratelimit import RateLimitMiddleware
+from executors import track_threadpool
+from database import SessionLocal, engine, async_engine, init_db
+from config import CORS_ORIGINS, DB_AUTO_MIGRATE, SCRUB_ENABLED
 from auth.routes import router as auth_router
 from repos.routes import router as repo_router
 from repos.files_routes import router as files_router
+from repos.uploads_routes import router as uploads_router
+from repos.changes_routes import router as changes_router
+from repos.jobs_routes import router as jobs_router
+from repos.scrubber import start_scrubber, stop_scrubber
+from repos.jobs import start_job_workers, stop_job_workers
+from repos.search import schedule_indexing
 
+configure_logging()
 
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes run once per process start, not on import; disable with DB_AUTO_MIGRATE=false
+    # and run `python manage.py init-db` as a deploy step instead
+    track_threadpool()
+    if DB_AUTO_MIGRATE:
+        init_db(engine)
+    # Versions uploaded before the search index existed
+    with SessionLocal() as db:
+        schedule_indexing(db)
+        db.commit()
+    start_job_workers()
+    if SCRUB_ENABLED:
+        start_scrubber()
+    yield
+    stop_scrubber()
+    stop_job_workers()
+    await async_engine.dispose()
+    engine.dispose()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -23,14 +50,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Diff-Format"],
 )
 
-# Setup rate limiter (shared across app)
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
+# Paces upload and download bodies to the per-user byte limits
+app.add_middleware(RateLimitMiddleware)
+
+# Outermost, so latency and bytes include every other middleware
+app.add_middleware(MetricsMiddleware)
 
 # Include auth routes
 app.include_router(auth_router)
 
 app.include_router(repo_router, prefix="/api/repos")
 app.include_router(files_router, prefix="/api")
+app.include_router(uploads_router, prefix="/api")
+app.include_router(changes_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics for this process."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
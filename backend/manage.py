@@ -0,0 +1,112 @@
+"""Maintenance commands for the TicsLab backend.
+
+Usage:
+    python manage.py init-db
+    python manage.py migrate-storage
+    python manage.py compact-storage
+    python manage.py scrub
+    python manage.py index-search
+    python manage.py run-jobs
+"""
+import argparse
+import json
+from logging_setup import configure_logging
+from database import SessionLocal, engine, init_db
+from repos.delta import compact_file, delta_enabled
+from repos.jobs import run_pending_jobs
+from repos.models import RepoFile
+from repos.scrubber import Scrubber, acquire_scrub_lock
+from repos.search import fts_available, index_all
+from repos.storage import migrate_legacy_storage
+
+
+def init_database():
+    """Create missing tables, columns and indexes."""
+    init_db(engine)
+    print("Database schema is up to date")
+
+
+def migrate_storage():
+    """Convert legacy `.v<N>` files into the content-addressed object store."""
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        stats = migrate_legacy_storage(db)
+    finally:
+        db.close()
+    print(
+        f"Migrated {stats['migrated']} files, deduplicated {stats['deduplicated']}, "
+        f"{stats['mismatched']} hash mismatches, {stats['missing']} missing"
+    )
+
+
+def compact_storage():
+    """Delta-encode the full history of every file (STORAGE_MODE=delta)."""
+    if not delta_enabled():
+        raise SystemExit("compact-storage needs STORAGE_MODE=delta and the zstandard package")
+    db = SessionLocal()
+    try:
+        file_ids = [row[0] for row in db.query(RepoFile.id).all()]
+        for file_id in file_ids:
+            compact_file(db, file_id, full_history=True)
+    finally:
+        db.close()
+    print(f"Compacted {len(file_ids)} files")
+
+
+def scrub():
+    """Run (or resume) one full integrity scrub pass and print its report."""
+    lock_file = acquire_scrub_lock()
+    if lock_file is None:
+        raise SystemExit("Another process on this host is already scrubbing the storage")
+    try:
+        report = Scrubber().run_pass()
+    finally:
+        lock_file.close()
+    print(json.dumps(report, indent=2))
+
+
+def index_search():
+    """Add every file version missing from the search index."""
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        if not fts_available(db):
+            raise SystemExit("The search index needs SQLite with FTS5; search uses LIKE queries instead")
+        indexed = index_all(db)
+    finally:
+        db.close()
+    print(f"Indexed {indexed} file versions")
+
+
+def run_jobs():
+    """Run the background jobs that are due, e.g. from cron when JOB_WORKERS=0."""
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        count = run_pending_jobs(db)
+    finally:
+        db.close()
+    print(f"Ran {count} background jobs")
+
+
+COMMANDS = {
+    "init-db": init_database,
+    "migrate-storage": migrate_storage,
+    "compact-storage": compact_storage,
+    "scrub": scrub,
+    "index-search": index_search,
+    "run-jobs": run_jobs,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    configure_logging()
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Prometheus metrics shared across the app, served at `/metrics`.
+
+`MetricsMiddleware` records latency, body bytes and database usage per route
+template. Database statements are timed through SQLAlchemy engine events and
+attributed to the request whose context issued them, including queries run
+in threadpool workers. Threadpool saturation is read from the anyio limiters
+in `executors` at scrape time.
+"""
+from contextvars import ContextVar
+from typing import Optional
+import logging
+import time
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from executors import limiter_statistics
+
+logger = logging.getLogger(__name__)
+
+_MiB = 1024 ** 2
+_THROUGHPUT_MIN_BYTES = _MiB  # Smaller transfers are dominated by latency, not bandwidth
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time until the response body is fully sent", ["method", "route", "status"]
+)
+REQUEST_BYTES = Counter("http_request_body_bytes_total", "Request body bytes received (uploads)", ["route"])
+RESPONSE_BYTES = Counter("http_response_body_bytes_total", "Response body bytes sent (downloads)", ["route"])
+TRANSFER_THROUGHPUT = Histogram(
+    "http_transfer_bytes_per_second",
+    "Throughput of requests that moved at least 1 MiB in one direction",
+    ["route", "direction"],
+    buckets=[_MiB * n for n in (1, 4, 16, 64, 256, 1024, 4096)],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database statements executed per request", ["route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250, 1000),
+)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time per request spent in database statements", ["route"])
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Duration of single database statements", ["statement"])
+HASH_SECONDS = Histogram(
+    "content_hash_seconds", "Time spent SHA256-hashing the content of one ingested file",
+    buckets=(0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+HASHED_BYTES = Counter("content_hashed_bytes_total", "Bytes of ingested content hashed")
+JOB_SECONDS = Histogram("background_job_duration_seconds", "Run time of background jobs", ["kind", "outcome"])
+
+
+def record_hash(seconds: float, size: int):
+    HASH_SECONDS.observe(seconds)
+    HASHED_BYTES.inc(size)
+
+def record_job(kind: str, outcome: str, seconds: float):
+    JOB_SECONDS.labels(kind, outcome).observe(seconds)
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Mutable per request, so counts from threadpool workers (which get a copy of the context) reach it
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+_STATEMENTS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    DB_QUERY_SECONDS.labels(verb if verb in _STATEMENTS else "OTHER").observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _route_label(scope) -> str:
+    """Path template of the matched route, so labels stay bounded; "unmatched" for 404s."""
+    route = scope.get("route")
+    if route is None or not hasattr(route, "path_regex"):
+        return "unmatched"
+    path = scope.get("path", "")
+    if route.path_regex.match(path):
+        return route.path
+    # Routes of an included router may only know their own template; recover the literal prefix
+    for index, char in enumerate(path):
+        if char == "/" and index and route.path_regex.match(path[index:]):
+            return path[:index] + route.path
+    return route.path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, transferred bytes and DB usage."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        received = sent = 0
+        started = time.perf_counter()
+
+        async def receive_counted():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            _request_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            route = _route_label(scope)
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+            if received:
+                REQUEST_BYTES.labels(route).inc(received)
+            if sent:
+                RESPONSE_BYTES.labels(route).inc(sent)
+            if elapsed > 0:
+                if received >= _THROUGHPUT_MIN_BYTES:
+                    TRANSFER_THROUGHPUT.labels(route, "upload").observe(received / elapsed)
+                if sent >= _THROUGHPUT_MIN_BYTES:
+                    TRANSFER_THROUGHPUT.labels(route, "download").observe(sent / elapsed)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "%s %s -> %s in %.1f ms, %s queries",
+                    scope["method"], route, status, elapsed * 1000, stats.queries,
+                    extra={
+                        "method": scope["method"], "route": route, "status": status,
+                        "duration_ms": round(elapsed * 1000, 1), "db_queries": stats.queries,
+                        "bytes_in": received, "bytes_out": sent,
+                    },
+                )
+
+
+class _ThreadpoolCollector:
+    """Busy, total and waiting slots of every executor limiter, read at scrape time."""
+
+    def collect(self):
+        busy = GaugeMetricFamily("threadpool_busy_threads", "Worker threads currently in use", labels=["pool"])
+        size = GaugeMetricFamily("threadpool_max_threads", "Worker thread limit", labels=["pool"])
+        waiting = GaugeMetricFamily("threadpool_waiting_tasks", "Calls queued for a free worker", labels=["pool"])
+        for name, stats in limiter_statistics().items():
+            busy.add_metric([name], stats.borrowed_tokens)
+            size.add_metric([name], stats.total_tokens)
+            waiting.add_metric([name], stats.tasks_waiting)
+        yield busy
+        yield size
+        yield waiting
+
+
+REGISTRY.register(_ThreadpoolCollector())
@@ -0,0 +1,350 @@
+"""Token-bucket rate limits for logins, uploads and downloads.
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens per second.
+Request limits take one token per request and answer 429 with Retry-After once
+the bucket is empty. Byte limits take one token per byte as a body streams and
+pause the transfer instead, which slows a noisy client down to its rate through
+TCP backpressure without failing its request.
+
+Buckets live in the store selected by RATE_LIMIT_STORE: "memory" for a single
+process, "sqlite" for the processes of one host sharing RATE_LIMIT_SQLITE_PATH,
+or "redis" for any Redis-compatible server (needs the redis package). A store
+that fails lets requests through rather than failing them.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from fastapi import HTTPException, Request
+from auth.utils import token_email
+from config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_STORE,
+    RATE_LIMIT_SQLITE_PATH,
+    RATE_LIMIT_REDIS_URL,
+    DOWNLOAD_RATE_LIMIT,
+    UPLOAD_BYTES_PER_SECOND,
+    DOWNLOAD_BYTES_PER_SECOND,
+)
+from executors import run_io
+
+try:
+    import redis
+except ImportError:  # Only required when RATE_LIMIT_STORE=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*/\s*(second|minute|hour|day)s?\s*$")
+# Byte limits are charged in batches, so a transfer costs a store call per this many bytes
+_BYTE_BATCH = 256 * 1024
+
+
+@dataclass(frozen=True)
+class Limit:
+    rate: float  # Tokens added per second
+    burst: float  # Bucket size: what can be used at once after a pause
+
+def parse_limit(spec: str) -> Optional[Limit]:
+    """Parse "N/second|minute|hour|day" into a Limit allowing N at once; "" or "0" means unlimited."""
+    if not spec or spec.strip() == "0":
+        return None
+    match = _LIMIT_RE.match(spec.lower())
+    if match is None:
+        raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. '5/minute'")
+    count = float(match.group(1))
+    return Limit(count / _PERIODS[match.group(2)], count) if count > 0 else None
+
+def byte_limit(bytes_per_second: int) -> Optional[Limit]:
+    """A limit of `bytes_per_second` with one second of burst; 0 means unlimited."""
+    return Limit(bytes_per_second, max(bytes_per_second, _BYTE_BATCH)) if bytes_per_second > 0 else None
+
+def _take(tokens: float, updated: float, now: float, cost: float, limit: Limit, debt: bool) -> Tuple[float, float]:
+    # Returns the new token count and how long the caller has to wait; with `debt` the
+    # tokens are taken anyway, so waiting that long pays them back
+    tokens = min(limit.burst, tokens + max(now - updated, 0) * limit.rate)
+    if tokens >= cost:
+        return min(tokens - cost, limit.burst), 0.0  # Refunds (negative costs) cannot overfill
+    wait = (cost - tokens) / limit.rate
+    return (tokens - cost if debt else tokens), wait
+
+
+class MemoryStore:
+    """Buckets in this process; the least recently used are dropped beyond `max_keys`."""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, limit: Limit, debt: bool = False) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.burst, now))
+            tokens, wait = _take(tokens, updated, now, cost, limit, debt)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file shared by the processes of one host."""
+
+    blocking = True
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_buckets_full_at ON buckets (full_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._local.takes = 0
+        return conn
+
+    def take(self, key: str, cost: float, limit: Limit, debt: bool = False) -> float:
+        conn = self._conn()
+        now = time.time()  # Wall clock: shared between processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (limit.burst, now)
+            tokens, wait = _take(tokens, updated, now, cost, limit, debt)
+            full_at = now + (limit.burst - tokens) / limit.rate
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, "
+                "full_at = excluded.full_at",
+                (key, tokens, now, full_at),
+            )
+            self._local.takes += 1
+            if self._local.takes % 1000 == 0:
+                # A bucket that has refilled completely is the same as no bucket
+                conn.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+_REDIS_TAKE = """
+local rate, burst, cost, now, debt = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5]
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = math.min(tokens - cost, burst)
+else
+    wait = (cost - tokens) / rate
+    if debt == '1' then tokens = tokens - cost end
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    """Buckets in a Redis-compatible server, updated atomically by a Lua script.
+
+    Pass `client` to use an existing connection, e.g. a local fake in tests.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, client=None, prefix: str = "ratelimit:"):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("RATE_LIMIT_STORE=redis needs the redis package")
+            client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_TAKE)
+
+    def take(self, key: str, cost: float, limit: Limit, debt: bool = False) -> float:
+        args = [limit.rate, limit.burst, cost, time.time(), "1" if debt else "0"]
+        return float(self._script(keys=[self.prefix + key], args=args))
+
+
+_STORES: Dict[str, Callable[[], object]] = {"memory": MemoryStore, "sqlite": SQLiteStore, "redis": RedisStore}
+
+def create_store(name: str = RATE_LIMIT_STORE):
+    """Instantiate the configured bucket store."""
+    try:
+        return _STORES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown RATE_LIMIT_STORE {name!r}, expected one of {sorted(_STORES)}")
+
+
+class RateLimiter:
+    """Named token buckets per client on top of a store, created on first use."""
+
+    def __init__(self, store=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self._store = store
+        self._store_lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = create_store()
+        return self._store
+
+    def take(self, name: str, key: str, limit: Optional[Limit], cost: float = 1, debt: bool = False) -> float:
+        """Take `cost` tokens from a client's bucket; returns the seconds to wait (0 = allowed)."""
+        if not self.enabled or limit is None:
+            return 0.0
+        try:
+            return self.store.take(f"{name}:{key}", cost, limit, debt)
+        except Exception as e:
+            logger.warning("Rate limit store failed, allowing the request: %s", e)
+            return 0.0
+
+    async def take_async(self, name: str, key: str, limit: Optional[Limit], cost: float = 1, debt: bool = False) -> float:
+        if not self.enabled or limit is None:
+            return 0.0
+        if self.store.blocking:
+            return await run_io(self.take, name, key, limit, cost, debt)
+        return self.take(name, key, limit, cost, debt)
+
+    def hit(self, name: str, key: str, limit: Optional[Limit]):
+        """Count one request; raises 429 with Retry-After once the bucket is empty."""
+        _raise_if_limited(self.take(name, key, limit))
+
+    async def hit_async(self, name: str, key: str, limit: Optional[Limit]):
+        _raise_if_limited(await self.take_async(name, key, limit))
+
+    async def refund_async(self, name: str, key: str, limit: Optional[Limit]):
+        """Give back a token taken by `hit_async`, e.g. for a request that turned out not to count."""
+        await self.take_async(name, key, limit, cost=-1)
+
+limiter = RateLimiter()
+
+
+def _raise_if_limited(wait: float):
+    if wait > 0:
+        raise HTTPException(
+            status_code=429, detail="Too many requests, retry later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+def client_ip(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def client_key(scope) -> str:
+    """The user of a valid bearer token, otherwise the client IP."""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                email = token_email(token.strip())
+                if email:
+                    return f"user:{email}"
+            break
+    return f"ip:{client_ip(scope)}"
+
+_download_limit = parse_limit(DOWNLOAD_RATE_LIMIT)
+_byte_limits = {UPLOAD: byte_limit(UPLOAD_BYTES_PER_SECOND), DOWNLOAD: byte_limit(DOWNLOAD_BYTES_PER_SECOND)}
+
+def limit_downloads(request: Request):
+    """Dependency counting a download request against the client's DOWNLOAD_RATE_LIMIT."""
+    limiter.hit("downloads", client_key(request.scope), _download_limit)
+
+_throttled: Dict[Callable, str] = {}
+
+def throttled(direction: str):
+    """Mark an endpoint whose request (UPLOAD) or response (DOWNLOAD) body is paced by the byte limits."""
+    def mark(endpoint):
+        _throttled[endpoint] = direction
+        return endpoint
+    return mark
+
+
+class _BytePacer:
+    def __init__(self, name: str, key: str, limit: Limit):
+        self.name, self.key, self.limit = name, key, limit
+        self.pending = 0
+
+    async def add(self, size: int):
+        self.pending += size
+        if self.pending < _BYTE_BATCH:
+            return
+        cost, self.pending = self.pending, 0
+        wait = await limiter.take_async(self.name, self.key, self.limit, cost, debt=True)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimitMiddleware:
+    """ASGI middleware pacing the bodies of endpoints marked with `throttled`.
+
+    The endpoint is only known once the request has been routed, which happens
+    before its body is read or its response is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not limiter.enabled or not any(_byte_limits.values()):
+            await self.app(scope, receive, send)
+            return
+
+        pacers: Dict[str, _BytePacer] = {}
+
+        def pacer_for(direction: str) -> Optional[_BytePacer]:
+            if _throttled.get(scope.get("endpoint")) != direction or _byte_limits[direction] is None:
+                return None
+            if direction not in pacers:
+                pacers[direction] = _BytePacer(f"{direction}_bytes", client_key(scope), _byte_limits[direction])
+            return pacers[direction]
+
+        async def receive_paced():
+            message = await receive()
+            if message["type"] == "http.request":
+                paced = pacer_for(UPLOAD)
+                if paced is not None:
+                    await paced.add(len(message.get("body", b"")))
+            return message
+
+        async def send_paced(message):
+            if message["type"] == "http.response.body":
+                paced = pacer_for(DOWNLOAD)
+                if paced is not None:
+                    await paced.add(len(message.get("body", b"")))
+            await send(message)
+
+        await self.app(scope, receive_paced, send_paced)
@@ -0,0 +1,219 @@
+"""Blob storage backends.
+
+Objects are addressed by keys such as `objects/ab/cdef...`. Temp files, the
+reconstruction cache and scrubber state always stay on local disk; only the
+object store itself is pluggable (STORAGE_BACKEND=local or s3).
+"""
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+from urllib.parse import quote
+import os
+import shutil
+from config import (
+    STORAGE_BACKEND,
+    S3_BUCKET,
+    S3_PREFIX,
+    S3_ENDPOINT_URL,
+    S3_REGION,
+    S3_PRESIGN_DOWNLOADS,
+    S3_PRESIGN_EXPIRY_SECONDS,
+    S3_PART_SIZE,
+    S3_MAX_CONCURRENCY,
+)
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # Only required when STORAGE_BACKEND=s3 without an injected client
+    boto3 = TransferConfig = None
+
+    class ClientError(Exception):
+        """Stand-in for botocore's error, so injected clients can report missing objects."""
+
+        def __init__(self, error_response: dict, operation_name: str):
+            super().__init__(f"{operation_name}: {error_response}")
+            self.response = error_response
+
+
+class StorageBackend(ABC):
+    """Interface of an object store holding blob content."""
+
+    remote = False  # Whether each call is a network round trip
+
+    @abstractmethod
+    def put_file(self, key: str, src: Path) -> None:
+        """Store a local file under `key`, consuming (moving or deleting) `src`."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object is stored under `key`."""
+
+    @abstractmethod
+    def open_read(self, key: str) -> BinaryIO:
+        """Return a readable stream of the object; raises FileNotFoundError if it is missing."""
+
+    @abstractmethod
+    def fetch(self, key: str, dest: Path) -> None:
+        """Copy the object into a local file; raises FileNotFoundError if it is missing."""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Delete an object. Returns False if it did not exist."""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        """Yield `(key, modified_timestamp)` for every object whose key starts with `prefix`."""
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path of the object on this host's filesystem, if the backend keeps it there."""
+        return None
+
+    def presigned_url(self, key: str, filename: str, media_type: str) -> Optional[str]:
+        """Short-lived URL a client can download the object from directly, if supported."""
+        return None
+
+
+class LocalBackend(StorageBackend):
+    """Objects as files below `root`; keys map directly to relative paths."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def put_file(self, key: str, src: Path) -> None:
+        dest = self.local_path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dest)
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key).exists()
+
+    def open_read(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+    def fetch(self, key: str, dest: Path) -> None:
+        shutil.copyfile(self.local_path(key), dest)
+
+    def delete(self, key: str) -> bool:
+        try:
+            self.local_path(key).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        directory = prefix.rpartition("/")[0]
+        base = self.root / directory if directory else self.root
+        if not base.is_dir():
+            return
+        for path in base.rglob("*"):
+            key = path.relative_to(self.root).as_posix()
+            if key.startswith(prefix) and path.is_file():
+                try:
+                    yield key, path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+
+
+class S3Backend(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, ...).
+
+    Large objects are transferred as parallel multipart uploads and ranged
+    downloads; plain downloads can be redirected to presigned URLs so the
+    bytes never pass through the API.
+    """
+
+    remote = True
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, presign: bool = True):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package")
+            client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL or None, region_name=S3_REGION or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.presign = presign
+        # Without boto3 an injected client uses its own transfer defaults
+        self.transfer = TransferConfig(
+            multipart_threshold=S3_PART_SIZE,
+            multipart_chunksize=S3_PART_SIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+        ) if TransferConfig is not None else None
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _not_found(error: "ClientError") -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put_file(self, key: str, src: Path) -> None:
+        self.client.upload_file(str(src), self.bucket, self._key(key), Config=self.transfer)
+        src.unlink(missing_ok=True)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if self._not_found(e):
+                return False
+            raise
+
+    def open_read(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except ClientError as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def fetch(self, key: str, dest: Path) -> None:
+        try:
+            self.client.download_file(self.bucket, self._key(key), str(dest), Config=self.transfer)
+        except ClientError as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def delete(self, key: str) -> bool:
+        # S3 deletes are idempotent and do not report whether the object existed
+        existed = self.exists(key)
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return existed
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):], obj["LastModified"].timestamp()
+
+    def presigned_url(self, key: str, filename: str, media_type: str) -> Optional[str]:
+        if not self.presign:
+            return None
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._key(key),
+                "ResponseContentDisposition": f"attachment; filename*=utf-8''{quote(filename)}",
+                "ResponseContentType": media_type,
+            },
+            ExpiresIn=S3_PRESIGN_EXPIRY_SECONDS,
+        )
+
+
+def create_backend(storage_root: Path) -> StorageBackend:
+    """Build the backend selected by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Backend(S3_BUCKET, S3_PREFIX, presign=S3_PRESIGN_DOWNLOADS)
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+    return LocalBackend(storage_root)
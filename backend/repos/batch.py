@@ -0,0 +1,193 @@
+"""Batch uploads: many files in one multipart request, or one tar/zip archive.
+
+Contents are hashed and written concurrently through the bounded executors;
+all version rows are then created in a single transaction, each file in a
+savepoint so that one rejected file does not fail the others.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, List, Optional, Tuple
+import asyncio
+import tarfile
+import zipfile
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+from config import IO_WORKERS, MAX_BATCH_FILES
+from database import begin_transaction
+from executors import run_io
+from .schemas import BatchFileResult
+from .utils import UploadLimit, ingest_limited, ingest_upload, plan_version, record_version
+
+
+@dataclass
+class BatchItem:
+    filename: str
+    tmp_path: Optional[Path] = None
+    sha256: Optional[str] = None
+    size: int = 0
+    error: Optional[str] = None
+
+
+def _checked_name(raw: Optional[str]) -> Tuple[str, Optional[str]]:
+    filename = secure_filename(raw or "")
+    return (filename, None) if filename else (raw or "", "Invalid filename")
+
+def _finish(item: BatchItem, ingest: Callable[[], Tuple[Path, str, int]]) -> BatchItem:
+    try:
+        item.tmp_path, item.sha256, item.size = ingest()
+    except HTTPException as e:
+        # Too large or empty; rejected on its own
+        item.error = e.detail
+    return item
+
+async def _gather_bounded(coros: Iterable) -> list:
+    # Keeps the number of open temp files bounded for very large batches
+    semaphore = asyncio.Semaphore(IO_WORKERS)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+async def ingest_files(files: List[UploadFile], limit: UploadLimit) -> List[BatchItem]:
+    """Hash and store the parts of a multipart batch concurrently."""
+    async def ingest(upload: UploadFile) -> BatchItem:
+        filename, error = _checked_name(upload.filename)
+        item = BatchItem(filename, error=error)
+        if error:
+            return item
+        try:
+            item.tmp_path, item.sha256, item.size = await ingest_upload(upload, limit)
+        except HTTPException as e:
+            item.error = e.detail
+        return item
+
+    items = await _gather_bounded(ingest(upload) for upload in files)
+    return list(items)
+
+def _ingest_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, limit: UploadLimit) -> BatchItem:
+    filename, error = _checked_name(info.filename)
+    item = BatchItem(filename, error=error)
+    if error:
+        return item
+    if info.file_size > limit.max_size:
+        item.error = limit.detail
+        return item
+
+    def ingest():
+        # The declared size is not trusted; the limit is enforced on actual bytes
+        with archive.open(info) as src:
+            return ingest_limited(src, limit)
+
+    try:
+        return _finish(item, ingest)
+    except (zipfile.BadZipFile, EOFError, NotImplementedError, RuntimeError) as e:
+        # Corrupt, encrypted or unsupported members fail on their own
+        item.error = f"Unreadable archive member: {e}"
+        return item
+
+def _ingest_tar(fileobj: BinaryIO, limit: UploadLimit) -> List[BatchItem]:
+    items: List[BatchItem] = []
+    try:
+        # Stream mode: members are read in order without seeking or buffering the archive
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if len(items) >= MAX_BATCH_FILES:
+                    raise HTTPException(status_code=400, detail=f"Archive has more than {MAX_BATCH_FILES} files")
+                filename, error = _checked_name(member.name)
+                item = BatchItem(filename, error=error)
+                items.append(item)
+                if error:
+                    continue
+                if member.size > limit.max_size:
+                    item.error = limit.detail
+                    continue
+                _finish(item, lambda: ingest_limited(archive.extractfile(member), limit))
+    except BaseException:
+        discard(items)
+        raise
+    return items
+
+async def ingest_archive(upload: UploadFile, limit: UploadLimit) -> List[BatchItem]:
+    """Unpack a zip or (optionally compressed) tar archive into stored temp files.
+
+    Zip members are ingested concurrently; tar archives are read as a stream.
+    Raises 400 for unreadable archives or too many members.
+    """
+    fileobj = upload.file
+    is_zip = await run_io(zipfile.is_zipfile, fileobj)
+    await run_io(fileobj.seek, 0)
+    try:
+        if not is_zip:
+            return await run_io(_ingest_tar, fileobj, limit)
+        archive = await run_io(zipfile.ZipFile, fileobj)
+        with archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if len(members) > MAX_BATCH_FILES:
+                raise HTTPException(status_code=400, detail=f"Archive has more than {MAX_BATCH_FILES} files")
+            items = await _gather_bounded(run_io(_ingest_zip_member, archive, info, limit) for info in members)
+            return list(items)
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError):
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt archive")
+
+def discard(items: Iterable[BatchItem]):
+    """Remove the temp files of items that were not consumed by the blob store."""
+    for item in items:
+        if item.tmp_path is not None:
+            item.tmp_path.unlink(missing_ok=True)
+            item.tmp_path = None
+
+def commit_batch(
+    db: Session,
+    repo_id: int,
+    items: List[BatchItem],
+    version_description: Optional[str] = None,
+) -> List[BatchFileResult]:
+    """Record a version for every ingested item and commit them together.
+
+    Items identical to their file's latest version are skipped, and items that
+    `record_version` refuses (a quota exceeded, a version number taken
+    concurrently) are rejected without affecting the rest. Returns the
+    per-file results.
+    """
+    results: List[BatchFileResult] = []
+    try:
+        begin_transaction(db)
+        for item in items:
+            if item.error:
+                results.append(BatchFileResult(filename=item.filename, status="rejected", detail=item.error))
+                continue
+            repo_file, last_version, final_version = plan_version(db, repo_id, item.filename)
+            if last_version and last_version.sha256 == item.sha256:
+                discard([item])
+                results.append(BatchFileResult(
+                    filename=item.filename, status="skipped", version=last_version.version_number,
+                    sha256=item.sha256, size=item.size, detail="Identical to the latest version",
+                ))
+                continue
+            tmp_path, item.tmp_path = item.tmp_path, None
+            try:
+                with db.begin_nested():
+                    _, dedup_hit = record_version(
+                        db, repo_id, item.filename, repo_file, last_version, final_version,
+                        tmp_path, item.sha256, item.size, version_description,
+                    )
+            except HTTPException as e:
+                # Refused before the blob store took the content, so the temp file is still ours
+                tmp_path.unlink(missing_ok=True)
+                results.append(BatchFileResult(filename=item.filename, status="rejected", detail=e.detail))
+                continue
+            results.append(BatchFileResult(
+                filename=item.filename, status="created", version=final_version,
+                sha256=item.sha256, size=item.size, deduplicated=dedup_hit,
+            ))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        discard(items)
+        raise
+    return results
@@ -0,0 +1,123 @@
+"""Per-repository change feed: what changed since sequence number N.
+
+Every upload, version deletion and collaborator change bumps the repository's
+`change_seq` and adds a `RepoChange` row in the same transaction, so sequence
+numbers follow commit order without gaps. After the commit, waiting readers in
+this process are woken through `hub`; readers also re-check the database every
+CHANGES_POLL_SECONDS to see commits made by other processes.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import asyncio
+import threading
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from auth.models import User
+from .models import Repository, RepoChange, RoleEnum
+
+_PENDING_KEY = "pending_repo_changes"
+
+
+class ChangeHub:
+    """In-process pub/sub that wakes the readers waiting on a repository.
+
+    Publishing is safe from any thread; waiting happens on an event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, repo_id: int) -> Iterator[asyncio.Event]:
+        """Event set by the next publish for the repository.
+
+        Subscribe before reading the feed, so a commit between the read and
+        the wait is not missed.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters[repo_id].add(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(repo_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[repo_id]
+
+    def publish(self, repo_id: int):
+        with self._lock:
+            waiters = list(self._waiters.get(repo_id, ()))
+        for loop, woken in waiters:
+            try:
+                loop.call_soon_threadsafe(woken.set)
+            except RuntimeError:
+                pass  # Loop already closed
+
+hub = ChangeHub()
+
+
+async def wait_for(woken: asyncio.Event, timeout: float) -> bool:
+    """Wait until the event is set or the timeout passes; True if it was set."""
+    try:
+        await asyncio.wait_for(woken.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+def record_change(
+    db: Session,
+    repo_id: int,
+    kind: str,
+    filename: Optional[str] = None,
+    version_number: Optional[int] = None,
+    user_id: Optional[int] = None,
+    role: Optional[RoleEnum] = None,
+) -> int:
+    """Add a change to the repository's feed without committing. Returns its sequence number.
+
+    The counter update locks the repository row until the commit, so
+    concurrent writers get consecutive numbers in commit order.
+    """
+    seq = db.execute(
+        update(Repository).where(Repository.id == repo_id)
+        .values(change_seq=Repository.change_seq + 1)
+        .returning(Repository.change_seq)
+    ).scalar_one()
+    db.add(RepoChange(
+        repo_id=repo_id, seq=seq, kind=kind, filename=filename,
+        version_number=version_number, user_id=user_id, role=role,
+    ))
+    db.info.setdefault(_PENDING_KEY, set()).add(repo_id)
+    return seq
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session):
+    for repo_id in session.info.pop(_PENDING_KEY, ()):
+        hub.publish(repo_id)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+def latest_seq(db: Session, repo_id: int) -> int:
+    return db.query(Repository.change_seq).filter(Repository.id == repo_id).scalar() or 0
+
+def changes_since(db: Session, repo_id: int, since: int, limit: int) -> Tuple[List[tuple], int]:
+    """Up to `limit` changes after `since`, oldest first, and the repository's latest sequence number.
+
+    Changes are rows of `(RepoChange, collaborator email)`.
+    """
+    changes = (
+        db.query(RepoChange, User.email)
+        .outerjoin(User, User.id == RepoChange.user_id)
+        .filter(RepoChange.repo_id == repo_id, RepoChange.seq > since)
+        .order_by(RepoChange.seq)
+        .limit(limit)
+        .all()
+    )
+    return changes, latest_seq(db, repo_id)
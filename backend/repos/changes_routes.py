@@ -0,0 +1,112 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import logging
+from database import SessionLocal
+from .changes import changes_since, hub, latest_seq, wait_for
+from .schemas import RepoChangeOut, RepoChangesOut
+from .utils import assert_read_perm, get_repo_role
+from auth.models import User
+from auth.utils import get_db, get_current_user
+from config import CHANGES_MAX_WAIT_SECONDS, CHANGES_POLL_SECONDS, MAX_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/repos/{repo_id}/changes", tags=["Repo Changes"])
+
+_STREAM_BATCH = 100
+
+
+def _change_out(change, user_email: Optional[str]) -> RepoChangeOut:
+    return RepoChangeOut(
+        seq=change.seq, kind=change.kind, filename=change.filename, version=change.version_number,
+        user_email=user_email, role=change.role, created_at=change.created_at,
+    )
+
+def _read_changes(db: Session, repo_id: int, since: int, limit: int) -> Tuple[List[RepoChangeOut], int]:
+    try:
+        changes, latest = changes_since(db, repo_id, since, limit)
+        return [_change_out(change, email) for change, email in changes], latest
+    finally:
+        # Waiting readers must not hold a pooled connection between reads
+        db.rollback()
+
+@router.get("", response_model=RepoChangesOut)
+async def list_changes(
+    repo_id: int,
+    since: int = Query(0, ge=0, description="Return changes with a greater sequence number"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    wait: float = Query(
+        0, ge=0, le=CHANGES_MAX_WAIT_SECONDS, description="Seconds to wait for a change if there is none yet"
+    ),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Changes after sequence number `since`, oldest first; long-polls when `wait` is given."""
+    await run_in_threadpool(assert_read_perm, db, repo_id, user)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        with hub.subscribe(repo_id) as woken:
+            changes, latest = await run_in_threadpool(_read_changes, db, repo_id, since, limit)
+            remaining = deadline - loop.time()
+            if changes or remaining <= 0:
+                break
+            await wait_for(woken, min(remaining, CHANGES_POLL_SECONDS))
+    return RepoChangesOut(
+        changes=changes,
+        next_since=changes[-1].seq if changes else since,
+        latest_seq=latest,
+    )
+
+def _poll_stream(repo_id: int, user_id: int, since: int) -> Optional[List[RepoChangeOut]]:
+    # A fresh session per poll: the stream outlives the request's session
+    db = SessionLocal()
+    try:
+        if get_repo_role(db, repo_id, user_id) is None:
+            return None  # Access revoked since the stream started
+        changes, _ = changes_since(db, repo_id, since, _STREAM_BATCH)
+        return [_change_out(change, email) for change, email in changes]
+    finally:
+        db.close()
+
+async def _events(repo_id: int, user_id: int, since: int) -> AsyncIterator[str]:
+    while True:
+        with hub.subscribe(repo_id) as woken:
+            changes = await run_in_threadpool(_poll_stream, repo_id, user_id, since)
+            if changes is None:
+                return
+            if not changes:
+                if not await wait_for(woken, CHANGES_POLL_SECONDS):
+                    yield ": keep-alive\n\n"
+                continue
+        for change in changes:
+            since = change.seq
+            yield f"id: {change.seq}\nevent: change\ndata: {change.model_dump_json()}\n\n"
+
+@router.get("/stream")
+async def stream_changes(
+    repo_id: int,
+    since: Optional[int] = Query(None, ge=0, description="Start after this sequence number; default is the latest"),
+    last_event_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Server-Sent Events stream of changes, resumable with the Last-Event-ID header."""
+    await run_in_threadpool(assert_read_perm, db, repo_id, user)
+    if last_event_id is not None:
+        if not last_event_id.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        since = int(last_event_id)
+    elif since is None:
+        since = await run_in_threadpool(latest_seq, db, repo_id)
+    user_id = user.id
+    await run_in_threadpool(db.close)
+    return StreamingResponse(
+        _events(repo_id, user_id, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,342 @@
+"""Optional delta/zstd encoding of older file versions (STORAGE_MODE=delta).
+
+Latest versions stay plain blobs; background jobs encode their
+predecessors, and reads reconstruct them through a bounded on-disk cache.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+import logging
+import os
+import shutil
+import threading
+from config import STORAGE_MODE, DELTA_KEYFRAME_INTERVAL, DELTA_MAX_SIZE, DELTA_CACHE_SIZE, DELTA_RAW_GRACE_SECONDS
+from .jobs import enqueue, job_handler
+from .models import Blob, RepoFile, RepoFileVersion
+from .storage import STORAGE_ROOT, backend, blob_key, encoded_blob_key, new_temp_path, release_blob_ref, remove_blob_file
+
+try:
+    import zstandard
+except ImportError:  # Only required when STORAGE_MODE=delta
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_ROOT = STORAGE_ROOT / "cache"
+
+_ZSTD_LEVEL = 12
+_MAX_WINDOW_SIZE = 1 << 31
+_MIN_SAVINGS = 0.05  # Keep a blob as-is unless encoding saves at least this fraction
+
+
+def delta_enabled() -> bool:
+    return STORAGE_MODE == "delta" and zstandard is not None
+
+
+class DiskLRUCache:
+    """Size-bounded LRU of files kept on disk, so responses can stream them."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._total = 0
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.root.iterdir(), key=lambda p: p.stat().st_mtime)
+        self._entries = OrderedDict((p.name, p.stat().st_size) for p in files)
+        self._total = sum(self._entries.values())
+
+    def get(self, name: str) -> Optional[Path]:
+        path = self.root / name
+        with self.lock:
+            self._load()
+            if name not in self._entries or not path.exists():
+                return None
+            self._entries.move_to_end(name)
+        return path
+
+    def put(self, name: str, tmp_path: Path) -> Path:
+        path = self.root / name
+        size = tmp_path.stat().st_size
+        with self.lock:
+            self._load()
+            os.replace(tmp_path, path)
+            self._total += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            # Readers that already opened an evicted file keep streaming it
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                (self.root / old_name).unlink(missing_ok=True)
+                self._total -= old_size
+        return path
+
+
+_cache = DiskLRUCache(CACHE_ROOT, DELTA_CACHE_SIZE)  # Reconstructed blobs, by sha256
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_lock = threading.Lock()
+
+def _build_lock(sha256: str) -> threading.Lock:
+    with _build_locks_lock:
+        return _build_locks.setdefault(sha256, threading.Lock())
+
+def _raw_dict(base: bytes):
+    return zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+def _open_if_stored(key: str):
+    try:
+        return backend.open_read(key)
+    except FileNotFoundError:
+        return None
+
+def _reconstruct(db: Session, sha256: str) -> Optional[Path]:
+    """Decode an encoded blob into a new temp file, or return None if it has no content."""
+    tmp_path = new_temp_path()
+    try:
+        src = _open_if_stored(encoded_blob_key(sha256, "zstd"))
+        if src is not None:
+            decompressor = zstandard.ZstdDecompressor(max_window_size=_MAX_WINDOW_SIZE)
+            with src, open(tmp_path, "wb") as dst:
+                decompressor.copy_stream(src, dst)
+            return tmp_path
+        src = _open_if_stored(encoded_blob_key(sha256, "delta"))
+        if src is not None:
+            with src:
+                delta = src.read()
+            blob = db.get(Blob, sha256)
+            base_path = blob_file(db, blob.base_sha256) if blob and blob.base_sha256 else None
+            if base_path is None:
+                logger.error("Delta base of blob %s is missing", sha256)
+                return None
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=_raw_dict(base_path.read_bytes()), max_window_size=_MAX_WINDOW_SIZE
+            )
+            tmp_path.write_bytes(decompressor.decompress(delta))
+            return tmp_path
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return None
+
+def reconstruct_to_temp(db: Session, sha256: str) -> Optional[Path]:
+    """Decode an encoded blob into a temp file owned by the caller, bypassing the cache."""
+    if zstandard is None:
+        return None
+    return _reconstruct(db, sha256)
+
+def blob_file(db: Session, sha256: str) -> Optional[Path]:
+    """Return a readable file with the full content of a blob, or None if it is missing.
+
+    Plain blobs of the local backend are returned directly. Encoded blobs, and
+    plain ones held by a remote backend, are reconstructed or fetched once and
+    then served from the cache.
+    """
+    key = blob_key(sha256)
+    local = backend.local_path(key)
+    if local is not None and local.exists():
+        return local
+    cached = _cache.get(sha256)
+    if cached is not None:
+        return cached
+    with _build_lock(sha256):
+        cached = _cache.get(sha256)
+        if cached is not None:
+            return cached
+        if local is None:
+            tmp_path = new_temp_path()
+            try:
+                backend.fetch(key, tmp_path)
+                return _cache.put(sha256, tmp_path)
+            except FileNotFoundError:
+                tmp_path.unlink(missing_ok=True)
+        if zstandard is None:
+            return None
+        tmp_path = _reconstruct(db, sha256)
+        if tmp_path is None:
+            return None
+        return _cache.put(sha256, tmp_path)
+
+def _chain_depth(db: Session, sha256: str, avoid: str) -> Optional[int]:
+    """Number of deltas applied to rebuild `sha256`, or None if its chain passes through `avoid`."""
+    depth = 0
+    while sha256:
+        if sha256 == avoid:
+            return None
+        base_sha256 = db.query(Blob.base_sha256).filter(Blob.sha256 == sha256).scalar()
+        if base_sha256 is None:
+            return depth
+        depth += 1
+        sha256 = base_sha256
+    return depth
+
+def _subtree_height(db: Session, sha256: str) -> int:
+    """Longest chain of deltas that currently resolve through `sha256`."""
+    children = [row[0] for row in db.query(Blob.sha256).filter(Blob.base_sha256 == sha256)]
+    return max((1 + _subtree_height(db, child) for child in children), default=0)
+
+def encode_blob(db: Session, sha256: str, base_sha256: Optional[str]) -> bool:
+    """Re-encode a plain blob as a delta against `base_sha256`, or as a zstd keyframe.
+
+    Blobs that are still the latest version of some file are left alone. The
+    plain copy is deleted by a later job, as readers may have just resolved it.
+    Returns True if the blob was re-encoded.
+    """
+    blob = db.get(Blob, sha256)
+    raw_key = blob_key(sha256)
+    if blob is None or blob.encoding is not None or not backend.exists(raw_key):
+        return False
+    size = blob.size
+    if db.query(RepoFile.id).filter(RepoFile.sha256 == sha256).first():
+        return False
+    raw = blob_file(db, sha256)
+    if raw is None:
+        return False
+
+    base_path = None
+    if base_sha256 and base_sha256 != sha256 and size <= DELTA_MAX_SIZE:
+        depth = _chain_depth(db, base_sha256, avoid=sha256)
+        if depth is not None and depth + 1 + _subtree_height(db, sha256) <= DELTA_KEYFRAME_INTERVAL:
+            base_path = blob_file(db, base_sha256)
+            if base_path is not None and base_path.stat().st_size > DELTA_MAX_SIZE:
+                base_path = None
+
+    encoding = "delta" if base_path is not None else "zstd"
+    tmp_path = new_temp_path()
+    try:
+        if base_path is not None:
+            base = base_path.read_bytes()
+            params = zstandard.ZstdCompressionParameters.from_level(
+                _ZSTD_LEVEL,
+                window_log=max(20, min(31, max(len(base), size).bit_length())),
+                enable_ldm=True,
+            )
+            compressor = zstandard.ZstdCompressor(dict_data=_raw_dict(base), compression_params=params)
+            tmp_path.write_bytes(compressor.compress(raw.read_bytes()))
+        else:
+            compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+            with open(raw, "rb") as src, open(tmp_path, "wb") as dst:
+                compressor.copy_stream(src, dst, size=size)
+        stored_size = tmp_path.stat().st_size
+        if stored_size > size * (1 - _MIN_SAVINGS):
+            tmp_path.unlink()
+            return False
+        encoded_key = encoded_blob_key(sha256, encoding)
+        backend.put_file(encoded_key, tmp_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    try:
+        blob.encoding = encoding
+        blob.stored_size = stored_size
+        if encoding == "delta":
+            blob.base_sha256 = base_sha256
+            db.execute(update(Blob).where(Blob.sha256 == base_sha256).values(ref_count=Blob.ref_count + 1))
+        enqueue(db, "drop_raw_blob", {"sha256": sha256}, key=f"drop_raw_blob:{sha256}", delay=DELTA_RAW_GRACE_SECONDS)
+        db.commit()
+    except Exception:
+        db.rollback()
+        backend.delete(encoded_key)
+        raise
+    logger.debug("Encoded blob %s as %s (%s -> %s bytes)", sha256, encoding, size, stored_size)
+    return True
+
+def _lock_blob(db: Session, sha256: str, *criteria) -> int:
+    # A no-op write, so concurrent writers of the row wait for this transaction
+    return db.execute(
+        update(Blob).where(Blob.sha256 == sha256, *criteria).values(encoding=Blob.encoding)
+    ).rowcount
+
+@job_handler("drop_raw_blob")
+def drop_raw_blob(db: Session, sha256: str):
+    """Delete the plain copy of a blob that is still encoded since `encode_blob` ran."""
+    if _lock_blob(db, sha256, Blob.encoding.isnot(None)):
+        backend.delete(blob_key(sha256))
+    db.commit()
+
+def inflate_blob(db: Session, sha256: str) -> bool:
+    """Turn an encoded blob back into a plain one, e.g. when it becomes a latest version again."""
+    blob = db.get(Blob, sha256)
+    if blob is None or blob.encoding is None:
+        return False
+    # Held until the commit, so a pending drop_raw_blob cannot delete a plain copy found here
+    _lock_blob(db, sha256)
+    db.refresh(blob)
+    if blob.encoding is None:
+        db.commit()
+        return False
+    raw_key = blob_key(sha256)
+    if not backend.exists(raw_key):
+        src = blob_file(db, sha256)
+        if src is None:
+            logger.error("Cannot inflate blob %s: content missing", sha256)
+            return False
+        tmp_path = new_temp_path()
+        shutil.copyfile(src, tmp_path)
+        backend.put_file(raw_key, tmp_path)
+
+    encoding, base_sha256 = blob.encoding, blob.base_sha256
+    blob.encoding = blob.base_sha256 = blob.stored_size = None
+    orphaned = release_blob_ref(db, base_sha256) if base_sha256 else []
+    db.commit()
+    backend.delete(encoded_blob_key(sha256, encoding))
+    for orphan_sha256 in orphaned:
+        remove_blob_file(db, orphan_sha256)
+    return True
+
+@job_handler("compact_file", concurrency=1)
+def compact_file(db: Session, file_id: int, full_history: bool = False):
+    """Keep a file's latest version plain and encode the ones before it.
+
+    By default only the previous version is encoded, which is all an upload
+    changes; `full_history` walks every version, newest first.
+    """
+    query = (
+        db.query(RepoFileVersion.sha256)
+        .filter(RepoFileVersion.file_id == file_id)
+        .order_by(RepoFileVersion.version_number.desc())
+    )
+    shas = [row[0] for row in (query.all() if full_history else query.limit(2).all())]
+    if not shas:
+        return
+    inflate_blob(db, shas[0])
+    for newer, older in zip(shas, shas[1:]):
+        if older != newer:
+            encode_blob(db, older, newer)
+
+def schedule_compaction(db: Session, repo_id: int, file_id: int):
+    """Queue a background compaction job without committing; a no-op unless STORAGE_MODE=delta."""
+    if delta_enabled():
+        enqueue(db, "compact_file", {"file_id": file_id}, repo_id=repo_id)
+
+def repo_storage_stats(db: Session, repo_id: int) -> dict:
+    """Logical vs. on-disk bytes for a repository's versions."""
+    logical = (
+        db.query(func.coalesce(func.sum(RepoFileVersion.size), 0))
+        .join(RepoFile, RepoFileVersion.file_id == RepoFile.id)
+        .filter(RepoFile.repo_id == repo_id)
+        .scalar()
+    )
+    repo_shas = (
+        select(RepoFileVersion.sha256)
+        .join(RepoFile, RepoFileVersion.file_id == RepoFile.id)
+        .where(RepoFile.repo_id == repo_id)
+    )
+    blobs, stored = (
+        db.query(func.count(Blob.sha256), func.coalesce(func.sum(func.coalesce(Blob.stored_size, Blob.size)), 0))
+        .filter(Blob.sha256.in_(repo_shas))
+        .one()
+    )
+    return {
+        "storage_mode": STORAGE_MODE if delta_enabled() else "full",
+        "logical_bytes": logical,
+        "stored_bytes": stored,
+        "blobs": blobs,
+        "savings_ratio": round(1 - stored / logical, 4) if logical else 0.0,
+    }
@@ -0,0 +1,125 @@
+"""Diffs between file versions: unified diffs for text, zstd patches for any content.
+
+A diff depends only on the two blobs, so results are built once per
+`(sha256_a, sha256_b, format)` and kept in a size-bounded LRU on disk, from
+where they are served like immutable files.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+import difflib
+import logging
+import threading
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from config import DELTA_MAX_SIZE, DIFF_CACHE_SIZE, DIFF_MAX_TEXT_BYTES
+from .delta import DiskLRUCache, blob_file, zstandard
+from .models import RepoFileVersion
+from .storage import STORAGE_ROOT, new_temp_path
+
+logger = logging.getLogger(__name__)
+
+DIFF_ROOT = STORAGE_ROOT / "diffs"
+EXTENSIONS = {"unified": "diff", "zstd": "zst"}
+
+_PATCH_LEVEL = 12
+_BINARY_SNIFF_BYTES = 8192
+
+_cache = DiskLRUCache(DIFF_ROOT, DIFF_CACHE_SIZE)
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_lock = threading.Lock()
+
+
+def _build_lock(name: str) -> threading.Lock:
+    with _build_locks_lock:
+        return _build_locks.setdefault(name, threading.Lock())
+
+def _content_path(db: Session, sha256: str) -> Path:
+    path = blob_file(db, sha256)
+    if path is None:
+        logger.warning("Versioned file %s missing on disk", sha256)
+        raise HTTPException(status_code=404, detail="Versioned file not found")
+    return path
+
+def _as_text(data: bytes) -> Optional[str]:
+    if b"\0" in data[:_BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def _unified_lines(old: str, new: str, old_label: str, new_label: str) -> Iterable[str]:
+    diff = difflib.unified_diff(old.splitlines(keepends=True), new.splitlines(keepends=True), old_label, new_label)
+    for line in diff:
+        # The last line of a file without a trailing newline, marked the way `diff` does
+        yield line if line.endswith("\n") else line + "\n\\ No newline at end of file\n"
+
+def _write_patch(base: bytes, target: Path, size: int, tmp_path: Path):
+    # The same frame as `zstd --patch-from`: the old version is a raw-content dictionary
+    params = zstandard.ZstdCompressionParameters.from_level(
+        _PATCH_LEVEL, window_log=max(20, min(31, max(len(base), size).bit_length())), enable_ldm=True
+    )
+    dictionary = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    compressor = zstandard.ZstdCompressor(dict_data=dictionary, compression_params=params)
+    with open(target, "rb") as src, open(tmp_path, "wb") as dst:
+        compressor.copy_stream(src, dst, size=size)
+
+def _build(name: str, write) -> Path:
+    tmp_path = new_temp_path()
+    try:
+        write(tmp_path)
+        return _cache.put(name, tmp_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def _unified_diff(db: Session, old: RepoFileVersion, new: RepoFileVersion, required: bool) -> Optional[Path]:
+    name = f"{old.sha256}-{new.sha256}.diff"
+    if max(old.size, new.size) > DIFF_MAX_TEXT_BYTES:
+        if required:
+            raise HTTPException(status_code=422, detail=f"Unified diffs need files up to {DIFF_MAX_TEXT_BYTES} bytes")
+        return None
+    with _build_lock(name):
+        cached = _cache.get(name)
+        if cached is not None:
+            return cached
+        old_text = _as_text(_content_path(db, old.sha256).read_bytes())
+        new_text = _as_text(_content_path(db, new.sha256).read_bytes())
+        if old_text is None or new_text is None:
+            if required:
+                raise HTTPException(status_code=422, detail="Unified diffs need UTF-8 text files")
+            return None
+
+        def write(tmp_path: Path):
+            with open(tmp_path, "w", encoding="utf-8", newline="") as fp:
+                fp.writelines(_unified_lines(old_text, new_text, old.sha256, new.sha256))
+
+        return _build(name, write)
+
+def _patch(db: Session, old: RepoFileVersion, new: RepoFileVersion) -> Path:
+    name = f"{old.sha256}-{new.sha256}.zst"
+    if zstandard is None:
+        raise HTTPException(status_code=501, detail="Binary patches need the zstandard package")
+    if old.size > DELTA_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f"Patches need a base version of up to {DELTA_MAX_SIZE} bytes")
+    with _build_lock(name):
+        cached = _cache.get(name)
+        if cached is not None:
+            return cached
+        # The base is held in memory as the dictionary; the new version is streamed through
+        base = _content_path(db, old.sha256).read_bytes()
+        target = _content_path(db, new.sha256)
+        return _build(name, lambda tmp_path: _write_patch(base, target, new.size, tmp_path))
+
+def version_diff(db: Session, old: RepoFileVersion, new: RepoFileVersion, format: str = "auto") -> Tuple[Path, str]:
+    """Return a file with the diff from `old` to `new`, and its format.
+
+    `format` is "unified", "zstd" or "auto" (unified when both versions are
+    small UTF-8 text, a zstd patch otherwise). Raises 422 when the requested
+    format cannot be built for these versions.
+    """
+    if format != "zstd":
+        path = _unified_diff(db, old, new, required=format == "unified")
+        if path is not None:
+            return path, "unified"
+    return _patch(db, old, new), "zstd"
@@ -0,0 +1,149 @@
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import quote
+import anyio
+import mimetypes
+import secrets
+from config import DOWNLOAD_CACHE_CONTROL
+from .storage import CHUNK_SIZE
+
+MAX_RANGES = 16  # More ranges than this are answered with the full body
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match."""
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a `bytes=` Range header into sorted, merged inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored (malformed, other unit, or
+    too many ranges) and an empty list when no range is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start_s, sep, end_s = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s:
+                start = int(start_s)
+                end = int(end_s) if end_s else max(start, size - 1)
+            else:
+                suffix = int(end_s)
+                if suffix == 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if start < 0 or end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+async def read_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as fp:
+        await fp.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = await fp.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+async def _read_multipart(path: Path, ranges: List[Tuple[int, int]], size: int, boundary: str, media_type: str) -> AsyncIterator[bytes]:
+    for start, end in ranges:
+        yield (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        async for data in read_range(path, start, end):
+            yield data
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+def media_type_for(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+def redirect_response(request: Request, url: str, etag_value: str) -> Response:
+    """Send the client to a presigned URL, still answering conditional requests here.
+
+    The redirect itself must not be cached because the URL expires.
+    """
+    etag = f'"{etag_value}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": DOWNLOAD_CACHE_CONTROL})
+    return RedirectResponse(url, status_code=307, headers={"ETag": etag, "Cache-Control": "no-store"})
+
+def immutable_file_response(request: Request, path: Path, etag_value: str, filename: str) -> Response:
+    """Serve immutable content with a strong ETag, conditional GET and byte ranges.
+
+    `etag_value` must change whenever the content does (the version's sha256);
+    the response is then cacheable for DOWNLOAD_CACHE_CONTROL.
+    """
+    etag = f'"{etag_value}"'
+    media_type = media_type_for(filename)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+    size = path.stat().st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    ranges = None
+    if range_header and (if_range is None or if_range.strip() == etag):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None:
+        if range_header:
+            # A Range we chose to ignore; FileResponse would try to honour it itself
+            headers["Content-Length"] = str(size)
+            return StreamingResponse(read_range(path, 0, size - 1), media_type=media_type, headers=headers)
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(read_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+    boundary = secrets.token_hex(16)
+    return StreamingResponse(
+        _read_multipart(path, ranges, size, boundary, media_type),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
@@ -1,103 +1,229 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File, status, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from pathlib import Path
-from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
-import shutil
-import hashlib
 import logging
-from .models import Repository, RepoFile, RepoFileVersion, RoleEnum
+from .models import Blob, Repository, RepoFile, RepoFileVersion
+from .batch import commit_batch, ingest_archive, ingest_files
+from .delta import blob_file, repo_storage_stats
+from .diffs import EXTENSIONS, version_diff
+from .downloads import immutable_file_response, media_type_for, redirect_response
+from .schemas import BatchUploadOut, UploadPrecheck, UploadPrecheckOut
+from .search import unindex_version
+from .snapshots import snapshot_entries, tar_size, tar_stream, zip_stream
+from .storage import backend, blob_key, blob_stored, release_blob_ref, schedule_blob_removal
+from .utils import (
+    assert_read_perm,
+    assert_write_perm,
+    assert_admin_perm,
+    upload_limit,
+    UploadLimit,
+    ingest_upload,
+    plan_version,
+    record_version,
+    remove_version,
+    readable_content_size,
+    decode_cursor,
+    paginate,
+    as_utc_naive,
+)
 from auth.models import User
-from auth.utils import get_db, get_current_user
-from typing import Optional
+from auth.utils import get_db, get_current_user, oauth2_scheme
+from config import MAX_PAGE_SIZE, MAX_BATCH_FILES, MAX_BATCH_BYTES
+from database import SessionLocal
+from ratelimit import DOWNLOAD, UPLOAD, limit_downloads, throttled
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Literal, Optional, Tuple
+from urllib.parse import quote
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/repos/{repo_id}/files", tags=["Repo Files"])
+# Boundaries, part headers and form fields sent around the file's content
+_MULTIPART_OVERHEAD = 64 * 1024
 
-STORAGE_ROOT = Path("storage").resolve()
+_capped: Dict[Callable, bool] = {}
 
-def safe_repo_path(repo_id: int, *parts: str) -> Path:
-    """Return a safe absolute path inside storage/repo_<id>/."""
-    base = STORAGE_ROOT / f"repo_{repo_id}"
-    full = base.joinpath(*parts).resolve()
-    if not str(full).startswith(str(base)):
-        raise HTTPException(status_code=400, detail="Invalid path")
-    return full
+def capped_upload(batch: bool = False):
+    """Mark an upload endpoint whose body is capped by `CappedUploadRoute`.
+
+    A single upload may carry one file of the upload limit; a batch may carry
+    up to MAX_BATCH_BYTES. The endpoint gets the resolved user and limit from
+    the `upload_user` and `capped_upload_limit` dependencies.
+    """
+    def mark(endpoint):
+        _capped[endpoint] = batch
+        return endpoint
+    return mark
+
+def _resolve_upload(repo_id: int, token: str) -> Tuple[User, UploadLimit]:
+    with SessionLocal() as db:
+        user = get_current_user(token, db)
+        assert_write_perm(db, repo_id, user)
+        return user, upload_limit(db, db.get(Repository, repo_id))
+
+
+class CappedUploadRoute(APIRoute):
+    """Route that enforces the upload limit of endpoints marked with `capped_upload` on the raw body.
+
+    FastAPI spools the whole multipart form to disk before dependencies or the
+    endpoint run, so the user, write permission and limit are resolved first.
+    An oversized upload is then refused by its Content-Length, or cut off once
+    it streams past the limit, before it fills the disk.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        batch = _capped.get(self.endpoint)
+        if batch is None:
+            return handler
+
+        async def capped(request: Request) -> Response:
+            try:
+                repo_id = int(request.path_params["repo_id"])
+            except ValueError:
+                return await handler(request)  # Rejected by path validation
+            token = await oauth2_scheme(request)
+            user, limit = await run_in_threadpool(_resolve_upload, repo_id, token)
+            request.state.upload_user, request.state.upload_limit = user, limit
+            if batch:
+                max_body = MAX_BATCH_BYTES
+                error = HTTPException(status_code=413, detail=f"Batch exceeds the limit of {MAX_BATCH_BYTES} bytes")
+            else:
+                max_body = limit.max_size + _MULTIPART_OVERHEAD
+                error = limit.error()
+            length = request.headers.get("content-length")
+            if length and length.isdigit() and int(length) > max_body:
+                raise error
+            received = 0
+
+            async def receive():
+                nonlocal received
+                message = await request.receive()
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    raise error
+                return message
+
+            return await handler(Request(request.scope, receive))
+
+        return capped
 
-def _get_repo_path(repo_id: int) -> Path:
-    """Get or create the repository's storage path."""
-    path = STORAGE_ROOT / f"repo_{repo_id}"
-    try:
-        path.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        logger.error(f"Failed to create storage path for repo {repo_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to create storage directory: {str(e)}")
-    return path
-
-def _assert_write_perm(repo: Repository, user: User):
-    """Check if user has write/admin permission."""
-    collab = next((c for c in repo.collaborators if c.user_id == user.id), None)
-    if collab is None or collab.role not in {RoleEnum.write, RoleEnum.admin}:
-        raise HTTPException(status_code=403, detail="Write permission required")
-
-def _assert_admin_perm(repo: Repository, user: User):
-    """Check if user has admin permission."""
-    collab = next((c for c in repo.collaborators if c.user_id == user.id), None)
-    if collab is None or collab.role != RoleEnum.admin:
-        raise HTTPException(status_code=403, detail="Admin permission required")
-
-def calc_sha256(upload: UploadFile) -> str:
-    """Calculate SHA256 hash of file contents."""
-    sha = hashlib.sha256()
-    for chunk in iter(lambda: upload.file.read(8192), b""):
-        sha.update(chunk)
-    upload.file.seek(0)
-    return sha.hexdigest()
+
+# The state is unset only when the path failed validation, which FastAPI reports before the endpoint runs
+def upload_user(request: Request, token: str = Depends(oauth2_scheme)) -> Optional[User]:
+    """The user `CappedUploadRoute` authenticated; `token` declares the bearer scheme in the docs."""
+    return getattr(request.state, "upload_user", None)
+
+def capped_upload_limit(request: Request) -> Optional[UploadLimit]:
+    """The upload limit `CappedUploadRoute` resolved for the repository."""
+    return getattr(request.state, "upload_limit", None)
+
+router = APIRouter(prefix="/repos/{repo_id}/files", tags=["Repo Files"], route_class=CappedUploadRoute)
 
 @router.get("/", summary="List files")
 def list_files(
     repo_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    prefix: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    """List all files in a repository with their latest version."""
-    logger.debug(f"Listing files for repo {repo_id} by user {user.email}")
-    repo = db.get(Repository, repo_id)
-    if not repo:
-        raise HTTPException(status_code=404, detail="Repository not found")
-    if not any(c.user_id == user.id for c in repo.collaborators):
-        raise HTTPException(status_code=403, detail="Permission denied")
+    """List files in a repository with their latest version, ordered by filename.
+
+    With `limit`, the `X-Next-Cursor` response header carries the cursor for
+    the next page. Size filters apply to the latest version.
+    """
+    logger.debug("Listing files for repo %s by user %s", repo_id, user.email)
+    assert_read_perm(db, repo_id, user)
+
+    # Version number and count are stored on the file; only the latest version is joined, by id
+    latest_size = RepoFileVersion.size
+    query = (
+        db.query(RepoFile, latest_size)
+        .outerjoin(RepoFileVersion, RepoFileVersion.id == RepoFile.latest_version_id)
+        .filter(RepoFile.repo_id == repo_id)
+    )
+    if prefix:
+        query = query.filter(RepoFile.filename.startswith(prefix, autoescape=True))
+    if uploaded_after:
+        query = query.filter(RepoFile.uploaded_at >= as_utc_naive(uploaded_after))
+    if uploaded_before:
+        query = query.filter(RepoFile.uploaded_at < as_utc_naive(uploaded_before))
+    if min_size is not None:
+        query = query.filter(latest_size >= min_size)
+    if max_size is not None:
+        query = query.filter(latest_size <= max_size)
+    if cursor:
+        after_name, after_id = decode_cursor(cursor, str, int)
+        query = query.filter(or_(
+            RepoFile.filename > after_name,
+            and_(RepoFile.filename == after_name, RepoFile.id > after_id),
+        ))
+    query = query.order_by(RepoFile.filename, RepoFile.id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    rows = paginate(query.all(), limit, response, key=lambda row: (row[0].filename, row[0].id))
     return [
         {
             "filename": f.filename,
             "uploaded_at": f.uploaded_at.isoformat(),
             "sha256": f.sha256,
-            "latest_version": max((v.version_number for v in f.versions), default=None),
-            "version_count": len(f.versions)
+            "size": size,
+            "latest_version": f.latest_version_number,
+            "version_count": f.version_count
         }
-        for f in repo.files
+        for f, size in rows
     ]
 
 @router.get("/versions/{filename}", summary="List file versions")
 def list_file_versions(
     repo_id: int,
     filename: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    """List all versions of a specific file."""
-    logger.debug(f"Listing versions for file '{filename}' in repo {repo_id} by user {user.email}")
-    repo = db.get(Repository, repo_id)
-    if not repo:
-        raise HTTPException(status_code=404, detail="Repository not found")
-    if not any(c.user_id == user.id for c in repo.collaborators):
-        raise HTTPException(status_code=403, detail="Permission denied")
+    """List versions of a specific file by version number, paginated like `list_files`."""
+    logger.debug("Listing versions for file '%s' in repo %s by user %s", filename, repo_id, user.email)
+    assert_read_perm(db, repo_id, user)
     repo_file = db.query(RepoFile).filter(RepoFile.repo_id == repo_id, RepoFile.filename == filename).first()
     if not repo_file:
         raise HTTPException(status_code=404, detail="File not found")
+
+    query = db.query(RepoFileVersion).filter(RepoFileVersion.file_id == repo_file.id)
+    if uploaded_after:
+        query = query.filter(RepoFileVersion.uploaded_at >= as_utc_naive(uploaded_after))
+    if uploaded_before:
+        query = query.filter(RepoFileVersion.uploaded_at < as_utc_naive(uploaded_before))
+    if min_size is not None:
+        query = query.filter(RepoFileVersion.size >= min_size)
+    if max_size is not None:
+        query = query.filter(RepoFileVersion.size <= max_size)
+    if cursor:
+        (after_version,) = decode_cursor(cursor, int)
+        query = query.filter(RepoFileVersion.version_number > after_version)
+    query = query.order_by(RepoFileVersion.version_number)
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    versions = paginate(query.all(), limit, response, key=lambda v: (v.version_number,))
     return [
         {
             "version_number": v.version_number,
@@ -106,24 +232,29 @@ def list_file_versions(
             "uploaded_at": v.uploaded_at.isoformat(),
             "version_description": v.version_description
         }
-        for v in sorted(repo_file.versions, key=lambda x: x.version_number)
+        for v in versions
     ]
 
-@router.get("/{filename}/version/{version_number}", response_class=FileResponse, summary="Download specific file version")
+@router.get(
+    "/{filename}/version/{version_number}",
+    response_class=FileResponse,
+    summary="Download specific file version",
+    dependencies=[Depends(limit_downloads)],
+)
+@throttled(DOWNLOAD)
 def download_file_version(
+    request: Request,
     repo_id: int,
     filename: str,
     version_number: int,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    """Download a specific version of a file."""
-    logger.debug(f"Downloading version {version_number} of file '{filename}' from repo {repo_id} by user {user.email}")
-    repo = db.get(Repository, repo_id)
-    if not repo:
-        raise HTTPException(status_code=404, detail="Repository not found")
-    if not any(c.user_id == user.id for c in repo.collaborators):
-        raise HTTPException(status_code=403, detail="Permission denied")
+    """Download a specific version of a file, with ETag, conditional GET and Range support."""
+    logger.debug(
+        "Downloading version %s of file '%s' from repo %s by user %s", version_number, filename, repo_id, user.email
+    )
+    assert_read_perm(db, repo_id, user)
     repo_file = db.query(RepoFile).filter(RepoFile.repo_id == repo_id, RepoFile.filename == filename).first()
     if not repo_file:
         raise HTTPException(status_code=404, detail="File not found")
@@ -133,92 +264,100 @@ def download_file_version(
     ).first()
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
-    file_abs = safe_repo_path(repo_id, f"{filename}.v{version_number}")
-    if not file_abs.exists():
-        logger.warning(f"Versioned file {file_abs} missing on disk")
+    blob = db.get(Blob, version.sha256)
+    if blob is not None and blob.encoding is None:
+        # Remote backends can serve plain blobs directly
+        url = backend.presigned_url(blob_key(version.sha256), filename, media_type_for(filename))
+        if url:
+            return redirect_response(request, url, version.sha256)
+    file_abs = blob_file(db, version.sha256)
+    if file_abs is None:
+        logger.warning("Versioned file %s missing on disk", version.sha256)
         raise HTTPException(status_code=404, detail="Versioned file not found")
-    return FileResponse(file_abs)
+    return immutable_file_response(request, file_abs, version.sha256, filename)
+
+@router.get("/{filename}/diff", summary="Diff two versions of a file", dependencies=[Depends(limit_downloads)])
+@throttled(DOWNLOAD)
+def diff_file_versions(
+    request: Request,
+    repo_id: int,
+    filename: str,
+    from_version: int = Query(..., ge=1),
+    to_version: Optional[int] = Query(None, ge=1),
+    format: Literal["auto", "unified", "zstd"] = "auto",
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Diff from one version of a file to another, by default the latest.
+
+    Text files get a unified diff; other files (or `format=zstd`) a patch
+    applied with `zstd -d --long=31 --patch-from=<old file> <patch> -o <new file>`.
+    The chosen format is sent in `X-Diff-Format`.
+    """
+    assert_read_perm(db, repo_id, user)
+    repo_file = db.query(RepoFile).filter(RepoFile.repo_id == repo_id, RepoFile.filename == filename).first()
+    if not repo_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    versions = {
+        version.version_number: version
+        for version in db.query(RepoFileVersion).filter(
+            RepoFileVersion.file_id == repo_file.id,
+            RepoFileVersion.version_number.in_([from_version, to_version or repo_file.latest_version_number]),
+        )
+    }
+    old = versions.get(from_version)
+    new = versions.get(to_version or repo_file.latest_version_number)
+    if old is None or new is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    path, diff_format = version_diff(db, old, new, format)
+    name = f"{filename}.v{old.version_number}-v{new.version_number}.{EXTENSIONS[diff_format]}"
+    response = immutable_file_response(request, path, f"{old.sha256}-{new.sha256}-{diff_format}", name)
+    response.headers["X-Diff-Format"] = diff_format
+    return response
 
 @router.post("/upload", status_code=status.HTTP_201_CREATED, summary="Upload file with versioning")
-def upload_file(
+@throttled(UPLOAD)
+@capped_upload()
+async def upload_file(
     repo_id: int,
     upload: UploadFile = File(...),
     version_description: str = Form(default=""),
     version_number: Optional[int] = Form(default=None),
+    sha256: Optional[str] = Form(default=None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(upload_user),
+    limit: UploadLimit = Depends(capped_upload_limit),
 ):
-    """Upload a file, creating a new version if it exists, with optional custom version number."""
-    logger.debug(f"Uploading file '{upload.filename}' to repo {repo_id} by user {current_user.email}")
-    repo = db.get(Repository, repo_id)
-    if not repo:
-        raise HTTPException(status_code=404, detail="Repository not found")
-    _assert_write_perm(repo, current_user)
+    """Upload a file, creating a new version if it exists, with optional custom version number.
 
-    filename = secure_filename(upload.filename or "")
-    if not filename:
-        raise HTTPException(status_code=400, detail="Invalid filename")
-    if upload.size is None or upload.size == 0:
-        raise HTTPException(status_code=400, detail="Empty file not allowed")
-
-    repo_dir = _get_repo_path(repo_id)
-    sha256 = calc_sha256(upload)
-    upload_size = upload.size
-    upload.file.seek(0)
-
-    repo_file = db.query(RepoFile).filter(RepoFile.repo_id == repo_id, RepoFile.filename == filename).first()
-    last_version = db.query(RepoFileVersion).filter(
-        RepoFileVersion.file_id == repo_file.id if repo_file else None
-    ).order_by(RepoFileVersion.version_number.desc()).first()
-
-    # Determine version number
-    default_version = 1 if last_version is None else last_version.version_number + 1
-    final_version = version_number if version_number is not None else default_version
-
-    # Validate user-specified version
-    if version_number is not None:
-        if version_number <= 0:
-            raise HTTPException(status_code=400, detail="Version number must be positive")
-        if last_version and version_number <= last_version.version_number:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Version number must be greater than the latest version ({last_version.version_number})"
-            )
+    A declared `sha256` (e.g. from `/precheck`) is verified against the received content.
+    """
+    expected_sha256 = sha256.lower() if sha256 else None
+    logger.debug("Uploading file '%s' to repo %s by user %s", upload.filename, repo_id, current_user.email)
+    # Database work runs in short threadpool hops; the body is streamed asynchronously
+    filename, repo_file, last_version, final_version = await run_in_threadpool(
+        _prepare_upload, db, repo_id, upload, version_number
+    )
 
+    tmp_path = None
     try:
-        if repo_file is None:
-            repo_file = RepoFile(
-                repo_id=repo_id,
-                filename=filename,
-                sha256=sha256,
-                uploaded_at=datetime.now(timezone.utc)
-            )
-            db.add(repo_file)
-            db.flush()
-        else:
-            if last_version and last_version.sha256 == sha256:
-                raise HTTPException(status_code=409, detail="Identical file already uploaded as latest version")
-            repo_file.sha256 = sha256
-            repo_file.uploaded_at = datetime.now(timezone.utc)
-            db.add(repo_file)
-
-        versioned_name = f"{filename}.v{final_version}"
-        dest_path = repo_dir / versioned_name
-        with open(dest_path, "wb") as fp:
-            shutil.copyfileobj(upload.file, fp)
-
-        db.add(RepoFileVersion(
-            file_id=repo_file.id,
-            version_number=final_version,
-            sha256=sha256,
-            size=upload_size,
-            uploaded_at=datetime.now(timezone.utc),
-            version_description=version_description[:255] if version_description else None
-        ))
-        db.commit()
+        tmp_path, sha256, upload_size = await ingest_upload(upload, limit)
+        if expected_sha256 and expected_sha256 != sha256:
+            raise HTTPException(status_code=422, detail="Uploaded content does not match the declared sha256")
+
+        await run_in_threadpool(
+            _commit_upload, db, repo_id, filename, repo_file, last_version, final_version,
+            tmp_path, sha256, upload_size, version_description,
+        )
+        tmp_path = None
     except Exception as e:
-        db.rollback()
-        logger.error(f"Failed to upload file '{filename}' to repo {repo_id}: {str(e)}")
+        await run_in_threadpool(db.rollback)
+        if tmp_path is not None:
+            tmp_path.unlink(missing_ok=True)
+        if isinstance(e, HTTPException):
+            raise
+        logger.error("Failed to upload file '%s' to repo %s: %s", filename, repo_id, e)
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
     return {
@@ -229,6 +368,102 @@ def upload_file(
         "size": upload_size
     }
 
+def _prepare_upload(db: Session, repo_id: int, upload: UploadFile, version_number: Optional[int]):
+    """Check the filename and plan the version number before the file is ingested."""
+    filename = secure_filename(upload.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    repo_file, last_version, final_version = plan_version(db, repo_id, filename, version_number)
+    return filename, repo_file, last_version, final_version
+
+def _commit_upload(db: Session, *args) -> RepoFileVersion:
+    version, _ = record_version(db, *args)
+    db.commit()
+    return version
+
+@router.post("/precheck", response_model=UploadPrecheckOut, summary="Create a version without uploading known content")
+def precheck_upload(
+    repo_id: int,
+    body: UploadPrecheck,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Offer a file by SHA256 and size before uploading it.
+
+    If the content is identical to the latest version nothing changes. If it is
+    already stored in a repository the user can read, the new version is
+    linked to it (201) and no body needs to be sent. Otherwise the answer is
+    `upload_required`: upload it with the same `sha256`.
+    """
+    assert_write_perm(db, repo_id, current_user)
+    filename = secure_filename(body.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if body.size <= 0:
+        raise HTTPException(status_code=400, detail="Empty file not allowed")
+    limit = upload_limit(db, db.get(Repository, repo_id))
+    if body.size > limit.max_size:
+        raise limit.error()
+
+    sha256 = body.sha256.lower()
+    result = UploadPrecheckOut(status="upload_required", filename=filename, sha256=sha256, size=body.size)
+    repo_file, last_version, final_version = plan_version(db, repo_id, filename, body.version_number)
+    if last_version and last_version.sha256 == sha256:
+        result.status, result.version = "unchanged", last_version.version_number
+        return result
+    known_size = readable_content_size(db, current_user.id, sha256)
+    if known_size is None:
+        return result
+    if known_size != body.size:
+        raise HTTPException(status_code=400, detail="Size does not match the stored content with this sha256")
+
+    try:
+        _commit_upload(
+            db, repo_id, filename, repo_file, last_version, final_version,
+            None, sha256, body.size, body.version_description,
+        )
+    except Exception:
+        db.rollback()
+        raise
+    logger.debug("Linked '%s' version %s in repo %s to stored content %s", filename, final_version, repo_id, sha256)
+    result.status, result.version = "linked", final_version
+    response.status_code = status.HTTP_201_CREATED
+    return result
+
+@router.post("/batch", response_model=BatchUploadOut, summary="Upload many files or an archive")
+@throttled(UPLOAD)
+@capped_upload(batch=True)
+async def upload_batch(
+    repo_id: int,
+    files: Optional[List[UploadFile]] = File(default=None),
+    archive: Optional[UploadFile] = File(default=None),
+    version_description: str = Form(default=""),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(upload_user),
+    limit: UploadLimit = Depends(capped_upload_limit),
+):
+    """Upload several files, or a zip/tar archive that is unpacked, as new versions in one transaction."""
+    if bool(files) == (archive is not None):
+        raise HTTPException(status_code=400, detail="Send either `files` or a single `archive`")
+    if files and len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+
+    items = await (ingest_archive(archive, limit) if archive is not None else ingest_files(files, limit))
+    try:
+        results = await run_in_threadpool(commit_batch, db, repo_id, items, version_description)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to upload batch of %s files to repo %s: %s", len(items), repo_id, e)
+        raise HTTPException(status_code=500, detail=f"Batch upload failed: {str(e)}")
+
+    counts = Counter(result.status for result in results)
+    logger.debug("Batch upload to repo %s: %s", repo_id, dict(counts))
+    return BatchUploadOut(
+        created=counts["created"], skipped=counts["skipped"], rejected=counts["rejected"], files=results
+    )
+
 @router.delete("/{filename}/version/{version_number}", summary="Delete specific file version")
 def delete_file_version(
     repo_id: int,
@@ -238,11 +473,10 @@ def delete_file_version(
     user: User = Depends(get_current_user),
 ):
     """Delete a specific version of a file (admin only)."""
-    logger.debug(f"Deleting version {version_number} of file '{filename}' in repo {repo_id} by user {user.email}")
-    repo = db.get(Repository, repo_id)
-    if not repo:
-        raise HTTPException(status_code=404, detail="Repository not found")
-    _assert_admin_perm(repo, user)
+    logger.debug(
+        "Deleting version %s of file '%s' in repo %s by user %s", version_number, filename, repo_id, user.email
+    )
+    assert_admin_perm(db, repo_id, user)
     repo_file = db.query(RepoFile).filter(RepoFile.repo_id == repo_id, RepoFile.filename == filename).first()
     if not repo_file:
         raise HTTPException(status_code=404, detail="File not found")
@@ -252,32 +486,60 @@ def delete_file_version(
     ).first()
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
+    sha256 = version.sha256
     try:
-        file_abs = safe_repo_path(repo_id, f"{filename}.v{version_number}")
-        if file_abs.exists():
-            file_abs.unlink()
-        else:
-            logger.warning(f"Versioned file {file_abs} not found on disk")
-
-        db.delete(version)
-        db.flush()
-
-        remaining_versions = db.query(RepoFileVersion).filter(RepoFileVersion.file_id == repo_file.id).all()
-        if not remaining_versions:
-            db.delete(repo_file)
-        else:
-            latest_version = max(remaining_versions, key=lambda x: x.version_number)
-            repo_file.sha256 = latest_version.sha256
-            repo_file.uploaded_at = latest_version.uploaded_at
-            db.add(repo_file)
-
+        schedule_blob_removal(db, release_blob_ref(db, sha256), repo_id)
+        unindex_version(db, version.id)
+        remove_version(db, repo_file, version)
         db.commit()
     except Exception as e:
         db.rollback()
-        logger.error(f"Failed to delete version {version_number} of file '{filename}' in repo {repo_id}: {str(e)}")
+        logger.error(
+            "Failed to delete version %s of file '%s' in repo %s: %s", version_number, filename, repo_id, e
+        )
         raise HTTPException(status_code=500, detail=f"Version deletion failed: {str(e)}")
     return {"message": f"Version {version_number} of file '{filename}' deleted"}
 
+@router.get("/archive", summary="Download a repository snapshot", dependencies=[Depends(limit_downloads)])
+@throttled(DOWNLOAD)
+def download_archive(
+    repo_id: int,
+    format: Literal["zip", "tar"] = "zip",
+    at: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Stream a zip or tar of every file at its latest version, or at the version current at `at`."""
+    assert_read_perm(db, repo_id, user)
+    repo = db.get(Repository, repo_id)
+    entries = snapshot_entries(db, repo_id, as_utc_naive(at))
+    # One round trip per file is too slow on a remote backend; there a missing blob ends the stream instead
+    missing = [] if backend.remote else [entry.filename for entry in entries if not blob_stored(entry.sha256)]
+    if missing:
+        logger.error(
+            "Archive of repo %s is missing content for %s files, e.g. '%s'", repo_id, len(missing), missing[0]
+        )
+        raise HTTPException(status_code=500, detail=f"Stored content for '{missing[0]}' is missing")
+
+    name = secure_filename(repo.name) or f"repo_{repo_id}"
+    if at is not None:
+        name += f"-{as_utc_naive(at):%Y%m%dT%H%M%S}"
+    headers = {"Content-Disposition": f"attachment; filename*=utf-8''{quote(name)}.{format}"}
+    if format == "tar":
+        headers["Content-Length"] = str(tar_size(entries))
+        return StreamingResponse(tar_stream(entries), media_type="application/x-tar", headers=headers)
+    return StreamingResponse(zip_stream(entries), media_type="application/zip", headers=headers)
+
+@router.get("/storage", summary="Storage usage and savings")
+def get_storage_stats(
+    repo_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Report logical vs. stored bytes and the dedup/delta savings ratio for a repository."""
+    assert_read_perm(db, repo_id, user)
+    return repo_storage_stats(db, repo_id)
+
 @router.get("/role", summary="Get user role for repository")
 def get_user_role(
     repo_id: int,
@@ -285,11 +547,6 @@ def get_user_role(
     user: User = Depends(get_current_user),
 ):
     """Get the role of the current user for the specified repository."""
-    logger.debug(f"Fetching role for user {user.email} in repo {repo_id}")
-    repo = db.get(Repository, repo_id)
-    if not repo:
-        raise HTTPException(status_code=404, detail="Repository not found")
-    collab = next((c for c in repo.collaborators if c.user_id == user.id), None)
-    if not collab:
-        raise HTTPException(status_code=403, detail="Permission denied")
-    return {"role": collab.role.value}
+    logger.debug("Fetching role for user %s in repo %s", user.email, repo_id)
+    role = assert_read_perm(db, repo_id, user)
+    return {"role": role.value}
@@ -0,0 +1,247 @@
+"""Persisted background jobs for work that should not delay a response.
+
+Jobs are rows in the `jobs` table, added in the same transaction as the change
+that needs them, so a job exists exactly when its upload or deletion commits.
+Each process runs JOB_WORKERS threads that claim due jobs with a conditional
+UPDATE and a lease, so several processes can share the table, and a job whose
+worker died is run again once its lease expires. Failed runs are retried with
+exponential backoff until the handler's attempt limit.
+
+Handlers must be idempotent: a job can run more than once.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+import json
+import logging
+import threading
+import time
+from sqlalchemy import and_, event, or_, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from config import (
+    JOB_WORKERS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_SECONDS,
+    JOB_RETRY_MAX_SECONDS,
+    JOB_POLL_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_RETENTION_SECONDS,
+)
+from metrics import record_job
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+_ENQUEUED_KEY = "jobs_enqueued"
+_PRUNE_INTERVAL_SECONDS = 3600
+_MAX_ERROR_LENGTH = 2000
+
+
+@dataclass
+class JobHandler:
+    run: Callable[..., None]  # Called as run(db, **payload)
+    max_attempts: int
+    concurrency: Optional[int]  # Concurrent runs per process; None = up to JOB_WORKERS
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, max_attempts: int = JOB_MAX_ATTEMPTS, concurrency: Optional[int] = None):
+    """Register a function as the handler of a job kind; returns it unchanged."""
+    def register(fn):
+        _handlers[kind] = JobHandler(fn, max_attempts, concurrency)
+        return fn
+    return register
+
+def _now() -> datetime:
+    # Naive UTC, like the other stored datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    key: Optional[str] = None,
+    repo_id: Optional[int] = None,
+    delay: float = 0,
+) -> Job:
+    """Add a job without committing; workers are woken once the transaction commits.
+
+    While a job with the same `key` is still queued, that job is returned instead.
+    A `delay` in seconds postpones the first run.
+    """
+    if key is not None:
+        existing = db.query(Job).filter(Job.key == key, Job.status == "queued").first()
+        if existing is not None:
+            return existing
+    now = _now()
+    job = Job(
+        kind=kind, payload=json.dumps(payload or {}), key=key, repo_id=repo_id, status="queued",
+        max_attempts=_handlers[kind].max_attempts, run_after=now + timedelta(seconds=delay),
+        created_at=now, updated_at=now,
+    )
+    db.add(job)
+    db.flush()
+    db.info[_ENQUEUED_KEY] = True
+    return job
+
+def _backoff(attempts: int) -> float:
+    return min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+
+_claim_lock = threading.Lock()
+_running: Counter = Counter()
+
+def _claimable(now: datetime, kinds: List[str]):
+    return and_(Job.kind.in_(kinds), or_(
+        and_(Job.status == "queued", Job.run_after <= now),
+        and_(Job.status == "running", Job.lease_until < now),
+    ))
+
+def _claim(db: Session) -> Optional[Job]:
+    # Kinds at their concurrency limit in this process wait for a later claim
+    kinds = [
+        kind for kind, handler in _handlers.items()
+        if handler.concurrency is None or _running[kind] < handler.concurrency
+    ]
+    if not kinds:
+        return None
+    now = _now()
+    job_id = (
+        db.query(Job.id).filter(_claimable(now, kinds))
+        .order_by(Job.run_after, Job.id).limit(1).scalar()
+    )
+    if job_id is None:
+        db.rollback()
+        return None
+    # Conditional, so of several processes racing for the job only one gets it
+    claimed = db.execute(
+        update(Job).where(Job.id == job_id, _claimable(now, kinds))
+        .values(
+            status="running", attempts=Job.attempts + 1,
+            lease_until=now + timedelta(seconds=JOB_LEASE_SECONDS), updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return db.get(Job, job_id) if claimed else None
+
+def _record_failure(db: Session, job_id: int, error: Exception) -> str:
+    job = db.get(Job, job_id)
+    now = _now()
+    job.last_error = f"{type(error).__name__}: {error}"[:_MAX_ERROR_LENGTH]
+    job.updated_at = now
+    job.lease_until = None
+    if job.attempts >= job.max_attempts:
+        job.status, job.finished_at, outcome = "failed", now, "failed"
+    else:
+        job.status, job.run_after, outcome = "queued", now + timedelta(seconds=_backoff(job.attempts)), "retried"
+    db.commit()
+    return outcome
+
+def run_next_job(db: Session) -> bool:
+    """Claim and run one due job. Returns False if there was none."""
+    with _claim_lock:
+        job = _claim(db)
+        if job is None:
+            return False
+        _running[job.kind] += 1
+    kind, job_id = job.kind, job.id
+    started = time.monotonic()
+    try:
+        _handlers[kind].run(db, **json.loads(job.payload))
+        db.execute(
+            update(Job).where(Job.id == job_id, Job.status == "running")
+            .values(status="succeeded", lease_until=None, updated_at=_now(), finished_at=_now())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        outcome = "succeeded"
+    except Exception as e:
+        db.rollback()
+        outcome = _record_failure(db, job_id, e)
+        logger.warning("Job %s (%s) %s: %s", job_id, kind, outcome, e, exc_info=outcome == "failed")
+    finally:
+        with _claim_lock:
+            _running[kind] -= 1
+    record_job(kind, outcome, time.monotonic() - started)
+    return True
+
+def prune_jobs(db: Session) -> int:
+    """Delete jobs that finished more than JOB_RETENTION_SECONDS ago. Returns the number deleted."""
+    cutoff = _now() - timedelta(seconds=JOB_RETENTION_SECONDS)
+    deleted = db.query(Job).filter(Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+_stop = threading.Event()
+_wakeup = threading.Condition()
+_generation = 0
+_threads: List[threading.Thread] = []
+
+def _notify():
+    global _generation
+    with _wakeup:
+        _generation += 1
+        _wakeup.notify_all()
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session: Session):
+    if session.info.pop(_ENQUEUED_KEY, False):
+        _notify()
+
+@event.listens_for(Session, "after_rollback")
+def _drop_enqueued(session: Session):
+    session.info.pop(_ENQUEUED_KEY, None)
+
+def _run_worker(prunes: bool):
+    next_prune = time.monotonic()
+    while not _stop.is_set():
+        with _wakeup:
+            seen = _generation
+        db = SessionLocal()
+        try:
+            ran = run_next_job(db)
+            if not ran and prunes and time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + _PRUNE_INTERVAL_SECONDS
+                pruned = prune_jobs(db)
+                if pruned:
+                    logger.info("Deleted %s finished background jobs", pruned)
+        except Exception:
+            db.rollback()
+            ran = False
+            logger.exception("Background job worker failed")
+        finally:
+            db.close()
+        if not ran:
+            # Woken by commits in this process; the timeout picks up retries and other processes' jobs
+            with _wakeup:
+                _wakeup.wait_for(lambda: _generation != seen or _stop.is_set(), JOB_POLL_SECONDS)
+
+def start_job_workers(count: int = JOB_WORKERS):
+    """Start the worker threads of this process."""
+    if _threads:
+        return
+    _stop.clear()
+    for n in range(count):
+        thread = threading.Thread(target=_run_worker, args=(n == 0,), name=f"job-worker-{n}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+
+def stop_job_workers():
+    """Stop the worker threads, letting running jobs finish for a few seconds."""
+    _stop.set()
+    _notify()
+    for thread in _threads:
+        thread.join(timeout=10)
+    _threads.clear()
+
+def run_pending_jobs(db: Session) -> int:
+    """Run due jobs in this thread until none is left. Returns the number run."""
+    count = 0
+    while run_next_job(db):
+        count += 1
+    return count
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import json
+from .jobs import JOB_STATUSES
+from .models import Job
+from .schemas import JobOut
+from .utils import assert_read_perm
+from auth.models import User
+from auth.utils import get_db, get_current_user
+from config import MAX_PAGE_SIZE
+
+router = APIRouter(prefix="/repos/{repo_id}/jobs", tags=["Repo Jobs"])
+
+
+def _job_out(job: Job) -> JobOut:
+    return JobOut(
+        id=job.id, kind=job.kind, payload=json.loads(job.payload), status=job.status,
+        attempts=job.attempts, max_attempts=job.max_attempts, last_error=job.last_error,
+        created_at=job.created_at, updated_at=job.updated_at, run_after=job.run_after, finished_at=job.finished_at,
+    )
+
+@router.get("", response_model=List[JobOut])
+def list_jobs(
+    repo_id: int,
+    status: Optional[str] = Query(None, pattern="^(%s)$" % "|".join(JOB_STATUSES)),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Background jobs queued for the repository, newest first."""
+    assert_read_perm(db, repo_id, user)
+    query = db.query(Job).filter(Job.repo_id == repo_id)
+    if status is not None:
+        query = query.filter(Job.status == status)
+    return [_job_out(job) for job in query.order_by(Job.id.desc()).limit(limit)]
+
+@router.get("/{job_id}", response_model=JobOut)
+def get_job(
+    repo_id: int,
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    assert_read_perm(db, repo_id, user)
+    job = db.get(Job, job_id)
+    if job is None or job.repo_id != repo_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_out(job)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum as SqlEnum, BigInteger, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum as SqlEnum, BigInteger, Text, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from enum import Enum
@@ -15,6 +15,12 @@ class Repository(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    max_file_size = Column(BigInteger, nullable=True)  # Overrides MAX_UPLOAD_SIZE when set
+    quota_bytes = Column(BigInteger, nullable=True)  # Can only tighten REPO_QUOTA_BYTES
+    # Bytes and number of all file versions, kept up to date with them. NULL until backfilled.
+    used_bytes = Column(BigInteger, nullable=True, default=0)
+    version_count = Column(Integer, nullable=True, default=0)
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")  # Seq of the latest RepoChange
     owner = relationship("User", back_populates="repositories")
     collaborators = relationship("Collaborator", back_populates="repository", cascade="all, delete-orphan")
     files = relationship("RepoFile", back_populates="repo", cascade="all, delete-orphan")
@@ -31,6 +37,10 @@ class Collaborator(Base):
     repository = relationship("Repository", back_populates="collaborators")
     user = relationship("User", back_populates="collaborations")
 
+    __table_args__ = (
+        Index("ix_repo_collaborators_user_repo", "user_id", "repo_id"),
+    )
+
     def __repr__(self):
         return f"<Collaborator(id={self.id}, repo_id={self.repo_id}, user_id={self.user_id}, role='{self.role}')>"
 
@@ -41,9 +51,21 @@ class RepoFile(Base):
     filename = Column(String, nullable=False)
     sha256 = Column(String, nullable=True)  # Latest version's SHA256
     uploaded_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    # Denormalized from repo_file_versions, updated in the same transaction as the versions. Not a
+    # foreign key: it would form a cycle with repo_file_versions.file_id.
+    latest_version_id = Column(Integer, nullable=True)
+    latest_version_number = Column(Integer, nullable=True)
+    version_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_size = Column(BigInteger, nullable=False, default=0, server_default="0")  # Bytes across all versions
     repo = relationship("Repository", back_populates="files")
     versions = relationship("RepoFileVersion", back_populates="file", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_repo_files_repo_filename", "repo_id", "filename"),
+        Index("ix_repo_files_repo_uploaded_at", "repo_id", "uploaded_at"),
+        Index("ix_repo_files_sha256", "sha256"),
+    )
+
     def __repr__(self):
         return f"<RepoFile(id={self.id}, repo_id={self.repo_id}, filename='{self.filename}')>"
 
@@ -58,5 +80,103 @@ class RepoFileVersion(Base):
     version_description = Column(Text, nullable=True)  # Store version description
     file = relationship("RepoFile", back_populates="versions")
 
+    __table_args__ = (
+        Index("ix_repo_file_versions_file_uploaded_at", "file_id", "uploaded_at"),
+        # Concurrent uploads of one file cannot both claim the same version number
+        Index("ux_repo_file_versions_file_version", "file_id", "version_number", unique=True),
+        # Finds existing copies of content for upload prechecks
+        Index("ix_repo_file_versions_sha256", "sha256"),
+    )
+
     def __repr__(self):
         return f"<RepoFileVersion(id={self.id}, file_id={self.file_id}, version={self.version_number})>"
+
+class RepoChange(Base):
+    """Entry of a repository's change feed, numbered by `seq` without gaps in commit order."""
+    __tablename__ = "repo_changes"
+    id = Column(Integer, primary_key=True)
+    repo_id = Column(Integer, ForeignKey("repositories.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    kind = Column(String(32), nullable=False)  # "version_added", "version_deleted", "file_deleted" or "collaborator_added"
+    filename = Column(String, nullable=True)
+    version_number = Column(Integer, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # The collaborator, for collaborator changes
+    role = Column(SqlEnum(RoleEnum), nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        Index("ux_repo_changes_repo_seq", "repo_id", "seq", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<RepoChange(repo_id={self.repo_id}, seq={self.seq}, kind='{self.kind}')>"
+
+class Job(Base):
+    """Persisted background job, run by the worker pool in repos/jobs.py."""
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON keyword arguments for the handler
+    key = Column(String, nullable=True)  # A job is not queued twice while one with the same key is waiting
+    repo_id = Column(Integer, ForeignKey("repositories.id"), nullable=True, index=True)
+    status = Column(String(16), nullable=False, default="queued")  # "queued", "running", "succeeded" or "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime, nullable=False)
+    lease_until = Column(DateTime, nullable=True)  # A running job is picked up again once this has passed
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    finished_at = Column(DateTime, nullable=True, index=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_key_status", "key", "status"),
+    )
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind='{self.kind}', status='{self.status}')>"
+
+class Blob(Base):
+    """Content-addressed object shared by every version with the same SHA256."""
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # Versions plus deltas using this blob as base
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    encoding = Column(String(16), nullable=True)  # None = stored as-is, "zstd" or "delta"
+    base_sha256 = Column(String(64), nullable=True, index=True)  # Delta base when encoding == "delta"
+    stored_size = Column(BigInteger, nullable=True)  # Bytes on disk when encoded
+
+    def __repr__(self):
+        return f"<Blob(sha256='{self.sha256}', size={self.size}, refs={self.ref_count})>"
+
+class UploadSession(Base):
+    """Resumable chunked upload in progress; content is assembled in storage/tmp."""
+    __tablename__ = "upload_sessions"
+    id = Column(String(32), primary_key=True)
+    repo_id = Column(Integer, ForeignKey("repositories.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)  # Declared total size in bytes
+    sha256 = Column(String(64), nullable=True)  # Optional client-declared digest, verified on completion
+    version_number = Column(Integer, nullable=True)
+    version_description = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    chunks = relationship("UploadChunk", back_populates="session", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<UploadSession(id='{self.id}', repo_id={self.repo_id}, filename='{self.filename}')>"
+
+class UploadChunk(Base):
+    """Byte range received for an upload session. One row per PUT so parallel chunks never conflict."""
+    __tablename__ = "upload_chunks"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String(32), ForeignKey("upload_sessions.id"), nullable=False, index=True)
+    offset = Column(BigInteger, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    session = relationship("UploadSession", back_populates="chunks")
+
+    def __repr__(self):
+        return f"<UploadChunk(session_id='{self.session_id}', offset={self.offset}, size={self.size})>"
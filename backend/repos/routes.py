@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional
+import logging
 from auth.models import User
 from .models import  Repository, Collaborator, RoleEnum
 from .schemas import (
@@ -9,15 +10,24 @@ from .schemas import (
     RepoOutExtended, 
     RepoCollaboratorCreate,
     RepoCollaboratorOut,
+    RepoSettingsUpdate,
+    RepoSettingsOut,
+    RepoUsageOut,
+    UserUsageOut,
+    SearchHitOut,
 )
+from .changes import record_change
+from .search import search_versions
+from .utils import assert_read_perm, decode_cursor, paginate, repo_quota
+from auth.cache import invalidate_role
 from auth.utils import get_db, get_current_user
+from config import MAX_PAGE_SIZE, USER_QUOTA_BYTES
 
 router = APIRouter(tags=["Repositories"])
+logger = logging.getLogger(__name__)
 
 @router.post("/create-repo", response_model=RepoOut, status_code=status.HTTP_201_CREATED)
 def create_repository(repo: RepoCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    print(f"[CREATE_REPO] Authenticated user: {current_user.email if current_user else 'None'}")
-    
     # Check if repo name already exists for this user (case-insensitive)
     existing = (
         db.query(Repository)
@@ -40,9 +50,9 @@ def create_repository(repo: RepoCreate, db: Session = Depends(get_db), current_u
         db.commit()
     except Exception as e:
         db.rollback()
-        import traceback; traceback.print_exc()
-        print(f"[ERROR] Failed to create repo: {e}")
+        logger.exception("Failed to create repo %r: %s", repo.name, e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create repository")
+    invalidate_role(new_repo.id, current_user.id)
 
     return RepoOut(
         id=new_repo.id,
@@ -95,37 +105,149 @@ def add_collaborator(
     new_collab = Collaborator(repo_id=repo_id, user_id=user.id, role=collab.role)
     try:
         db.add(new_collab)
+        record_change(db, repo_id, "collaborator_added", user_id=user.id, role=collab.role)
         db.commit()
         db.refresh(new_collab)
     except Exception:
         db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add collaborator")
+    invalidate_role(repo_id, user.id)
 
     return RepoCollaboratorOut(user_email=user.email, role=new_collab.role)
 
 
+@router.patch("/{repo_id}", response_model=RepoSettingsOut)
+def update_repository_settings(
+    repo_id: int,
+    settings: RepoSettingsUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    repo = db.query(Repository).filter(Repository.id == repo_id).first()
+    if not repo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
+
+    user_collab = (
+        db.query(Collaborator)
+        .filter(Collaborator.repo_id == repo_id, Collaborator.user_id == current_user.id)
+        .first()
+    )
+    if not user_collab or user_collab.role != RoleEnum.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to change repository settings")
+
+    for field in settings.model_fields_set:
+        value = getattr(settings, field)
+        if value is not None and value <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{field} must be positive")
+        setattr(repo, field, value)
+    db.commit()
+    return RepoSettingsOut(
+        id=repo.id, name=repo.name, max_file_size=repo.max_file_size, quota_bytes=repo.quota_bytes
+    )
+
+
+def _repo_usage(repo: Repository) -> RepoUsageOut:
+    return RepoUsageOut(
+        repo_id=repo.id,
+        name=repo.name,
+        used_bytes=repo.used_bytes or 0,
+        version_count=repo.version_count or 0,
+        quota_bytes=repo_quota(repo),
+    )
+
+@router.get("/usage", response_model=UserUsageOut)
+def get_user_usage(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Storage used by the current user's own repositories, against the per-user quota."""
+    repos = db.query(Repository).filter(Repository.owner_id == current_user.id).order_by(Repository.id).all()
+    used_bytes = db.query(User.used_bytes).filter(User.id == current_user.id).scalar()
+    return UserUsageOut(
+        used_bytes=used_bytes or 0,
+        quota_bytes=USER_QUOTA_BYTES or None,
+        repositories=[_repo_usage(repo) for repo in repos],
+    )
+
+@router.get("/search", response_model=List[SearchHitOut])
+def search_files(
+    q: str = Query(..., min_length=1, max_length=200),
+    repo_id: Optional[int] = None,
+    all_versions: bool = False,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Search file names, version descriptions and text contents across the user's repositories.
+
+    All words must match; `word*` matches a prefix. Only latest versions are searched unless `all_versions`.
+    """
+    if repo_id is not None:
+        assert_read_perm(db, repo_id, current_user)
+    try:
+        rows = search_versions(db, current_user.id, q, repo_id, all_versions, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return [
+        SearchHitOut(
+            repo_id=repo_file.repo_id,
+            repo_name=repo_name,
+            filename=repo_file.filename,
+            version=version.version_number,
+            latest=version.id == repo_file.latest_version_id,
+            sha256=version.sha256,
+            size=version.size,
+            uploaded_at=version.uploaded_at,
+            version_description=version.version_description,
+            snippet=snippet,
+        )
+        for version, repo_file, repo_name, snippet in rows
+    ]
+
+@router.get("/{repo_id}/usage", response_model=RepoUsageOut)
+def get_repository_usage(repo_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Storage used by one repository, from its cached counters."""
+    assert_read_perm(db, repo_id, current_user)
+    return _repo_usage(db.get(Repository, repo_id))
+
+
 @router.get("/", response_model=List[RepoOutExtended])
-def list_repositories(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # List repos where user is owner or collaborator
-    repos = (
+def list_repositories(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    prefix: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    # List repos where user is owner or collaborator. Owners and collaborators
+    # (with their users) are loaded up front: two queries regardless of size.
+    query = (
         db.query(Repository)
         .join(Collaborator)
         .filter(Collaborator.user_id == current_user.id)
-        .all()
+        .options(
+            joinedload(Repository.owner),
+            selectinload(Repository.collaborators).joinedload(Collaborator.user),
+        )
     )
-
-    out = []
-    for repo in repos:
-        collaborators = [
-            RepoCollaboratorOut(user_email=collab.user.email, role=collab.role)
-            for collab in repo.collaborators
-        ]
-        out.append(
-            RepoOut(
-                id=repo.id,
-                name=repo.name,
-                owner_email=repo.owner.email,
-                collaborators=collaborators,
-            )
+    if prefix:
+        query = query.filter(Repository.name.startswith(prefix, autoescape=True))
+    if cursor:
+        (after_id,) = decode_cursor(cursor, int)
+        query = query.filter(Repository.id > after_id)
+    query = query.order_by(Repository.id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    # Keyset pagination: X-Next-Cursor is set when another page follows
+    repos = paginate(query.all(), limit, response, key=lambda repo: (repo.id,))
+
+    return [
+        RepoOutExtended(
+            id=repo.id,
+            name=repo.name,
+            owner_email=repo.owner.email,
+            collaborators=[
+                RepoCollaboratorOut(user_email=collab.user.email, role=collab.role)
+                for collab in repo.collaborators
+            ],
         )
-    return out
+        for repo in repos
+    ]
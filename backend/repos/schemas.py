@@ -1,6 +1,7 @@
 from enum import Enum
-from typing import List
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
 
 class RoleEnum(str, Enum):
     read = "read"
@@ -23,6 +24,29 @@ class RepoBase(BaseModel):
 class RepoCreate(RepoBase):
     pass
 
+class RepoSettingsUpdate(BaseModel):
+    # Only fields present in the request are changed
+    max_file_size: Optional[int] = None  # Bytes; None falls back to MAX_UPLOAD_SIZE
+    quota_bytes: Optional[int] = None  # Bytes; None falls back to REPO_QUOTA_BYTES
+
+class RepoSettingsOut(BaseModel):
+    id: int
+    name: str
+    max_file_size: Optional[int] = None
+    quota_bytes: Optional[int] = None
+
+class RepoUsageOut(BaseModel):
+    repo_id: int
+    name: str
+    used_bytes: int  # All versions, counted before deduplication
+    version_count: int
+    quota_bytes: Optional[int] = None  # Effective quota; None if unlimited
+
+class UserUsageOut(BaseModel):
+    used_bytes: int  # Across owned repositories
+    quota_bytes: Optional[int] = None
+    repositories: List[RepoUsageOut]
+
 class RepoOut(BaseModel):
     id: int
     name: str
@@ -36,3 +60,89 @@ class RepoOutExtended(RepoOut):
 
     class Config:
         from_attributes = True
+
+class SearchHitOut(BaseModel):
+    repo_id: int
+    repo_name: str
+    filename: str
+    version: int
+    latest: bool
+    sha256: str
+    size: int
+    uploaded_at: datetime
+    version_description: Optional[str] = None
+    snippet: Optional[str] = None  # Matching text with terms in [brackets]; only with the FTS5 index
+
+class RepoChangeOut(BaseModel):
+    seq: int
+    kind: str  # "version_added", "version_deleted", "file_deleted" or "collaborator_added"
+    filename: Optional[str] = None
+    version: Optional[int] = None
+    user_email: Optional[str] = None  # The collaborator, for collaborator changes
+    role: Optional[RoleEnum] = None
+    created_at: datetime
+
+class RepoChangesOut(BaseModel):
+    changes: List[RepoChangeOut]
+    next_since: int  # Pass as `since` to continue after these changes
+    latest_seq: int  # Latest change in the repository; more pages follow while next_since is below it
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    payload: dict
+    status: str  # "queued", "running", "succeeded" or "failed"
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    run_after: datetime  # When a queued job is due, later than created_at while retrying
+    finished_at: Optional[datetime] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = Field(None, pattern=r"^[0-9a-fA-F]{64}$")
+    version_number: Optional[int] = None
+    version_description: Optional[str] = None
+
+class UploadSessionOut(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    received: int
+    ranges: List[List[int]]  # Merged [start, end) byte ranges received so far
+    chunk_size: int
+    expires_at: datetime
+
+class UploadPrecheck(BaseModel):
+    filename: str
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
+    size: int
+    version_number: Optional[int] = None
+    version_description: Optional[str] = None
+
+class UploadPrecheckOut(BaseModel):
+    # "linked" (version created from stored content), "unchanged" (identical to the latest
+    # version) or "upload_required" (send the body to /upload with this sha256)
+    status: str
+    filename: str
+    version: Optional[int] = None
+    sha256: str
+    size: int
+
+class BatchFileResult(BaseModel):
+    filename: str
+    status: str  # "created", "skipped" (identical to latest) or "rejected"
+    version: Optional[int] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    deduplicated: Optional[bool] = None
+    detail: Optional[str] = None
+
+class BatchUploadOut(BaseModel):
+    created: int
+    skipped: int
+    rejected: int
+    files: List[BatchFileResult]
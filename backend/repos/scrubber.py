@@ -0,0 +1,328 @@
+"""Background integrity scrubber for the blob store.
+
+Each pass walks every blob row in SHA256 order and re-hashes its content,
+then lists the object store for objects without a row, then checks for
+version rows whose blob row is gone. Reads are throttled to
+SCRUB_RATE_BYTES, and the position is checkpointed to
+`storage/scrub/state.json` so a restart resumes where it stopped. Corrupt
+and missing content is only reported; orphaned files are removed once older
+than SCRUB_ORPHAN_GRACE_SECONDS, so in-flight uploads are never touched.
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, BinaryIO, Optional
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from prometheus_client import Counter, Gauge
+from sqlalchemy.orm import Session
+from config import SCRUB_RATE_BYTES, SCRUB_INTERVAL_SECONDS, SCRUB_ORPHAN_GRACE_SECONDS
+from database import SessionLocal
+from .delta import reconstruct_to_temp
+from .models import Blob, RepoFileVersion
+from .storage import (
+    CHUNK_SIZE,
+    ENCODINGS,
+    OBJECTS_PREFIX,
+    STORAGE_ROOT,
+    TMP_ROOT,
+    backend,
+    blob_key,
+    blob_stored,
+    encoded_blob_key,
+)
+
+logger = logging.getLogger(__name__)
+
+SCRUB_ROOT = STORAGE_ROOT / "scrub"
+STATE_PATH = SCRUB_ROOT / "state.json"
+LOCK_PATH = SCRUB_ROOT / "lock"
+
+_BATCH_SIZE = 100
+_SAMPLE_SIZE = 100  # Digests kept per problem category in a report
+
+SCRUBBED_BYTES = Counter("storage_scrub_bytes_total", "Bytes re-hashed by the storage scrubber")
+SCRUBBED_BLOBS = Counter("storage_scrub_blobs_total", "Blobs checked by the storage scrubber")
+PROBLEMS = Gauge("storage_scrub_problems", "Problems found by the last complete scrub pass", ["kind"])
+
+
+class _Throttle:
+    """Sleeps just enough to keep reads under `rate` bytes per second."""
+
+    def __init__(self, rate: int, stop: threading.Event):
+        self.rate = rate
+        self.stop = stop
+        self.start = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, size: int):
+        if self.rate <= 0:
+            return
+        self.consumed += size
+        delay = self.consumed / self.rate - (time.monotonic() - self.start)
+        if delay > 0:
+            self.stop.wait(delay)
+        if self.consumed > self.rate * 60:
+            # Forget old history so an idle period does not allow a long burst
+            self.start, self.consumed = time.monotonic(), 0
+
+
+def _new_report() -> dict:
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "blobs_checked": 0,
+        "bytes_hashed": 0,
+        "missing": [],  # Blob rows without content on disk
+        "corrupt": [],  # Content whose hash does not match its row
+        "unverified": [],  # Encoded content that could not be decoded here
+        "dangling_versions": [],  # Version rows whose blob row is gone
+        "orphans_removed": 0,
+        "temp_files_removed": 0,
+    }
+
+
+class Scrubber:
+    """Incremental, resumable scrub of the blob store; see the module docstring."""
+
+    def __init__(
+        self,
+        rate: int = SCRUB_RATE_BYTES,
+        grace_seconds: int = SCRUB_ORPHAN_GRACE_SECONDS,
+        state_path: Path = STATE_PATH,
+    ):
+        self.grace_seconds = grace_seconds
+        self.state_path = state_path
+        self.stop_event = threading.Event()
+        self.throttle = _Throttle(rate, self.stop_event)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        try:
+            state = json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            state = {}
+        except ValueError:
+            logger.warning("Ignoring unreadable scrub checkpoint %s", self.state_path)
+            state = {}
+        state.setdefault("passes", 0)
+        state.setdefault("phase", "blobs")
+        state.setdefault("cursor", "")
+        state.setdefault("report", _new_report())
+        state.setdefault("last_report", None)
+        return state
+
+    def save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.state, indent=2))
+        os.replace(tmp_path, self.state_path)
+
+    def _note(self, kind: str, value: str):
+        samples = self.state["report"][kind]
+        if len(samples) < _SAMPLE_SIZE:
+            samples.append(value)
+
+    def _hash(self, fp: BinaryIO) -> str:
+        sha = hashlib.sha256()
+        with fp:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+                self.throttle.consume(len(chunk))
+                sha.update(chunk)
+                SCRUBBED_BYTES.inc(len(chunk))
+                self.state["report"]["bytes_hashed"] += len(chunk)
+        return sha.hexdigest()
+
+    def _check_blob(self, db: Session, blob: Blob):
+        sha256 = blob.sha256
+        try:
+            if backend.exists(blob_key(sha256)):
+                actual = self._hash(backend.open_read(blob_key(sha256)))
+            elif blob.encoding and backend.exists(encoded_blob_key(sha256, blob.encoding)):
+                tmp_path = reconstruct_to_temp(db, sha256)
+                if tmp_path is None:
+                    self._note("unverified", sha256)
+                    return
+                try:
+                    actual = self._hash(open(tmp_path, "rb"))
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+            else:
+                # Re-check against fresh state: the blob may have been deleted or re-encoded meanwhile
+                if db.get(Blob, sha256, populate_existing=True) is not None and not blob_stored(sha256):
+                    logger.error("Blob %s has a row but no content on disk", sha256)
+                    self._note("missing", sha256)
+                return
+        except FileNotFoundError:
+            return  # Deleted or re-encoded while we looked; the next pass sees the new state
+        if actual != sha256:
+            logger.error("Blob %s is corrupt: content hashes to %s", sha256, actual)
+            self._note("corrupt", sha256)
+
+    def _scrub_blobs(self, db: Session) -> bool:
+        blobs = (
+            db.query(Blob)
+            .filter(Blob.sha256 > self.state["cursor"])
+            .order_by(Blob.sha256)
+            .limit(_BATCH_SIZE)
+            .all()
+        )
+        for blob in blobs:
+            if self.stop_event.is_set():
+                return False
+            self._check_blob(db, blob)
+            self.state["cursor"] = blob.sha256
+            self.state["report"]["blobs_checked"] += 1
+            SCRUBBED_BLOBS.inc()
+        return len(blobs) < _BATCH_SIZE
+
+    def _is_old(self, path: Path, now: float) -> bool:
+        try:
+            return now - path.stat().st_mtime > self.grace_seconds
+        except FileNotFoundError:
+            return False
+
+    def _scrub_objects(self, db: Session) -> bool:
+        """Remove objects under the next two-hex-digit prefix that no blob row accounts for."""
+        cursor = self.state["cursor"]
+        prefix = f"{int(cursor, 16) + 1:02x}" if cursor else "00"
+        if len(prefix) > 2:
+            return True
+        now = time.time()
+        files: dict = {}
+        for key, modified in backend.list(f"{OBJECTS_PREFIX}{prefix}/"):
+            sha_part, _, encoding = key.rpartition("/")[2].partition(".")
+            files.setdefault(prefix + sha_part, []).append((key, encoding or None, modified))
+        shas = list(files)
+        encodings = {}
+        for start in range(0, len(shas), 500):
+            encodings.update(
+                db.query(Blob.sha256, Blob.encoding).filter(Blob.sha256.in_(shas[start:start + 500])).all()
+            )
+        for sha256, keys in files.items():
+            for key, encoding, modified in keys:
+                # Orphan: no row, or a leftover of a re-encoding that already committed
+                keep = sha256 in encodings and (encoding is None or encodings[sha256] == encoding)
+                if keep or encoding not in (None, *ENCODINGS) or now - modified <= self.grace_seconds:
+                    continue
+                logger.info("Removing orphaned object %s", key)
+                backend.delete(key)
+                self.state["report"]["orphans_removed"] += 1
+        self.state["cursor"] = prefix
+        return False
+
+    def _scrub_versions(self, db: Session):
+        dangling = (
+            db.query(RepoFileVersion.sha256)
+            .outerjoin(Blob, Blob.sha256 == RepoFileVersion.sha256)
+            .filter(Blob.sha256.is_(None))
+            .distinct()
+            .limit(_SAMPLE_SIZE)
+            .all()
+        )
+        for (sha256,) in dangling:
+            logger.error("Versions reference blob %s which has no row", sha256)
+            self._note("dangling_versions", sha256)
+
+    def _scrub_temp_files(self):
+        """Remove abandoned ingest temp files; resumable upload sessions expire on their own."""
+        if not TMP_ROOT.exists():
+            return
+        now = time.time()
+        for path in TMP_ROOT.glob("*.part"):
+            if not path.name.startswith("upload_") and self._is_old(path, now):
+                path.unlink(missing_ok=True)
+                self.state["report"]["temp_files_removed"] += 1
+
+    def _finish_pass(self):
+        report = self.state["report"]
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        for kind in ("missing", "corrupt", "unverified", "dangling_versions"):
+            PROBLEMS.labels(kind).set(len(report[kind]))
+        logger.info(
+            "Scrub pass finished: %s blobs, %s bytes, %s missing, %s corrupt, %s dangling versions, %s orphans removed",
+            report["blobs_checked"], report["bytes_hashed"], len(report["missing"]), len(report["corrupt"]),
+            len(report["dangling_versions"]), report["orphans_removed"],
+        )
+        self.state.update(
+            passes=self.state["passes"] + 1, phase="blobs", cursor="", report=_new_report(), last_report=report
+        )
+
+    def step(self) -> bool:
+        """Do one checkpointed unit of work. Returns True when it completed a pass."""
+        db = SessionLocal()
+        try:
+            phase = self.state["phase"]
+            if phase == "blobs":
+                if self._scrub_blobs(db):
+                    self.state.update(phase="objects", cursor="")
+            elif phase == "objects":
+                if self._scrub_objects(db):
+                    self.state.update(phase="versions", cursor="")
+            else:
+                self._scrub_versions(db)
+                self._scrub_temp_files()
+                self._finish_pass()
+                return True
+            return False
+        finally:
+            db.close()
+            self.save_state()
+
+    def run_pass(self) -> dict:
+        """Finish the current pass (resuming from the checkpoint) and return its report."""
+        while not self.step():
+            if self.stop_event.is_set():
+                break
+        return self.state["last_report"]
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.step():
+                    self.stop_event.wait(SCRUB_INTERVAL_SECONDS)
+            except Exception:
+                logger.exception("Scrub step failed, retrying later")
+                self.stop_event.wait(60)
+
+
+def acquire_scrub_lock() -> Optional[IO]:
+    """Take the host-wide scrubber lock; returns the open lock file, or None if it is held."""
+    SCRUB_ROOT.mkdir(parents=True, exist_ok=True)
+    lock_file = open(LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+_thread: Optional[threading.Thread] = None
+_scrubber: Optional[Scrubber] = None
+_lock_file: Optional[IO] = None
+
+def start_scrubber() -> bool:
+    """Start the background scrubber unless another process on this host already runs one."""
+    global _thread, _scrubber, _lock_file
+    if _thread is not None:
+        return True
+    _lock_file = acquire_scrub_lock()
+    if _lock_file is None:
+        return False
+    _scrubber = Scrubber()
+    _thread = threading.Thread(target=_scrubber.run_forever, name="storage-scrubber", daemon=True)
+    _thread.start()
+    return True
+
+def stop_scrubber():
+    global _thread, _scrubber, _lock_file
+    if _thread is None:
+        return
+    _scrubber.stop_event.set()
+    _thread.join(timeout=10)
+    _lock_file.close()
+    _thread = _scrubber = _lock_file = None
@@ -0,0 +1,222 @@
+"""Search over file names, version descriptions and text contents.
+
+On SQLite with FTS5, every version has a row in the `file_search` virtual table
+(rowid = version id), written by a background job after uploads commit.
+Elsewhere, search falls back to LIKE over names and descriptions.
+
+Results are ranked in tiers (name matches, then description matches, then
+matches anywhere) and newest first within a tier. Unlike bm25, this lets each
+tier stop after `limit` rows, however common the search terms are.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, joinedload
+import logging
+import re
+from config import SEARCH_INDEX_CONTENT, SEARCH_MAX_CONTENT_BYTES
+from .delta import blob_file
+from .jobs import enqueue, job_handler
+from .models import Collaborator, Repository, RepoFile, RepoFileVersion
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "file_search"
+
+# (columns searched, column the snippet is taken from), best tier first
+_TIERS = (("filename", 0), ("description", 1), ("filename description content", 2))
+# Above this many repositories, access is only checked by the join, not inside the MATCH
+_MAX_SCOPED_REPOS = 200
+_BATCH_SIZE = 500
+_BINARY_SNIFF_BYTES = 8192
+_TERM_RE = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+_search_table = table(
+    SEARCH_TABLE, column("rowid"), column("filename"), column("description"), column("content"), column("repo")
+)
+_fts_available: Optional[bool] = None
+
+
+def create_search_index(bind: Engine):
+    """Create the FTS5 table if the database supports it."""
+    global _fts_available
+    if bind.dialect.name != "sqlite":
+        _fts_available = False
+        return
+    try:
+        with bind.begin() as conn:
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                "USING fts5(filename, description, content, repo, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        _fts_available = True
+    except OperationalError as e:
+        logger.warning("SQLite FTS5 is unavailable, search falls back to LIKE queries: %s", e.orig)
+        _fts_available = False
+
+def fts_available(db: Session) -> bool:
+    """Whether the FTS5 index exists in this database (checked once per process)."""
+    global _fts_available
+    if _fts_available is None:
+        bind = db.get_bind()
+        _fts_available = bind.dialect.name == "sqlite" and db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+        ).first() is not None
+    return _fts_available
+
+def _repo_token(repo_id: int) -> str:
+    # Lets the MATCH itself skip other repositories' rows; user terms never search this column
+    return f"r{repo_id}"
+
+def _text_content(db: Session, version: RepoFileVersion) -> str:
+    # Only small text files: binary content and large files are searchable by name alone
+    if not SEARCH_INDEX_CONTENT or version.size > SEARCH_MAX_CONTENT_BYTES:
+        return ""
+    path = blob_file(db, version.sha256)
+    if path is None:
+        return ""
+    data = path.read_bytes()
+    if b"\0" in data[:_BINARY_SNIFF_BYTES]:
+        return ""
+    return data.decode("utf-8", errors="replace")
+
+def _index_versions(db: Session, versions: List[RepoFileVersion]) -> int:
+    if not versions:
+        return 0
+    rows = [
+        dict(
+            rowid=v.id, filename=v.file.filename, description=v.version_description or "",
+            content=_text_content(db, v), repo=_repo_token(v.file.repo_id),
+        )
+        for v in versions
+    ]
+    # Replaces rows a concurrent pass may have written in the meantime
+    db.execute(_search_table.delete().where(_search_table.c.rowid.in_([row["rowid"] for row in rows])))
+    db.execute(_search_table.insert(), rows)
+    db.commit()
+    return len(rows)
+
+def _unindexed(db: Session):
+    indexed = select(_search_table.c.rowid).where(_search_table.c.rowid == RepoFileVersion.id).exists()
+    return db.query(RepoFileVersion).options(joinedload(RepoFileVersion.file)).filter(~indexed)
+
+def index_file(db: Session, file_id: int) -> int:
+    """Index the versions of a file that are not in the search index yet."""
+    if not fts_available(db):
+        return 0
+    return _index_versions(db, _unindexed(db).filter(RepoFileVersion.file_id == file_id).all())
+
+def index_all(db: Session) -> int:
+    """Index every version missing from the search index, in batches. Returns the number indexed."""
+    if not fts_available(db):
+        return 0
+    total, after_id = 0, 0
+    while True:
+        batch = (
+            _unindexed(db).filter(RepoFileVersion.id > after_id)
+            .order_by(RepoFileVersion.id).limit(_BATCH_SIZE).all()
+        )
+        if not batch:
+            return total
+        after_id = batch[-1].id
+        total += _index_versions(db, batch)
+
+def unindex_version(db: Session, version_id: int):
+    """Remove a deleted version from the search index without committing."""
+    if fts_available(db):
+        db.execute(_search_table.delete().where(_search_table.c.rowid == version_id))
+
+def _match_expression(terms: Iterable[Tuple[str, str]], columns: str, repo_ids: List[int]) -> str:
+    # Words are quoted, so user input can never be FTS5 syntax. Prefix terms ("repo*") cost a
+    # pass over every matching word's postings, so they are only used when asked for.
+    expression = "{%s} : (%s)" % (columns, " ".join(f'"{word}"{star}' for word, star in terms))
+    if len(repo_ids) <= _MAX_SCOPED_REPOS:
+        expression += " AND repo : (%s)" % " OR ".join(f'"{_repo_token(repo_id)}"' for repo_id in repo_ids)
+    return expression
+
+def _search_query(user_id: int, snippet):
+    return (
+        select(RepoFileVersion, RepoFile, Repository.name, snippet)
+        .join(RepoFile, RepoFile.id == RepoFileVersion.file_id)
+        .join(Repository, Repository.id == RepoFile.repo_id)
+        .join(Collaborator, and_(Collaborator.repo_id == RepoFile.repo_id, Collaborator.user_id == user_id))
+    )
+
+def search_versions(
+    db: Session,
+    user_id: int,
+    query: str,
+    repo_id: Optional[int] = None,
+    all_versions: bool = False,
+    limit: int = 20,
+) -> list:
+    """Best matches for `query` in the repositories the user collaborates on.
+
+    Every word must match; a word ending in `*` matches as a prefix. Only
+    latest versions match unless `all_versions`. Returns rows of
+    `(RepoFileVersion, RepoFile, repo name, snippet)`, best first; snippets
+    are None without FTS5. Raises ValueError if the query has no words.
+    """
+    terms = _TERM_RE.findall(query.lower())
+    if not terms:
+        raise ValueError("Search query has no words")
+
+    def scoped(stmt):
+        if repo_id is not None:
+            stmt = stmt.where(RepoFile.repo_id == repo_id)
+        if not all_versions:
+            stmt = stmt.where(RepoFile.latest_version_id == RepoFileVersion.id)
+        return stmt
+
+    if not fts_available(db):
+        stmt = _search_query(user_id, literal_column("NULL"))
+        for word, _ in terms:
+            stmt = stmt.where(or_(
+                RepoFile.filename.icontains(word, autoescape=True),
+                RepoFileVersion.version_description.icontains(word, autoescape=True),
+            ))
+        stmt = stmt.order_by(RepoFileVersion.uploaded_at.desc(), RepoFileVersion.id.desc())
+        return db.execute(scoped(stmt).limit(limit)).all()
+
+    if repo_id is not None:
+        repo_ids = [repo_id]
+    else:
+        repo_ids = [row[0] for row in db.query(Collaborator.repo_id).filter(Collaborator.user_id == user_id)]
+    if not repo_ids:
+        return []
+    found: Dict[int, tuple] = {}
+    for columns, snippet_column in _TIERS:
+        if len(found) >= limit:
+            break
+        snippet = func.snippet(literal_column(SEARCH_TABLE), snippet_column, "[", "]", "…", 12)
+        stmt = (
+            _search_query(user_id, snippet)
+            .join(_search_table, _search_table.c.rowid == RepoFileVersion.id)
+            .where(literal_column(SEARCH_TABLE).op("MATCH")(_match_expression(terms, columns, repo_ids)))
+        )
+        if found:
+            stmt = stmt.where(_search_table.c.rowid.notin_(list(found)))
+        # FTS5 returns rowids in order, so this stops after the first `limit` accessible matches
+        stmt = scoped(stmt).order_by(_search_table.c.rowid.desc()).limit(limit - len(found))
+        found.update((row[0].id, row) for row in db.execute(stmt))
+    return list(found.values())
+
+@job_handler("index_search", concurrency=1)
+def _index_job(db: Session, file_id: Optional[int] = None):
+    if file_id is not None:
+        index_file(db, file_id)
+        return
+    indexed = index_all(db)
+    if indexed:
+        logger.info("Indexed %s file versions for search", indexed)
+
+def schedule_indexing(db: Session, repo_id: Optional[int] = None, file_id: Optional[int] = None):
+    """Queue indexing of a file's new versions without committing; no file catches up on every unindexed version."""
+    if not fts_available(db):
+        return
+    if file_id is None:
+        enqueue(db, "index_search", key="index_search:all")
+    else:
+        enqueue(db, "index_search", {"file_id": file_id}, key=f"index_search:{file_id}", repo_id=repo_id)
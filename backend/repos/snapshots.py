@@ -0,0 +1,133 @@
+"""Streaming tar/zip archives of a repository snapshot.
+
+Archives are produced on the fly from the object store: memory use is one
+read chunk plus the snapshot's file list, and nothing is written to disk.
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+import io
+import tarfile
+import zipfile
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+from database import SessionLocal
+from executors import run_cpu, run_io
+from .delta import blob_file
+from .downloads import read_range
+from .models import RepoFile, RepoFileVersion
+
+_TAR_BLOCK = 512
+_TAR_END = b"\0" * (2 * _TAR_BLOCK)
+
+
+def snapshot_entries(db: Session, repo_id: int, at: Optional[datetime] = None) -> list:
+    """Rows `(filename, sha256, size, uploaded_at)` of each file's latest version, optionally as of `at`."""
+    query = db.query(RepoFile.filename, RepoFileVersion.sha256, RepoFileVersion.size, RepoFileVersion.uploaded_at)
+    if at is None:
+        query = query.join(RepoFileVersion, RepoFileVersion.id == RepoFile.latest_version_id)
+    else:
+        newest = aliased(RepoFileVersion)
+        version_at = (
+            select(func.max(newest.version_number))
+            .where(newest.file_id == RepoFile.id, newest.uploaded_at <= at)
+            .correlate(RepoFile)
+            .scalar_subquery()
+        )
+        query = query.join(RepoFileVersion, RepoFileVersion.file_id == RepoFile.id).filter(
+            RepoFileVersion.version_number == version_at
+        )
+    return query.filter(RepoFile.repo_id == repo_id).order_by(RepoFile.filename).all()
+
+def _timestamp(entry) -> int:
+    if entry.uploaded_at is None:
+        return 0
+    return int(entry.uploaded_at.replace(tzinfo=timezone.utc).timestamp())
+
+def _tar_header(entry) -> bytes:
+    info = tarfile.TarInfo(entry.filename)
+    info.size = entry.size
+    info.mtime = _timestamp(entry)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+def tar_size(entries: List) -> int:
+    """Exact byte length of the archive `tar_stream` produces, for Content-Length."""
+    return sum(len(_tar_header(e)) + e.size + (-e.size % _TAR_BLOCK) for e in entries) + len(_TAR_END)
+
+async def _contents(entries: List) -> AsyncIterator:
+    """Yield `(entry, path)` pairs, resolving each blob only when it is reached.
+
+    Delta-encoded versions are reconstructed one at a time, so a large
+    snapshot never needs more than one of them in the cache at once. The
+    request's session may be closed while streaming, so this uses its own.
+    """
+    db = SessionLocal()
+    try:
+        for entry in entries:
+            path = await run_io(blob_file, db, entry.sha256)
+            if path is None:
+                raise RuntimeError(f"Content of {entry.filename} ({entry.sha256}) is missing")
+            yield entry, path
+    finally:
+        db.close()
+
+async def _read_exact(path: Path, size: int) -> AsyncIterator[bytes]:
+    received = 0
+    if size:
+        async for data in read_range(path, 0, size - 1):
+            received += len(data)
+            yield data
+    if received != size:
+        raise RuntimeError(f"Blob {path.name} is shorter than its recorded size")
+
+async def tar_stream(entries: List) -> AsyncIterator[bytes]:
+    """Stream a ustar/PAX archive of `entries`."""
+    async for entry, path in _contents(entries):
+        yield _tar_header(entry)
+        async for data in _read_exact(path, entry.size):
+            yield data
+        if entry.size % _TAR_BLOCK:
+            yield b"\0" * (-entry.size % _TAR_BLOCK)
+    yield _TAR_END
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable write target; `zipfile` then streams entries with data descriptors."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _zip_date_time(entry) -> tuple:
+    moment = datetime.fromtimestamp(_timestamp(entry), tz=timezone.utc)
+    if moment.year < 1980:  # Earliest date the zip format can represent
+        return (1980, 1, 1, 0, 0, 0)
+    return moment.timetuple()[:6]
+
+async def zip_stream(entries: List) -> AsyncIterator[bytes]:
+    """Stream an uncompressed (stored) zip archive of `entries`, using ZIP64 where needed."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        async for entry, path in _contents(entries):
+            info = zipfile.ZipInfo(entry.filename, date_time=_zip_date_time(entry))
+            info.file_size = entry.size
+            info.external_attr = 0o644 << 16
+            with archive.open(info, mode="w") as dst:
+                async for data in _read_exact(path, entry.size):
+                    await run_cpu(dst.write, data)  # CRC32 over the chunk
+                    yield sink.drain()
+            if chunk := sink.drain():
+                yield chunk
+    yield sink.drain()  # Central directory
@@ -0,0 +1,299 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, BinaryIO, Callable, List, Optional, Tuple
+import anyio
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config import STORAGE_ROOT as _STORAGE_ROOT
+from executors import run_cpu, run_io
+from metrics import record_hash
+from .backends import create_backend
+from .jobs import enqueue, job_handler
+from .models import Blob, RepoFile, RepoFileVersion
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ROOT = Path(_STORAGE_ROOT).resolve()
+OBJECTS_PREFIX = "objects/"
+TMP_ROOT = STORAGE_ROOT / "tmp"
+ENCODINGS = ("zstd", "delta")
+
+backend = create_backend(STORAGE_ROOT)
+
+CHUNK_SIZE = 1024 * 1024
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_key(sha256: str) -> str:
+    """Return the storage backend key of the blob with the given SHA256."""
+    if not _SHA256_RE.match(sha256 or ""):
+        raise ValueError(f"Invalid SHA256 digest: {sha256!r}")
+    return f"{OBJECTS_PREFIX}{sha256[:2]}/{sha256[2:]}"
+
+def encoded_blob_key(sha256: str, encoding: str) -> str:
+    """Key of a blob stored with an encoding ("zstd" or "delta")."""
+    return f"{blob_key(sha256)}.{encoding}"
+
+def blob_stored(sha256: str) -> bool:
+    """Whether a blob's content is in the store, plain or encoded."""
+    return backend.exists(blob_key(sha256)) or any(backend.exists(encoded_blob_key(sha256, enc)) for enc in ENCODINGS)
+
+def new_temp_path() -> Path:
+    """Return a fresh temp file path on the same filesystem as the object store."""
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    return TMP_ROOT / f"{uuid.uuid4().hex}.part"
+
+def timed_update(sha, data: bytes) -> float:
+    """Feed `data` to a hash object and return the seconds it took."""
+    started = time.perf_counter()
+    sha.update(data)
+    return time.perf_counter() - started
+
+class UploadTooLarge(Exception):
+    """Raised when an ingested stream exceeds its size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the limit of {limit} bytes")
+        self.limit = limit
+
+def ingest_stream(src: BinaryIO, max_size: Optional[int] = None) -> Tuple[Path, str, int]:
+    """Copy a stream into a temp file in the store, hashing and counting in the same pass.
+
+    Returns `(tmp_path, sha256, size)`; pass the path to `add_blob_ref` to
+    rename it into place. The partial file is removed if the stream exceeds
+    `max_size` (raising `UploadTooLarge`) or reading fails.
+    """
+    tmp_path = new_temp_path()
+    sha = hashlib.sha256()
+    size = 0
+    hash_seconds = 0.0
+    try:
+        with open(tmp_path, "wb") as fp:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(max_size)
+                hash_seconds += timed_update(sha, chunk)
+                fp.write(chunk)
+            fp.flush()
+            os.fsync(fp.fileno())
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    record_hash(hash_seconds, size)
+    return tmp_path, sha.hexdigest(), size
+
+async def ingest_async(read: Callable[[int], Awaitable[bytes]], max_size: Optional[int] = None) -> Tuple[Path, str, int]:
+    """Async counterpart of `ingest_stream` for an awaitable `read(n)`, e.g. `UploadFile.read`.
+
+    Hashing and writes run in the bounded executors, so a large upload does
+    not hold a threadpool worker for its whole duration.
+    """
+    tmp_path = new_temp_path()
+    sha = hashlib.sha256()
+    size = 0
+    hash_seconds = 0.0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as fp:
+            while chunk := await read(CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(max_size)
+                hash_seconds += await run_cpu(timed_update, sha, chunk)
+                await fp.write(chunk)
+            await fp.flush()
+            await run_io(os.fsync, fp.wrapped.fileno())
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    record_hash(hash_seconds, size)
+    return tmp_path, sha.hexdigest(), size
+
+def add_blob_ref(db: Session, src: Path, sha256: str, size: int) -> bool:
+    """Take a reference on a blob, moving `src` into the store if the content is new.
+
+    `src` is consumed either way. Returns True when the content was already
+    stored (a dedup hit). The caller owns the transaction.
+    """
+    key = blob_key(sha256)
+    updated = db.execute(
+        update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count + 1)
+    ).rowcount
+    if updated and backend.exists(key):
+        src.unlink(missing_ok=True)
+        return True
+
+    if not updated:
+        # The row goes in before the content: a concurrent `remove_blob_file` for the
+        # same digest then either sees it or holds us off until its delete is done
+        db.add(Blob(sha256=sha256, size=size, ref_count=1))
+        db.flush()
+    backend.put_file(key, src)
+    if updated:
+        # An encoded blob keeps its encoded file until the compactor inflates it
+        if not any(backend.exists(encoded_blob_key(sha256, enc)) for enc in ENCODINGS):
+            logger.warning("Blob %s was missing from the store, restored from upload", sha256)
+        return True
+    return False
+
+def link_blob_ref(db: Session, sha256: str) -> bool:
+    """Take a reference on a blob that is already stored, without any new content.
+
+    Returns False if the blob is not stored (anymore). The caller owns the transaction.
+    """
+    if not blob_stored(sha256):
+        return False
+    # A blob whose last reference is being released must not be revived
+    return db.execute(
+        update(Blob).where(Blob.sha256 == sha256, Blob.ref_count > 0).values(ref_count=Blob.ref_count + 1)
+    ).rowcount > 0
+
+def release_blob_ref(db: Session, sha256: str) -> List[str]:
+    """Drop a reference on a blob.
+
+    Returns the digests of blobs whose last reference went away, including
+    delta bases released in turn. Their rows are deleted; the caller should
+    call `remove_blob_file` for each once the transaction has committed, or
+    queue that with `schedule_blob_removal` before committing.
+    """
+    db.execute(update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count - 1))
+    blob = db.get(Blob, sha256, populate_existing=True)
+    if blob is None:
+        logger.warning("Released reference on unknown blob %s", sha256)
+        return []
+    if blob.ref_count > 0:
+        return []
+    base_sha256 = blob.base_sha256
+    db.delete(blob)
+    db.flush()
+    orphaned = [sha256]
+    if base_sha256:
+        orphaned += release_blob_ref(db, base_sha256)
+    return orphaned
+
+@job_handler("remove_blob")
+def remove_blob_file(db: Session, sha256: str) -> None:
+    """Delete a blob's objects after its last reference has been committed away.
+
+    A placeholder row for the digest is held while deleting. An upload that
+    stores the same content again inserts its row before the content, so it
+    has either committed (the placeholder fails and nothing is deleted) or
+    waits for this transaction to end.
+    """
+    if db.get(Blob, sha256, populate_existing=True) is not None:
+        return  # Re-referenced by an upload in the meantime
+    db.add(Blob(sha256=sha256, size=0, ref_count=0))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return  # ...by one that committed just now
+    try:
+        keys = [blob_key(sha256)] + [encoded_blob_key(sha256, enc) for enc in ENCODINGS]
+        found = False
+        for key in keys:
+            found = backend.delete(key) or found
+        if not found:
+            logger.warning("Blob %s already missing from the store", sha256)
+    finally:
+        # The placeholder was only a lock
+        db.rollback()
+
+def schedule_blob_removal(db: Session, sha256s: List[str], repo_id: Optional[int] = None):
+    """Queue `remove_blob_file` jobs for released blobs without committing."""
+    for sha256 in sha256s:
+        enqueue(db, "remove_blob", {"sha256": sha256}, key=f"remove_blob:{sha256}", repo_id=repo_id)
+
+def _hash_file(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def rebuild_ref_counts(db: Session) -> int:
+    """Recompute every blob's reference count from the versions table.
+
+    Blobs that end up unreferenced are deleted together with their file.
+    Returns the number of blobs removed.
+    """
+    counts = dict(
+        db.query(RepoFileVersion.sha256, func.count(RepoFileVersion.id))
+        .group_by(RepoFileVersion.sha256)
+        .all()
+    )
+    delta_bases = (
+        db.query(Blob.base_sha256, func.count(Blob.sha256))
+        .filter(Blob.base_sha256.isnot(None))
+        .group_by(Blob.base_sha256)
+        .all()
+    )
+    for sha256, refs in delta_bases:
+        counts[sha256] = counts.get(sha256, 0) + refs
+    removed = []
+    for blob in db.query(Blob).all():
+        refs = counts.pop(blob.sha256, 0)
+        if refs:
+            blob.ref_count = refs
+        else:
+            db.delete(blob)
+            removed.append(blob.sha256)
+    for sha256 in counts:
+        logger.warning("Versions reference blob %s which has no row", sha256)
+    db.commit()
+    for sha256 in removed:
+        remove_blob_file(db, sha256)
+    return len(removed)
+
+def migrate_legacy_storage(db: Session) -> dict:
+    """Move `storage/repo_<id>/<filename>.v<N>` files into the object store.
+
+    Safe to re-run: versions whose legacy file is gone are assumed migrated,
+    and reference counts are rebuilt from scratch at the end.
+    """
+    stats = {"migrated": 0, "deduplicated": 0, "mismatched": 0, "missing": 0}
+    rows = (
+        db.query(RepoFileVersion, RepoFile.repo_id, RepoFile.filename)
+        .join(RepoFile, RepoFileVersion.file_id == RepoFile.id)
+        .all()
+    )
+    for version, repo_id, filename in rows:
+        legacy = STORAGE_ROOT / f"repo_{repo_id}" / f"{filename}.v{version.version_number}"
+        if not legacy.exists():
+            if not blob_stored(version.sha256):
+                stats["missing"] += 1
+                logger.warning("No content for %s v%s in repo %s", filename, version.version_number, repo_id)
+            continue
+        if _hash_file(legacy) != version.sha256:
+            stats["mismatched"] += 1
+            logger.warning("Hash mismatch for %s, leaving it in place", legacy)
+            continue
+
+        # Committed before the move, which keeps the old mtime: the scrubber
+        # would otherwise take the object for an orphan past its grace period
+        if db.get(Blob, version.sha256) is None:
+            db.add(Blob(sha256=version.sha256, size=version.size, ref_count=0))
+            db.commit()
+        key = blob_key(version.sha256)
+        if backend.exists(key):
+            legacy.unlink()
+            stats["deduplicated"] += 1
+        else:
+            backend.put_file(key, legacy)
+            stats["migrated"] += 1
+
+    rebuild_ref_counts(db)
+
+    for repo_dir in STORAGE_ROOT.glob("repo_*"):
+        try:
+            repo_dir.rmdir()
+        except OSError:
+            pass  # Not empty, e.g. mismatched files left behind
+    return stats
@@ -0,0 +1,291 @@
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+from werkzeug.utils import secure_filename
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from .models import Repository, UploadSession, UploadChunk
+from .schemas import UploadSessionCreate, UploadSessionOut
+from .storage import TMP_ROOT, CHUNK_SIZE, timed_update
+from .utils import assert_write_perm, plan_version, record_version, upload_limit
+from auth.models import User
+from auth.utils import get_db, get_current_user
+from config import UPLOAD_CHUNK_SIZE, MAX_UPLOAD_CHUNK_SIZE, UPLOAD_SESSION_TTL_SECONDS
+from metrics import record_hash
+from ratelimit import UPLOAD, throttled
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/repos/{repo_id}/files/uploads", tags=["Repo Files"])
+
+
+class _HashState:
+    """Incremental SHA256 over the contiguous prefix of a session's temp file.
+
+    Lives in process memory only; after a restart the first advance simply
+    re-hashes the prefix from disk. Writes and hashing share the lock, so a
+    chunk cannot change bytes while or after they are hashed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sha = hashlib.sha256()
+        self.offset = 0
+        self.seconds = 0.0  # Time spent hashing, reported once the upload completes
+
+    def write(self, path: Path, offset: int, chunk: bytes):
+        """Write a chunk into the temp file; raises 409 if it would change bytes already hashed."""
+        with self.lock:
+            with open(path, "r+b") as fp:
+                hashed = min(len(chunk), self.offset - offset)
+                if hashed > 0:
+                    fp.seek(offset)
+                    if fp.read(hashed) != chunk[:hashed]:
+                        raise HTTPException(status_code=409, detail="Chunk differs from the data already received")
+                fp.seek(offset)
+                fp.write(chunk)
+
+    def advance(self, path: Path, contiguous_end: int, chunk: bytes = b"", chunk_offset: int = -1):
+        with self.lock:
+            # In-order chunks are hashed straight from memory, gaps filled later are read back
+            if chunk_offset == self.offset and chunk_offset + len(chunk) <= contiguous_end:
+                self.seconds += timed_update(self.sha, chunk)
+                self.offset += len(chunk)
+            if self.offset >= contiguous_end:
+                return
+            with open(path, "rb") as fp:
+                fp.seek(self.offset)
+                while self.offset < contiguous_end:
+                    data = fp.read(min(CHUNK_SIZE, contiguous_end - self.offset))
+                    if not data:
+                        break
+                    self.seconds += timed_update(self.sha, data)
+                    self.offset += len(data)
+
+
+_hash_states: Dict[str, _HashState] = {}
+_hash_states_lock = threading.Lock()
+
+def _hash_state(upload_id: str) -> _HashState:
+    with _hash_states_lock:
+        return _hash_states.setdefault(upload_id, _HashState())
+
+def _session_path(upload_id: str) -> Path:
+    return TMP_ROOT / f"upload_{upload_id}.part"
+
+def _merged_ranges(db: Session, upload_id: str) -> List[List[int]]:
+    """Merge the received chunks of a session into sorted, disjoint [start, end) ranges."""
+    rows = (
+        db.query(UploadChunk.offset, UploadChunk.size)
+        .filter(UploadChunk.session_id == upload_id)
+        .order_by(UploadChunk.offset)
+        .all()
+    )
+    ranges: List[List[int]] = []
+    for offset, size in rows:
+        end = offset + size
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return ranges
+
+def _contiguous_end(ranges: List[List[int]]) -> int:
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+def _session_out(session: UploadSession, ranges: List[List[int]]) -> UploadSessionOut:
+    return UploadSessionOut(
+        upload_id=session.id,
+        filename=session.filename,
+        size=session.size,
+        received=sum(end - start for start, end in ranges),
+        ranges=ranges,
+        chunk_size=UPLOAD_CHUNK_SIZE,
+        expires_at=session.updated_at + timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS),
+    )
+
+def _discard_session(db: Session, session: UploadSession):
+    """Delete a session row and its temp file; the caller commits."""
+    with _hash_states_lock:
+        _hash_states.pop(session.id, None)
+    _session_path(session.id).unlink(missing_ok=True)
+    db.delete(session)
+
+def gc_upload_sessions(db: Session) -> int:
+    """Remove sessions idle for longer than UPLOAD_SESSION_TTL_SECONDS. Returns how many were removed."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+    expired = db.query(UploadSession).filter(UploadSession.updated_at < cutoff).all()
+    for session in expired:
+        logger.info("Expiring idle upload session %s (%s)", session.id, session.filename)
+        _discard_session(db, session)
+    db.commit()
+    return len(expired)
+
+def _load_repo(db: Session, repo_id: int, user: User) -> Repository:
+    assert_write_perm(db, repo_id, user)
+    return db.get(Repository, repo_id)
+
+def _load_session(db: Session, repo_id: int, upload_id: str, user: User) -> UploadSession:
+    session = db.get(UploadSession, upload_id)
+    if not session or session.repo_id != repo_id or session.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@router.post("", response_model=UploadSessionOut, status_code=status.HTTP_201_CREATED, summary="Start a resumable upload")
+def create_upload_session(
+    repo_id: int,
+    body: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Open a chunked upload session for a file of known size."""
+    repo = _load_repo(db, repo_id, user)
+    filename = secure_filename(body.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if body.size <= 0:
+        raise HTTPException(status_code=400, detail="Empty file not allowed")
+    limit = upload_limit(db, repo)
+    if body.size > limit.max_size:
+        raise limit.error()
+    # Fail fast on version conflicts instead of after the last chunk
+    plan_version(db, repo_id, filename, body.version_number)
+
+    gc_upload_sessions(db)
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        repo_id=repo_id,
+        user_id=user.id,
+        filename=filename,
+        size=body.size,
+        sha256=body.sha256.lower() if body.sha256 else None,
+        version_number=body.version_number,
+        version_description=body.version_description,
+    )
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    with open(_session_path(session.id), "wb") as fp:
+        fp.truncate(body.size)
+    db.add(session)
+    db.commit()
+    logger.debug("Started upload session %s for '%s' in repo %s", session.id, filename, repo_id)
+    return _session_out(session, [])
+
+@router.put("/{upload_id}", response_model=UploadSessionOut, summary="Upload a chunk")
+@throttled(UPLOAD)
+def upload_chunk(
+    repo_id: int,
+    upload_id: str,
+    offset: int = Query(..., ge=0),
+    chunk: bytes = Body(..., media_type="application/octet-stream"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Write raw bytes at `offset`. Chunks may arrive in any order and be retried with the same bytes."""
+    _load_repo(db, repo_id, user)
+    session = _load_session(db, repo_id, upload_id, user)
+    if not chunk:
+        raise HTTPException(status_code=400, detail="Empty chunk")
+    if len(chunk) > MAX_UPLOAD_CHUNK_SIZE:
+        raise HTTPException(status_code=413, detail=f"Chunk exceeds {MAX_UPLOAD_CHUNK_SIZE} bytes")
+    if offset + len(chunk) > session.size:
+        raise HTTPException(status_code=400, detail="Chunk extends past the declared file size")
+
+    path = _session_path(upload_id)
+    state = _hash_state(upload_id)
+    state.write(path, offset, chunk)
+
+    db.add(UploadChunk(session_id=upload_id, offset=offset, size=len(chunk)))
+    session.updated_at = datetime.now(timezone.utc)
+    db.commit()
+
+    ranges = _merged_ranges(db, upload_id)
+    state.advance(path, _contiguous_end(ranges), chunk, offset)
+    return _session_out(session, ranges)
+
+@router.get("/{upload_id}", response_model=UploadSessionOut, summary="Get upload status")
+def get_upload_session(
+    repo_id: int,
+    upload_id: str,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Report which byte ranges have been received so a client can resume."""
+    _load_repo(db, repo_id, user)
+    session = _load_session(db, repo_id, upload_id, user)
+    return _session_out(session, _merged_ranges(db, upload_id))
+
+@router.post("/{upload_id}/complete", status_code=status.HTTP_201_CREATED, summary="Complete a resumable upload")
+def complete_upload_session(
+    repo_id: int,
+    upload_id: str,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Verify the assembled file and turn it into a new file version."""
+    _load_repo(db, repo_id, user)
+    session = _load_session(db, repo_id, upload_id, user)
+    ranges = _merged_ranges(db, upload_id)
+    if ranges != [[0, session.size]]:
+        raise HTTPException(status_code=400, detail="Upload incomplete")
+
+    path = _session_path(upload_id)
+    state = _hash_state(upload_id)
+    state.advance(path, session.size)
+    sha256 = state.sha.hexdigest()
+    record_hash(state.seconds, session.size)
+    with open(path, "rb+") as fp:
+        os.fsync(fp.fileno())
+
+    filename, size = session.filename, session.size
+    if session.sha256 and session.sha256 != sha256:
+        _discard_session(db, session)
+        db.commit()
+        raise HTTPException(status_code=422, detail="Uploaded content does not match the declared sha256")
+
+    try:
+        repo_file, last_version, final_version = plan_version(db, repo_id, filename, session.version_number)
+        _, dedup_hit = record_version(
+            db, repo_id, filename, repo_file, last_version, final_version,
+            path, sha256, size, session.version_description,
+        )
+        _discard_session(db, session)
+        db.commit()
+    except HTTPException:
+        # The content is final, so a version conflict cannot be fixed by resuming
+        db.rollback()
+        _discard_session(db, db.get(UploadSession, upload_id))
+        db.commit()
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error("Failed to complete upload %s of '%s' to repo %s: %s", upload_id, filename, repo_id, e)
+        raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+
+    return {
+        "message": "File uploaded (versioned)",
+        "filename": filename,
+        "version": final_version,
+        "sha256": sha256,
+        "size": size,
+        "deduplicated": dedup_hit,
+    }
+
+@router.delete("/{upload_id}", summary="Abort a resumable upload")
+def abort_upload_session(
+    repo_id: int,
+    upload_id: str,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Discard an upload session and its partial content."""
+    _load_repo(db, repo_id, user)
+    session = _load_session(db, repo_id, upload_id, user)
+    _discard_session(db, session)
+    db.commit()
+    return {"message": f"Upload {upload_id} aborted"}
@@ -0,0 +1,352 @@
+from fastapi import HTTPException, Response, UploadFile
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, List, Optional, Tuple
+import base64
+import json
+from .changes import record_change
+from .delta import schedule_compaction
+from .models import Repository, Collaborator, RepoFile, RepoFileVersion, RoleEnum
+from .search import schedule_indexing
+from .storage import UploadTooLarge, add_blob_ref, ingest_async, ingest_stream, link_blob_ref
+from auth.cache import MISSING, role_cache
+from auth.models import User
+from config import MAX_UPLOAD_SIZE, REPO_QUOTA_BYTES, USER_QUOTA_BYTES
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def get_repo_role(db: Session, repo_id: int, user_id: int) -> Optional[RoleEnum]:
+    """Collaborator role of a user in a repository (None if not a collaborator), cached."""
+    role = role_cache.get((repo_id, user_id))
+    if role is MISSING:
+        role = (
+            db.query(Collaborator.role)
+            .filter(Collaborator.repo_id == repo_id, Collaborator.user_id == user_id)
+            .scalar()
+        )
+        role_cache.set((repo_id, user_id), role)
+    return role
+
+def _require_role(db: Session, repo_id: int, user: User, roles: set, detail: str) -> RoleEnum:
+    role = get_repo_role(db, repo_id, user.id)
+    if role is None and db.get(Repository, repo_id) is None:
+        raise HTTPException(status_code=404, detail="Repository not found")
+    if role not in roles:
+        raise HTTPException(status_code=403, detail=detail)
+    return role
+
+def assert_read_perm(db: Session, repo_id: int, user: User) -> RoleEnum:
+    """Check the repository exists and user is a collaborator."""
+    return _require_role(db, repo_id, user, {RoleEnum.read, RoleEnum.write, RoleEnum.admin}, "Permission denied")
+
+def assert_write_perm(db: Session, repo_id: int, user: User) -> RoleEnum:
+    """Check the repository exists and user has write/admin permission."""
+    return _require_role(db, repo_id, user, {RoleEnum.write, RoleEnum.admin}, "Write permission required")
+
+def assert_admin_perm(db: Session, repo_id: int, user: User) -> RoleEnum:
+    """Check the repository exists and user has admin permission."""
+    return _require_role(db, repo_id, user, {RoleEnum.admin}, "Admin permission required")
+
+def max_upload_size(repo: Repository) -> int:
+    """Per-repository upload size limit, falling back to the global default."""
+    return repo.max_file_size if repo.max_file_size is not None else MAX_UPLOAD_SIZE
+
+def repo_quota(repo: Repository) -> Optional[int]:
+    """Effective storage quota of a repository in bytes, or None if unlimited."""
+    quotas = [quota for quota in (repo.quota_bytes, REPO_QUOTA_BYTES or None) if quota is not None]
+    return min(quotas) if quotas else None
+
+@dataclass
+class UploadLimit:
+    """How many bytes one upload may stream before it is cut off, and the error to raise then."""
+    max_size: int
+    status_code: int
+    detail: str
+
+    def error(self) -> HTTPException:
+        return HTTPException(status_code=self.status_code, detail=self.detail)
+
+def upload_limit(db: Session, repo: Repository) -> UploadLimit:
+    """The file size limit, lowered to the quota left on the repository and its owner.
+
+    Usage can still change while the body streams; `record_version` checks the
+    quotas again atomically.
+    """
+    max_size = max_upload_size(repo)
+    limit = UploadLimit(max_size, 413, f"File exceeds the repository limit of {max_size} bytes")
+    owner_used = db.query(User.used_bytes).filter(User.id == repo.owner_id).scalar()
+    for quota, used, scope in (
+        (repo_quota(repo), repo.used_bytes, "Repository"),
+        (USER_QUOTA_BYTES or None, owner_used, "Owner"),
+    ):
+        if quota is not None and quota - (used or 0) < limit.max_size:
+            limit = UploadLimit(max(quota - (used or 0), 0), 507, f"{scope} storage quota of {quota} bytes exceeded")
+    return limit
+
+def _non_empty(ingested: Tuple[Path, str, int]) -> Tuple[Path, str, int]:
+    tmp_path, _, size = ingested
+    if size == 0:
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="Empty file not allowed")
+    return ingested
+
+def ingest_limited(src: BinaryIO, limit: UploadLimit) -> Tuple[Path, str, int]:
+    """`ingest_stream` within an upload limit: raises the limit's error, or 400 for an empty file."""
+    try:
+        return _non_empty(ingest_stream(src, max_size=limit.max_size))
+    except UploadTooLarge:
+        raise limit.error()
+
+async def ingest_upload(upload: UploadFile, limit: UploadLimit) -> Tuple[Path, str, int]:
+    """Async counterpart of `ingest_limited` for an uploaded file, also checking its declared size."""
+    if upload.size is not None and upload.size > limit.max_size:
+        raise limit.error()
+    try:
+        return _non_empty(await ingest_async(upload.read, max_size=limit.max_size))
+    except UploadTooLarge:
+        raise limit.error()
+
+def change_usage(db: Session, repo: Repository, size: int, versions: int):
+    """Add to the usage counters of a repository and its owner without committing.
+
+    Growth is applied with conditional UPDATEs, so concurrent uploads cannot
+    overshoot a quota together; raises 507 if it would.
+    """
+    repo_update = update(Repository).where(Repository.id == repo.id).values(
+        used_bytes=Repository.used_bytes + size, version_count=Repository.version_count + versions
+    )
+    owner_update = update(User).where(User.id == repo.owner_id).values(used_bytes=User.used_bytes + size)
+    quota = repo_quota(repo)
+    if size > 0 and quota is not None:
+        repo_update = repo_update.where(Repository.used_bytes + size <= quota)
+    if size > 0 and USER_QUOTA_BYTES:
+        owner_update = owner_update.where(User.used_bytes + size <= USER_QUOTA_BYTES)
+    if db.execute(repo_update).rowcount == 0:
+        raise HTTPException(status_code=507, detail=f"Repository storage quota of {quota} bytes exceeded")
+    if db.execute(owner_update).rowcount == 0:
+        raise HTTPException(status_code=507, detail=f"Owner storage quota of {USER_QUOTA_BYTES} bytes exceeded")
+
+def plan_version(
+    db: Session,
+    repo_id: int,
+    filename: str,
+    version_number: Optional[int] = None,
+) -> Tuple[Optional[RepoFile], Optional[RepoFileVersion], int]:
+    """Look up the file and its latest version and pick the number for the next one.
+
+    Returns `(repo_file, last_version, final_version)`; either of the first two
+    may be None for a new file. Raises 400 for an invalid custom version number.
+    """
+    repo_file = db.query(RepoFile).filter(RepoFile.repo_id == repo_id, RepoFile.filename == filename).first()
+    last_version = None
+    if repo_file is not None and repo_file.latest_version_id is not None:
+        last_version = db.get(RepoFileVersion, repo_file.latest_version_id)
+
+    # Determine version number
+    default_version = 1 if last_version is None else last_version.version_number + 1
+    final_version = version_number if version_number is not None else default_version
+
+    # Validate user-specified version
+    if version_number is not None:
+        if version_number <= 0:
+            raise HTTPException(status_code=400, detail="Version number must be positive")
+        if last_version and version_number <= last_version.version_number:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Version number must be greater than the latest version ({last_version.version_number})"
+            )
+    return repo_file, last_version, final_version
+
+def record_version(
+    db: Session,
+    repo_id: int,
+    filename: str,
+    repo_file: Optional[RepoFile],
+    last_version: Optional[RepoFileVersion],
+    final_version: int,
+    tmp_path: Optional[Path],
+    sha256: str,
+    size: int,
+    version_description: Optional[str] = None,
+) -> Tuple[RepoFileVersion, bool]:
+    """Store ingested content and add its `RepoFileVersion` rows without committing.
+
+    `tmp_path` is consumed by the blob store; None links the version to
+    content that is already stored. Returns the new version and whether its
+    content was already stored (a dedup hit). Raises 409 when the content is
+    identical to the latest version, no longer stored, or when a concurrent
+    upload took the version number first, and 507 when it would exceed a
+    quota; the caller must then roll back. Compaction and search indexing of
+    the new version are queued as jobs in the same transaction.
+    """
+    if last_version and last_version.sha256 == sha256:
+        raise HTTPException(status_code=409, detail="Identical file already uploaded as latest version")
+
+    now = datetime.now(timezone.utc)
+    if repo_file is None:
+        repo_file = RepoFile(repo_id=repo_id, filename=filename, sha256=sha256, uploaded_at=now)
+        db.add(repo_file)
+        db.flush()
+
+    version = RepoFileVersion(
+        file_id=repo_file.id,
+        version_number=final_version,
+        sha256=sha256,
+        size=size,
+        uploaded_at=now,
+        version_description=version_description[:255] if version_description else None
+    )
+    db.add(version)
+    try:
+        # Before the blob store takes the content, so a lost race leaves nothing behind
+        db.flush()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"Version {final_version} was created concurrently, retry")
+    change_usage(db, db.get(Repository, repo_id), size, 1)
+
+    if tmp_path is None:
+        if not link_blob_ref(db, sha256):
+            raise HTTPException(status_code=409, detail="Content is no longer stored, upload it instead")
+        dedup_hit = True
+    else:
+        dedup_hit = add_blob_ref(db, tmp_path, sha256, size)
+
+    repo_file.sha256 = sha256
+    repo_file.uploaded_at = now
+    repo_file.latest_version_id = version.id
+    repo_file.latest_version_number = final_version
+    # Evaluated by the database, so concurrent writers cannot lose an update
+    repo_file.version_count = RepoFile.version_count + 1
+    repo_file.total_size = RepoFile.total_size + size
+    db.flush()
+    record_change(db, repo_id, "version_added", filename, final_version)
+    schedule_compaction(db, repo_id, repo_file.id)
+    schedule_indexing(db, repo_id, repo_file.id)
+    return version, dedup_hit
+
+def remove_version(db: Session, repo_file: RepoFile, version: RepoFileVersion) -> bool:
+    """Delete a version row and update the denormalized counters without committing.
+
+    The file row is deleted with its last version. Returns True if it was;
+    otherwise compaction of the remaining versions is queued.
+    """
+    db.delete(version)
+    change_usage(db, repo_file.repo, -version.size, -1)
+    repo_file.version_count = RepoFile.version_count - 1
+    repo_file.total_size = RepoFile.total_size - version.size
+    db.flush()
+    if repo_file.version_count <= 0:
+        record_change(db, repo_file.repo_id, "file_deleted", repo_file.filename, version.version_number)
+        db.delete(repo_file)
+        return True
+    record_change(db, repo_file.repo_id, "version_deleted", repo_file.filename, version.version_number)
+    schedule_compaction(db, repo_file.repo_id, repo_file.id)
+    if repo_file.latest_version_id == version.id:
+        latest = (
+            db.query(RepoFileVersion)
+            .filter(RepoFileVersion.file_id == repo_file.id)
+            .order_by(RepoFileVersion.version_number.desc())
+            .first()
+        )
+        repo_file.latest_version_id = latest.id
+        repo_file.latest_version_number = latest.version_number
+        repo_file.sha256 = latest.sha256
+        repo_file.uploaded_at = latest.uploaded_at
+    return False
+
+def readable_content_size(db: Session, user_id: int, sha256: str) -> Optional[int]:
+    """Size of the content with this SHA256 if a version the user can read has it, else None.
+
+    Knowing a digest must not be enough to copy content out of a repository
+    the user has no access to.
+    """
+    return (
+        db.query(RepoFileVersion.size)
+        .join(RepoFile, RepoFile.id == RepoFileVersion.file_id)
+        .join(Collaborator, Collaborator.repo_id == RepoFile.repo_id)
+        .filter(RepoFileVersion.sha256 == sha256, Collaborator.user_id == user_id)
+        .limit(1)
+        .scalar()
+    )
+
+def backfill_file_stats(db: Session) -> int:
+    """Compute the denormalized version columns of files that predate them. Returns the files updated."""
+    version = aliased(RepoFileVersion)
+    of_file = version.file_id == RepoFile.id
+    result = db.execute(
+        update(RepoFile)
+        .where(RepoFile.latest_version_id.is_(None))
+        .values(
+            latest_version_id=select(version.id).where(of_file)
+            .order_by(version.version_number.desc()).limit(1).scalar_subquery(),
+            latest_version_number=select(func.max(version.version_number)).where(of_file).scalar_subquery(),
+            version_count=select(func.count(version.id)).where(of_file).scalar_subquery(),
+            total_size=select(func.coalesce(func.sum(version.size), 0)).where(of_file).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+def backfill_usage(db: Session) -> int:
+    """Compute the usage counters of repositories and users that predate them. Returns the rows updated."""
+    of_repo = RepoFile.repo_id == Repository.id
+    repos = db.execute(
+        update(Repository)
+        .where(Repository.used_bytes.is_(None))
+        .values(
+            used_bytes=select(func.coalesce(func.sum(RepoFile.total_size), 0)).where(of_repo).scalar_subquery(),
+            version_count=select(func.coalesce(func.sum(RepoFile.version_count), 0)).where(of_repo).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    owned = aliased(Repository)
+    users = db.execute(
+        update(User)
+        .where(User.used_bytes.is_(None))
+        .values(used_bytes=select(func.coalesce(func.sum(owned.used_bytes), 0))
+                .where(owned.owner_id == User.id).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return repos.rowcount + users.rowcount
+
+def encode_cursor(*key: Any) -> str:
+    """Opaque keyset-pagination token for the sort key of the last row returned."""
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str, *types: type) -> List[Any]:
+    """Decode a token from `encode_cursor` whose key has one element of each of `types`.
+
+    Raises 400 if it is malformed, so a crafted key never reaches a query.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, list) or len(key) != len(types) or not all(
+        # JSON booleans would otherwise pass as ints
+        isinstance(value, expected) and not isinstance(value, bool) for value, expected in zip(key, types)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def paginate(rows: list, limit: Optional[int], response: Response, key) -> list:
+    """Trim a `limit + 1` row result to `limit` and set the next-cursor header if more remain."""
+    if limit is None or len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
+
+def as_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Normalise a query datetime to the naive UTC values stored by the models."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
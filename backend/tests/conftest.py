@@ -0,0 +1,55 @@
+import os
+import re
+import sys
+import tempfile
+import pytest
+
+# Configuration is read at import time, so the app gets an isolated database and store
+_tmp = tempfile.mkdtemp(prefix="ticslab-tests-")
+os.environ.update(
+    JWT_SECRET_KEY="test-secret",
+    DATABASE_URL=f"sqlite:///{_tmp}/test.db",
+    STORAGE_ROOT=os.path.join(_tmp, "storage"),
+    BCRYPT_ROUNDS="4",
+    JOB_WORKERS="0",
+    SCRUB_ENABLED="false",
+    RATE_LIMIT_ENABLED="false",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture
+def register(client):
+    """Register a user and return their bearer auth headers."""
+    def register(email: str) -> dict:
+        client.post("/auth/register", json={"email": email, "password": "password1", "full_name": "Test User"})
+        response = client.post("/auth/login", json={"email": email, "password": "password1"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
+
+@pytest.fixture
+def test_slug(request) -> str:
+    """The test's name, usable in emails and repository names, which must be unique."""
+    return re.sub(r"[^a-z0-9]+", "-", request.node.name.lower()).strip("-")
+
+@pytest.fixture
+def owner(register, test_slug) -> dict:
+    """Auth headers of a new user named after the test."""
+    return register(f"{test_slug}@example.com")
+
+@pytest.fixture
+def repo_id(client, owner, test_slug) -> int:
+    """A new repository of `owner`."""
+    response = client.post("/api/repos/create-repo", json={"name": test_slug}, headers=owner)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
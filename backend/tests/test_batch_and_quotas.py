@@ -0,0 +1,78 @@
+"""Per-file outcomes of batch uploads, and 507 responses once a storage quota is used up."""
+import io
+import zipfile
+import pytest
+from repos import utils
+
+
+def _set_quota(client, owner, repo_id: int, quota_bytes: int):
+    response = client.patch(f"/api/repos/{repo_id}", json={"quota_bytes": quota_bytes}, headers=owner)
+    assert response.status_code == 200, response.text
+
+def _upload(client, owner, repo_id: int, filename: str, content: bytes):
+    return client.post(f"/api/repos/{repo_id}/files/upload", files={"upload": (filename, content)}, headers=owner)
+
+def _outcomes(response):
+    assert response.status_code == 200, response.text
+    return [(f["filename"], f["status"]) for f in response.json()["files"]]
+
+def test_batch_rejects_files_individually(client, owner, repo_id):
+    _set_quota(client, owner, repo_id, 250)
+    files = [("files", (f"b{i}.txt", bytes([65 + i]) * 100)) for i in range(3)]
+    files += [("files", ("empty.txt", b"")), ("files", ("b0.txt", b"A" * 100))]
+
+    response = client.post(f"/api/repos/{repo_id}/files/batch", files=files, headers=owner)
+    assert _outcomes(response) == [
+        ("b0.txt", "created"), ("b1.txt", "created"), ("b2.txt", "rejected"), ("empty.txt", "rejected"),
+        ("b0.txt", "skipped"),
+    ]
+    assert "quota" in response.json()["files"][2]["detail"]
+    listed = client.get(f"/api/repos/{repo_id}/files/", headers=owner).json()
+    assert sorted(f["filename"] for f in listed) == ["b0.txt", "b1.txt"]
+    assert client.get(f"/api/repos/{repo_id}/usage", headers=owner).json()["used_bytes"] == 200
+
+def test_archive_rejects_entries_individually(client, owner, repo_id):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("one.txt", b"zip one")
+        zf.writestr("empty.txt", b"")
+
+    response = client.post(f"/api/repos/{repo_id}/files/batch", files={"archive": ("a.zip", archive.getvalue())},
+                           headers=owner)
+    assert _outcomes(response) == [("one.txt", "created"), ("empty.txt", "rejected")]
+
+def test_repository_quota(client, owner, repo_id):
+    _set_quota(client, owner, repo_id, 10)
+    assert _upload(client, owner, repo_id, "a.txt", b"123456").status_code == 201
+
+    response = _upload(client, owner, repo_id, "b.txt", b"123456")
+    assert response.status_code == 507
+    assert client.get(f"/api/repos/{repo_id}/usage", headers=owner).json()["used_bytes"] == 6
+    response = client.post(f"/api/repos/{repo_id}/files/uploads", json={"filename": "c.bin", "size": 6},
+                           headers=owner)
+    assert response.status_code == 507
+
+def test_quota_used_while_a_session_was_open(client, owner, repo_id):
+    _set_quota(client, owner, repo_id, 10)
+    response = client.post(f"/api/repos/{repo_id}/files/uploads", json={"filename": "c.bin", "size": 6},
+                           headers=owner)
+    upload_id = response.json()["upload_id"]
+    client.put(f"/api/repos/{repo_id}/files/uploads/{upload_id}?offset=0", content=b"123456",
+               headers={**owner, "Content-Type": "application/octet-stream"})
+    assert _upload(client, owner, repo_id, "a.txt", b"123456").status_code == 201
+
+    response = client.post(f"/api/repos/{repo_id}/files/uploads/{upload_id}/complete", headers=owner)
+    assert response.status_code == 507
+    assert client.get(f"/api/repos/{repo_id}/usage", headers=owner).json()["used_bytes"] == 6
+
+@pytest.fixture
+def user_quota(monkeypatch):
+    monkeypatch.setattr(utils, "USER_QUOTA_BYTES", 10)
+
+def test_owner_quota_spans_repositories(client, owner, repo_id, user_quota):
+    other = client.post("/api/repos/create-repo", json={"name": f"second-{repo_id}"}, headers=owner).json()["id"]
+    assert _upload(client, owner, repo_id, "a.txt", b"123456").status_code == 201
+
+    response = _upload(client, owner, other, "a.txt", b"123456")
+    assert response.status_code == 507
+    assert response.json()["detail"].startswith("Owner storage quota")
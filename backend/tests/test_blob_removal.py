@@ -0,0 +1,66 @@
+"""A blob removal job racing an upload that stores the same content again."""
+import hashlib
+import threading
+import time
+from database import SessionLocal
+from repos import storage
+from repos.jobs import run_pending_jobs
+from repos.models import Blob
+from repos.storage import add_blob_ref, blob_stored, new_temp_path, remove_blob_file
+
+
+def _temp_file(data: bytes):
+    path = new_temp_path()
+    path.write_bytes(data)
+    return path
+
+def _remove_in_thread(sha256: str) -> threading.Thread:
+    def remove():
+        with SessionLocal() as db:
+            remove_blob_file(db, sha256)
+    thread = threading.Thread(target=remove)
+    thread.start()
+    return thread
+
+def test_deleting_the_last_version_removes_the_blob(client, owner, repo_id):
+    for content in (b"gone", b"kept"):
+        client.post(f"/api/repos/{repo_id}/files/upload", files={"upload": ("g.txt", content)}, headers=owner)
+
+    assert client.delete(f"/api/repos/{repo_id}/files/g.txt/version/1", headers=owner).status_code == 200
+    with SessionLocal() as db:
+        run_pending_jobs(db)
+    assert not blob_stored(hashlib.sha256(b"gone").hexdigest())
+    assert blob_stored(hashlib.sha256(b"kept").hexdigest())
+
+def test_removal_during_an_uncommitted_upload_keeps_the_content(client):
+    data = b"stored again while removing"
+    sha256 = hashlib.sha256(data).hexdigest()
+    with SessionLocal() as upload:
+        add_blob_ref(upload, _temp_file(data), sha256, len(data))
+        thread = _remove_in_thread(sha256)
+        time.sleep(0.3)  # The removal now waits on the upload's row
+        upload.commit()
+    thread.join()
+
+    assert blob_stored(sha256)
+
+def test_upload_during_removal_stores_the_content_again(client, monkeypatch):
+    data = b"uploaded while deleting"
+    sha256 = hashlib.sha256(data).hexdigest()
+    delete = storage.backend.delete
+
+    def slow_delete(key):
+        time.sleep(0.3)
+        return delete(key)
+
+    monkeypatch.setattr(storage.backend, "delete", slow_delete)
+    thread = _remove_in_thread(sha256)
+    time.sleep(0.1)  # The removal holds its placeholder row while deleting
+    with SessionLocal() as upload:
+        add_blob_ref(upload, _temp_file(data), sha256, len(data))
+        upload.commit()
+    thread.join()
+
+    assert blob_stored(sha256)
+    with SessionLocal() as db:
+        assert db.get(Blob, sha256).ref_count == 1
@@ -0,0 +1,34 @@
+"""Malformed pagination cursors are client errors, not server errors."""
+import base64
+import json
+import pytest
+
+
+def _cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+@pytest.fixture
+def files(client, owner, repo_id):
+    for n in range(3):
+        response = client.post(
+            f"/api/repos/{repo_id}/files/upload", files={"upload": (f"f{n}.txt", f"x{n}".encode())}, headers=owner
+        )
+        assert response.status_code == 201, response.text
+
+@pytest.mark.parametrize("cursor", ["%%%", _cursor("text"), _cursor([{}, "x"]), _cursor(["a", "x"]),
+                                    _cursor(["a", True]), _cursor([1, 2])])
+def test_bad_file_cursor(client, owner, repo_id, files, cursor):
+    assert client.get(f"/api/repos/{repo_id}/files/?cursor={cursor}", headers=owner).status_code == 400
+
+@pytest.mark.parametrize("cursor", [_cursor([{}]), _cursor(["1"]), _cursor([1.5]), _cursor([True])])
+def test_bad_version_and_repo_cursors(client, owner, repo_id, files, cursor):
+    assert client.get(f"/api/repos/{repo_id}/files/versions/f0.txt?cursor={cursor}", headers=owner).status_code == 400
+    assert client.get(f"/api/repos/?cursor={cursor}", headers=owner).status_code == 400
+
+def test_next_cursor_pages_through_files(client, owner, repo_id, files):
+    first = client.get(f"/api/repos/{repo_id}/files/?limit=2", headers=owner)
+    second = client.get(f"/api/repos/{repo_id}/files/?limit=2&cursor={first.headers['x-next-cursor']}", headers=owner)
+
+    names = [f["filename"] for f in first.json() + second.json()]
+    assert sorted(names) == ["f0.txt", "f1.txt", "f2.txt"]
+    assert "x-next-cursor" not in second.headers
@@ -0,0 +1,59 @@
+"""Per-account login failure limits, run against an in-process bucket store with a fake clock."""
+import pytest
+from fastapi.testclient import TestClient
+import main
+import ratelimit
+from auth import routes
+from ratelimit import MemoryStore, RateLimiter, parse_limit
+
+PASSWORD = "password1"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+@pytest.fixture
+def account(request, client, register, monkeypatch, clock):
+    monkeypatch.setattr(routes, "limiter", RateLimiter(MemoryStore(), enabled=True))
+    monkeypatch.setattr(routes, "_login_limit", None)
+    monkeypatch.setattr(routes, "_login_failure_limit", parse_limit("3/hour"))
+    email = f"{request.node.name.replace('_', '-')}@example.com"
+    register(email)
+    return email
+
+def _login(client, email: str, password: str):
+    return client.post("/auth/login", json={"email": email, "password": password})
+
+def test_failures_get_429_with_retry_after(client, account):
+    for _ in range(3):
+        assert _login(client, account, "wrong").status_code == 400
+
+    response = _login(client, account, PASSWORD)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) == 1200  # One token of 3/hour
+
+def test_successful_logins_are_refunded(client, account):
+    for _ in range(5):
+        assert _login(client, account, PASSWORD).status_code == 200
+    for _ in range(3):
+        assert _login(client, account, "wrong").status_code == 400
+    assert _login(client, account, PASSWORD).status_code == 429
+
+def test_bucket_refills(client, account, clock):
+    for _ in range(3):
+        _login(client, account, "wrong")
+    assert _login(client, account, "wrong").status_code == 429
+
+    clock[0] += 1200
+    assert _login(client, account, PASSWORD).status_code == 200
+
+def test_failures_from_another_address_do_not_lock_the_owner_out(client, account):
+    attacker = TestClient(main.app, client=("203.0.113.9", 50000))
+    for _ in range(3):
+        assert _login(attacker, account, "wrong").status_code == 400
+    assert _login(attacker, account, PASSWORD).status_code == 429
+
+    assert _login(client, account, PASSWORD).status_code == 200
@@ -0,0 +1,76 @@
+"""Listings must load with a constant number of queries, however many rows they return."""
+from contextlib import contextmanager
+from sqlalchemy import event
+from database import engine
+
+
+@contextmanager
+def count_queries():
+    counter = {"statements": 0}
+
+    def count(*args):
+        counter["statements"] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+def _create_repo(client, headers, name: str) -> int:
+    response = client.post("/api/repos/create-repo", json={"name": name}, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+def _add_files(client, headers, repo_id: int, count: int, start: int = 0):
+    for n in range(start, start + count):
+        response = client.post(
+            f"/api/repos/{repo_id}/files/upload", files={"upload": (f"file{n}.txt", f"content {n}".encode())},
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+
+def _add_collaborators(client, register, headers, repo_id: int, emails):
+    for email in emails:
+        register(email)
+        response = client.post(
+            f"/api/repos/{repo_id}/collaborators", json={"user_email": email, "role": "read"}, headers=headers
+        )
+        assert response.status_code == 200, response.text
+
+def _queries(client, url: str, headers) -> int:
+    client.get(url, headers=headers)  # Warm the per-process auth caches
+    with count_queries() as counter:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    return counter["statements"]
+
+def test_list_files_query_count_is_constant(client, register):
+    headers = register("files-owner@example.com")
+    repo_id = _create_repo(client, headers, "files-query-count")
+    url = f"/api/repos/{repo_id}/files/"
+
+    _add_files(client, headers, repo_id, 2)
+    few = _queries(client, url, headers)
+    _add_files(client, headers, repo_id, 20, start=2)
+    many = _queries(client, url, headers)
+
+    assert len(client.get(url, headers=headers).json()) == 22
+    assert many == few
+
+def test_list_repositories_query_count_is_constant(client, register):
+    headers = register("repos-owner@example.com")
+    url = "/api/repos/"
+
+    repo_id = _create_repo(client, headers, "repos-query-count-0")
+    _add_collaborators(client, register, headers, repo_id, ["reader-0@example.com"])
+    few = _queries(client, url, headers)
+    for n in range(1, 6):
+        repo_id = _create_repo(client, headers, f"repos-query-count-{n}")
+        _add_collaborators(client, register, headers, repo_id, [f"reader-{n}-{m}@example.com" for m in range(4)])
+    many = _queries(client, url, headers)
+
+    repos = client.get(url, headers=headers).json()
+    assert len(repos) == 6
+    assert sum(len(repo["collaborators"]) for repo in repos) == 2 + 5 * 5  # The owner is a collaborator too
+    assert many == few
@@ -0,0 +1,63 @@
+"""Chunked upload sessions: retried chunks, conflicting chunks and completion."""
+import hashlib
+
+
+def _start(client, owner, repo_id: int, size: int, **fields) -> str:
+    response = client.post(
+        f"/api/repos/{repo_id}/files/uploads", json={"filename": "data.bin", "size": size, **fields}, headers=owner
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["upload_id"]
+
+def _put(client, owner, repo_id: int, upload_id: str, offset: int, chunk: bytes):
+    return client.put(
+        f"/api/repos/{repo_id}/files/uploads/{upload_id}?offset={offset}", content=chunk,
+        headers={**owner, "Content-Type": "application/octet-stream"},
+    )
+
+def _complete(client, owner, repo_id: int, upload_id: str):
+    return client.post(f"/api/repos/{repo_id}/files/uploads/{upload_id}/complete", headers=owner)
+
+def test_chunks_out_of_order_complete_to_a_version(client, owner, repo_id):
+    upload_id = _start(client, owner, repo_id, 8)
+    assert _put(client, owner, repo_id, upload_id, 4, b"CCCC").status_code == 200
+    response = _put(client, owner, repo_id, upload_id, 0, b"AAAA")
+    assert response.json()["ranges"] == [[0, 8]]
+
+    response = _complete(client, owner, repo_id, upload_id)
+    assert response.status_code == 201, response.text
+    assert response.json()["sha256"] == hashlib.sha256(b"AAAACCCC").hexdigest()
+    assert client.get(f"/api/repos/{repo_id}/files/data.bin/version/1", headers=owner).content == b"AAAACCCC"
+
+def test_retried_chunk_is_accepted(client, owner, repo_id):
+    upload_id = _start(client, owner, repo_id, 8)
+    for _ in range(2):
+        assert _put(client, owner, repo_id, upload_id, 0, b"AAAA").status_code == 200
+    assert _put(client, owner, repo_id, upload_id, 2, b"AACC").status_code == 200  # Overlaps the same bytes
+    assert _put(client, owner, repo_id, upload_id, 4, b"CCCC").status_code == 200
+    assert _complete(client, owner, repo_id, upload_id).status_code == 201
+
+def test_conflicting_chunk_is_rejected(client, owner, repo_id):
+    upload_id = _start(client, owner, repo_id, 8)
+    _put(client, owner, repo_id, upload_id, 0, b"AAAA")
+
+    response = _put(client, owner, repo_id, upload_id, 0, b"BBBB")
+    assert response.status_code == 409
+    _put(client, owner, repo_id, upload_id, 4, b"CCCC")
+    assert _complete(client, owner, repo_id, upload_id).json()["sha256"] == hashlib.sha256(b"AAAACCCC").hexdigest()
+
+def test_incomplete_upload_cannot_complete(client, owner, repo_id):
+    upload_id = _start(client, owner, repo_id, 8)
+    _put(client, owner, repo_id, upload_id, 0, b"AAAA")
+    assert _complete(client, owner, repo_id, upload_id).status_code == 400
+
+def test_declared_sha256(client, owner, repo_id):
+    response = client.post(
+        f"/api/repos/{repo_id}/files/uploads", json={"filename": "data.bin", "size": 4, "sha256": "not-hex"},
+        headers=owner,
+    )
+    assert response.status_code == 422
+
+    upload_id = _start(client, owner, repo_id, 4, sha256=hashlib.sha256(b"good").hexdigest())
+    _put(client, owner, repo_id, upload_id, 0, b"evil")
+    assert _complete(client, owner, repo_id, upload_id).status_code == 422
@@ -0,0 +1,131 @@
+"""S3Backend against an in-memory stub client and, when installed, moto."""
+import io
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlencode, urlparse
+import pytest
+from repos import backends
+from repos.backends import ClientError, S3Backend
+
+BUCKET = "blobs"
+
+
+class StubS3Client:
+    """The subset of the boto3 S3 client that S3Backend uses, kept in a dict."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def _missing(self, key: str, operation: str):
+        return ClientError({"Error": {"Code": "404", "Message": f"{key} not found"}}, operation)
+
+    def upload_file(self, filename, bucket, key, Config=None):
+        with open(filename, "rb") as fp:
+            self.objects[(bucket, key)] = (fp.read(), datetime.now(timezone.utc))
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing(Key, "HeadObject")
+        return {"ContentLength": len(self.objects[(Bucket, Key)][0])}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing(Key, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+    def download_file(self, bucket, key, filename, Config=None):
+        if (bucket, key) not in self.objects:
+            raise self._missing(key, "HeadObject")
+        with open(filename, "wb") as fp:
+            fp.write(self.objects[(bucket, key)][0])
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                contents = [
+                    {"Key": key, "LastModified": modified}
+                    for (bucket, key), (_, modified) in sorted(client.objects.items())
+                    if bucket == Bucket and key.startswith(Prefix)
+                ]
+                yield {"Contents": contents}
+
+        return Paginator()
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        query = {"X-Amz-Expires": ExpiresIn, "response-content-type": Params["ResponseContentType"]}
+        return f"https://s3.example/{Params['Bucket']}/{Params['Key']}?{urlencode(query)}"
+
+
+@pytest.fixture(params=["stub", "moto"])
+def s3_client(request, monkeypatch):
+    if request.param == "stub":
+        yield StubS3Client()
+        return
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    for name, value in (("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+@pytest.fixture
+def backend(s3_client):
+    return S3Backend(BUCKET, prefix="prod/", client=s3_client)
+
+def _source(tmp_path, data: bytes):
+    src = tmp_path / "upload.part"
+    src.write_bytes(data)
+    return src
+
+def test_put_file_open_and_fetch(backend, tmp_path):
+    src = _source(tmp_path, b"blob content")
+    backend.put_file("objects/ab/cdef", src)
+
+    assert not src.exists()  # Consumed
+    assert backend.exists("objects/ab/cdef")
+    with backend.open_read("objects/ab/cdef") as body:
+        assert body.read() == b"blob content"
+    backend.fetch("objects/ab/cdef", tmp_path / "copy")
+    assert (tmp_path / "copy").read_bytes() == b"blob content"
+    assert [key for key, _ in backend.list("objects/")] == ["objects/ab/cdef"]
+
+def test_missing_objects(backend, tmp_path):
+    assert not backend.exists("objects/00/missing")
+    with pytest.raises(FileNotFoundError):
+        backend.open_read("objects/00/missing")
+    with pytest.raises(FileNotFoundError):
+        backend.fetch("objects/00/missing", tmp_path / "copy")
+
+def test_delete_reports_whether_the_object_existed(backend, tmp_path):
+    backend.put_file("objects/ab/cdef", _source(tmp_path, b"x"))
+
+    assert backend.delete("objects/ab/cdef") is True
+    assert not backend.exists("objects/ab/cdef")
+    assert backend.delete("objects/ab/cdef") is False
+
+def test_presigned_url(backend, tmp_path):
+    backend.put_file("objects/ab/cdef", _source(tmp_path, b"x"))
+
+    url = urlparse(backend.presigned_url("objects/ab/cdef", "report 1.pdf", "application/pdf"))
+    query = parse_qs(url.query)
+    assert url.path.endswith("/prod/objects/ab/cdef")
+    assert query["response-content-type"] == ["application/pdf"]
+    assert S3Backend(BUCKET, client=backend.client, presign=False).presigned_url("k", "f", "t") is None
+
+def test_injected_client_without_boto3(monkeypatch, tmp_path):
+    monkeypatch.setattr(backends, "boto3", None)
+    monkeypatch.setattr(backends, "TransferConfig", None)
+    backend = S3Backend(BUCKET, client=StubS3Client())
+
+    backend.put_file("objects/ab/cdef", _source(tmp_path, b"x"))
+    assert backend.exists("objects/ab/cdef")
+    with pytest.raises(RuntimeError):
+        S3Backend(BUCKET)